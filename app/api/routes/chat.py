@@ -1,15 +1,81 @@
+import asyncio
+import json
 from fastapi import APIRouter, status, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.core.config import Settings, get_settings
 from app.core.logger_config import get_logger
-from app.services.retriever import retrieve_relevant_chunks
+from app.services.retriever import retrieve_relevant_chunks, retrieve_relevant_chunks_batch
 from app.services.generator import GeneratorService
+from app.services import embeddings
+from app.services.answer_cache import get_answer_cache
+from app.services.embedding_cache import normalize_text
+from app.services.index_registry import get_active_index
+from app.services.single_flight import get_single_flight
 
 logger = get_logger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-from app.schemas.chat import ChatRequest, ChatResponse
+from app.schemas.chat import ChatRequest, ChatResponse, ChatBatchRequest, ChatBatchItem, ChatBatchResponse
+
+async def _check_answer_cache(*, tenant_id: str, question_embedding: list, settings: Settings):
+    # Returns (answer_cache, generation, cached_response). answer_cache and generation are
+    # None when the cache is disabled or its freshness cannot be checked.
+    if not settings.answer_cache_enabled:
+        return None, None, None
+    answer_cache = get_answer_cache(settings)
+    cache_generation = await answer_cache.current_generation(tenant_id)
+    if cache_generation is None:
+        return None, None, None
+    cached = answer_cache.lookup(
+        tenant_id = tenant_id,
+        embedding = question_embedding[0],
+        generation = cache_generation
+    )
+    return answer_cache, cache_generation, cached
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _answer_question(*, tenant_id: str, question: str, settings: Settings) -> dict:
+    # Full pipeline for /chat/ask, returns the ChatResponse payload
+    # Embedding and vector query must use the same index, even if a re-index switches over in between
+    index = get_active_index(settings)
+    question_embedding = await embeddings.embed_text(question, index=index)
+
+    # Serve repeated (semantically equivalent) questions straight from the answer cache
+    answer_cache, cache_generation, cached = await _check_answer_cache(
+        tenant_id = tenant_id,
+        question_embedding = question_embedding,
+        settings = settings
+    )
+    if cached is not None:
+        return cached
+
+    retrieved_chunks = await retrieve_relevant_chunks(
+        tenant_id = tenant_id,
+        question = question,
+        settings = settings,
+        question_embedding = question_embedding,
+        index = index
+    )
+    generator_service = GeneratorService(settings = settings)
+    answer_dict = await generator_service.generate_answer(
+        question = question,
+        retrieval_results = retrieved_chunks,
+    )
+    response = ChatResponse(
+        answer=answer_dict["answer"],
+        sources=answer_dict["sources"]
+    ).model_dump()
+    if answer_cache is not None:
+        answer_cache.store(
+            tenant_id = tenant_id,
+            embedding = question_embedding[0],
+            response = response,
+            generation = cache_generation
+        )
+    return response
 
 @router.post("/ask", response_model=ChatResponse)
 async def ask_question(
@@ -19,29 +85,198 @@ async def ask_question(
     tenant_id = request.tenant_id
     question = request.question
 
+    settings = get_settings()
+
     logger.info(f"Received question from user_id: {user_id} for tenant_id: {tenant_id} with question: {question}")
-    retrieved_chunks = await retrieve_relevant_chunks(
-        tenant_id = tenant_id,
-        question = question,
-        settings = get_settings()
-    )
-    generator_service = GeneratorService(settings = get_settings())
     try:
-        answer_dict = await generator_service.generate_answer(
-            question = question,
-            retrieval_results = retrieved_chunks,
+        if settings.single_flight_enabled:
+            # Identical questions of a tenant arriving while one is being answered share its pipeline
+            response = await get_single_flight().do(
+                (tenant_id, normalize_text(question)),
+                lambda: _answer_question(tenant_id = tenant_id, question = question, settings = settings)
+            )
+        else:
+            response = await _answer_question(tenant_id = tenant_id, question = question, settings = settings)
+        return ChatResponse(**response)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error generating answer: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred while processing your request. Detail: {e}"
         )
-        return ChatResponse(
-            answer=answer_dict["answer"],
-            sources=answer_dict["sources"]
+
+@router.post("/ask_batch", response_model=ChatBatchResponse)
+async def ask_questions_batch(
+        request: ChatBatchRequest
+):
+    """
+    Answers many questions of one tenant at once: one embedding request, one multi-vector
+    vector store query and one batched re-ranking pass, then answer generation with bounded
+    concurrency. Results are returned in question order, a failed question carries `error`.
+    """
+    tenant_id = request.tenant_id
+    questions = request.questions
+
+    settings = get_settings()
+
+    if not questions:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="questions must not be empty")
+    if len(questions) > settings.chat_batch_max_questions:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.chat_batch_max_questions} questions per batch"
         )
+    logger.info(f"Received batch of {len(questions)} questions from user_id: {request.user_id} for tenant_id: {tenant_id}")
+
+    # Identical questions in the batch are answered once
+    unique = {}
+    for question in questions:
+        unique.setdefault(normalize_text(question), question)
+    keys = list(unique.keys())
+    unique_questions = list(unique.values())
+
+    try:
+        index = get_active_index(settings)
+        question_embeddings = await embeddings.embed_text(unique_questions, index=index)
+
+        answers: dict[str, dict] = {}
+        answer_cache = get_answer_cache(settings) if settings.answer_cache_enabled else None
+        cache_generation = await answer_cache.current_generation(tenant_id) if answer_cache is not None else None
+        if cache_generation is not None:
+            for key, embedding in zip(keys, question_embeddings):
+                cached = answer_cache.lookup(tenant_id = tenant_id, embedding = embedding, generation = cache_generation)
+                if cached is not None:
+                    answers[key] = cached
+
+        missing = [i for i, key in enumerate(keys) if key not in answers]
+        retrieved = await retrieve_relevant_chunks_batch(
+            tenant_id = tenant_id,
+            questions = [unique_questions[i] for i in missing],
+            settings = settings,
+            question_embeddings = [question_embeddings[i] for i in missing],
+            index = index
+        )
+    except Exception as e:
+        logger.error(f"Error answering question batch: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred while processing your request. Detail: {e}"
+        )
+
+    generator_service = GeneratorService(settings = settings)
+    semaphore = asyncio.Semaphore(settings.chat_batch_max_concurrency)
+    errors: dict[str, str] = {}
+
+    async def _generate(i: int, retrieved_chunks: list[dict]):
+        async with semaphore:
+            try:
+                answer_dict = await generator_service.generate_answer(
+                    question = unique_questions[i],
+                    retrieval_results = retrieved_chunks,
+                )
+            except Exception as e:
+                logger.error(f"Error generating answer in batch: {e}")
+                errors[keys[i]] = str(e)
+                return
+        response = ChatResponse(answer=answer_dict["answer"], sources=answer_dict["sources"]).model_dump()
+        answers[keys[i]] = response
+        if cache_generation is not None:
+            answer_cache.store(
+                tenant_id = tenant_id,
+                embedding = question_embeddings[i],
+                response = response,
+                generation = cache_generation
+            )
+
+    await asyncio.gather(*(_generate(i, chunks) for i, chunks in zip(missing, retrieved)))
+
+    results = []
+    for question in questions:
+        key = normalize_text(question)
+        if key in answers:
+            results.append(ChatBatchItem(question = question, **answers[key]))
+        else:
+            results.append(ChatBatchItem(question = question, error = errors.get(key, "No answer generated")))
+    return ChatBatchResponse(results = results)
+
+@router.post("/ask/stream")
+async def ask_question_stream(
+        request: ChatRequest
+):
+    """
+    Server-Sent Events variant of /chat/ask.
+    Emits a `sources` event, then `token` events as the completion arrives, then `done`
+    (carrying the same payload as ChatResponse). Failures are reported as an `error` event.
+    """
+    user_id = request.user_id
+    tenant_id = request.tenant_id
+    question = request.question
+
+    settings = get_settings()
+
+    logger.info(f"Received streaming question from user_id: {user_id} for tenant_id: {tenant_id} with question: {question}")
+    # Retrieval happens before the response starts so retrieval errors still map to HTTP status codes
+    try:
+        # Embedding and vector query must use the same index, even if a re-index switches over in between
+        index = get_active_index(settings)
+        question_embedding = await embeddings.embed_text(question, index=index)
+        answer_cache, cache_generation, cached = await _check_answer_cache(
+            tenant_id = tenant_id,
+            question_embedding = question_embedding,
+            settings = settings
+        )
+
+        if cached is not None:
+            async def _cached_events():
+                yield _sse_event("sources", cached["sources"])
+                yield _sse_event("token", cached["answer"])
+                yield _sse_event("done", cached)
+            return StreamingResponse(_cached_events(), media_type="text/event-stream")
+
+        retrieved_chunks = await retrieve_relevant_chunks(
+            tenant_id = tenant_id,
+            question = question,
+            settings = settings,
+            question_embedding = question_embedding,
+            index = index
+        )
+        if not retrieved_chunks:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="An error occurred while processing your request. Detail: No relevant documents found for the given question."
+            )
     except HTTPException as e:
         raise e
     except Exception as e:
-        logger.error(f"Error generating answer: {e}")
+        logger.error(f"Error retrieving context for streamed answer: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred while processing your request. Detail: {e}"
         )
+    generator_service = GeneratorService(settings = settings)
 
-    
+    async def _events():
+        try:
+            async for event in generator_service.stream_answer(
+                question = question,
+                retrieval_results = retrieved_chunks,
+            ):
+                if event["event"] == "done" and answer_cache is not None:
+                    answer_cache.store(
+                        tenant_id = tenant_id,
+                        embedding = question_embedding[0],
+                        response = ChatResponse(**event["data"]).model_dump(),
+                        generation = cache_generation
+                    )
+                yield _sse_event(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield _sse_event("error", {"detail": f"An error occurred while processing your request. Detail: {e}"})
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,8 +1,22 @@
 from fastapi import APIRouter, status
+from app.core.config import get_settings
+from app.services import rate_limiter
+from app.services.embedding_cache import get_embedding_cache
+from app.services.reranker import get_rerank_stats
+from app.services.single_flight import get_single_flight
 
 router = APIRouter(prefix="/health", tags=["health"])
 
 @router.get("/", status_code=status.HTTP_200_OK)
 async def healthcheck():
     return {"status": "OK"}
-    
\ No newline at end of file
+
+@router.get("/stats", status_code=status.HTTP_200_OK)
+async def cache_stats():
+    settings = get_settings()
+    return {
+        "embedding_cache": get_embedding_cache(settings).get_stats(),
+        "reranker": get_rerank_stats(),
+        "single_flight": get_single_flight().get_stats(),
+        "openai_rate_limit": rate_limiter.get_stats()
+    }
@@ -1,20 +1,25 @@
 from fastapi import APIRouter, status, HTTPException, Query, UploadFile,File, Depends, status
 from fastapi.responses import JSONResponse
 from app.core.config import Settings, get_settings
-from app.services.s3_upload import S3UploadService, UploadObject
+from fastapi.concurrency import run_in_threadpool
 from app.services.s3_upload import S3UploadService, UploadObject
 
 router = APIRouter(prefix="/uploads", tags=["uploads"])
 
-from uuid import uuid4
+from typing import Optional
+from uuid import NAMESPACE_URL, uuid5
 
 from app.schemas.uploads import UploadResponse
 
+def stable_doc_id(tenant_id: str, filename: str) -> str:
+    return str(uuid5(NAMESPACE_URL, f"{tenant_id}/{filename}"))
+
 @router.post("/files", response_model=UploadResponse)
 async def upload_policy_document(
     tenant_id: str,
     user_id: str,
     file: UploadFile = File(...),
+    doc_id: Optional[str] = None,
     settings: Settings = Depends(get_settings)
 ) -> UploadResponse:
     
@@ -31,15 +36,24 @@ async def upload_policy_document(
 
     s3_upload_service = S3UploadService(settings)
     try:
-        upload_object: UploadObject = s3_upload_service.upload_file(tenant_id, file)
+        # boto3 is blocking, keep it off the event loop
+        upload_object: UploadObject = await run_in_threadpool(s3_upload_service.upload_file, tenant_id, file)
         url = upload_object.url
 
         s3_key = upload_object.key
-        doc_id = str(uuid4()) # Generate a unique document ID
+        # Stable document identity: re-uploading a file replaces the previous version
+        doc_id = doc_id or stable_doc_id(tenant_id, file.filename)
+
+        try:
+            await run_in_threadpool(status_store.set_document_status, tenant_id=tenant_id, doc_id=doc_id, status="queued")
+        except Exception as e:
+            # The file is already in S3, status tracking must not keep it from being ingested
+            logger.error(f"Failed to record status of document {doc_id}: {e}")
 
         # Offload to Celery
         from app.tasks.ingestion_tasks import process_document_task
-        task = process_document_task.delay(
+        task = await run_in_threadpool(
+            process_document_task.delay,
             tenant_id=tenant_id,
             user_id=user_id,
             doc_id=doc_id,
@@ -50,7 +64,7 @@ async def upload_policy_document(
         return UploadResponse(
             tenant_id=tenant_id,
             user_id=user_id,
-            doc_id=doc_id, # Casting UUID to string handled by Pydantic if needed, or vice versa
+            doc_id=doc_id,
             task_id=task.id,
             filename=file.filename,
             url=upload_object.url,
@@ -66,3 +80,180 @@ async def upload_policy_document(
 
 
 
+import asyncio
+import os
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, List
+from uuid import uuid4
+
+from app.schemas.uploads import BulkUploadFileStatus, BulkUploadResponse, DocumentStatusResponse
+from app.services import status_store
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+CONTENT_TYPES_BY_EXTENSION = {
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+    ".rtf": "application/rtf",
+}
+
+@dataclass(slots=True)
+class BulkFile:
+    # Same shape as UploadFile for S3UploadService.upload_file
+    filename: str
+    file: BinaryIO
+    content_type: str
+
+def _is_zip(file: UploadFile) -> bool:
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+def _expand_zip(file: UploadFile, *, max_files: int, max_uncompressed_bytes: int) -> List[BulkFile]:
+    try:
+        archive = zipfile.ZipFile(file.file)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid zip archive {file.filename}: {e}")
+
+    members = []
+    total_size = 0
+    for info in archive.infolist():
+        if info.is_dir() or info.filename.startswith("__MACOSX/") or os.path.basename(info.filename).startswith("."):
+            continue
+        content_type = CONTENT_TYPES_BY_EXTENSION.get(os.path.splitext(info.filename)[1].lower())
+        if content_type is None:
+            logger.info(f"Skipping unsupported file {info.filename} in {file.filename}")
+            continue
+        total_size += info.file_size
+        if len(members) >= max_files or total_size > max_uncompressed_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Zip archive {file.filename} exceeds {max_files} files or {max_uncompressed_bytes} uncompressed bytes"
+            )
+        members.append(BulkFile(filename=info.filename, file=archive.open(info), content_type=content_type))
+    return members
+
+@router.post("/bulk", response_model=BulkUploadResponse)
+async def upload_policy_documents_bulk(
+    tenant_id: str,
+    user_id: str,
+    files: List[UploadFile] = File(...),
+    settings: Settings = Depends(get_settings)
+) -> BulkUploadResponse:
+    # Accepts many files and/or zip archives. Files are streamed to S3 concurrently and
+    # ingested by a Celery chord of multi-document tasks, progress is tracked per file
+    # under the returned batch_id (GET /uploads/bulk/{batch_id}).
+    if not tenant_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="tenant_id is required")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="user_id is required")
+
+    bulk_files: List[BulkFile] = []
+    for file in files:
+        if _is_zip(file):
+            bulk_files.extend(await run_in_threadpool(
+                _expand_zip,
+                file,
+                max_files=settings.bulk_max_files - len(bulk_files),
+                max_uncompressed_bytes=settings.bulk_max_uncompressed_bytes
+            ))
+        else:
+            bulk_files.append(BulkFile(filename=file.filename, file=file.file, content_type=file.content_type))
+        if len(bulk_files) > settings.bulk_max_files:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {settings.bulk_max_files} files per bulk upload"
+            )
+    if not bulk_files:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No supported files in upload")
+
+    s3_upload_service = S3UploadService(settings)
+    semaphore = asyncio.Semaphore(settings.bulk_upload_concurrency)
+    seen_doc_ids = set()
+
+    async def _upload(file_key: str, bulk_file: BulkFile) -> dict:
+        doc_id = stable_doc_id(tenant_id, bulk_file.filename)
+        entry = {"file_key": file_key, "filename": bulk_file.filename, "doc_id": doc_id, "s3_key": None, "status": "queued", "detail": None}
+        # Two files with the same name would replace each other, only the first one is kept
+        if doc_id in seen_doc_ids:
+            entry.update(status="rejected", detail="duplicate filename in upload")
+            return entry
+        seen_doc_ids.add(doc_id)
+        async with semaphore:
+            try:
+                upload_object: UploadObject = await run_in_threadpool(s3_upload_service.upload_file, tenant_id, bulk_file)
+            except RuntimeError as e:
+                entry.update(status="failed", detail=str(e))
+                return entry
+        entry.update(s3_key=upload_object.key, s3_url=upload_object.url)
+        return entry
+
+    entries = await asyncio.gather(*(
+        _upload(f"{i:06d}", bulk_file) for i, bulk_file in enumerate(bulk_files)
+    ))
+    queued = [entry for entry in entries if entry["status"] == "queued"]
+
+    batch_id = str(uuid4())
+    try:
+        await run_in_threadpool(
+            status_store.create_batch,
+            batch_id=batch_id,
+            tenant_id=tenant_id,
+            files={
+                entry["file_key"]: {key: entry[key] for key in ("filename", "doc_id", "s3_key", "status", "detail")}
+                for entry in entries
+            }
+        )
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to record bulk batch: {e}")
+
+    task_id = None
+    batch_status = "failed"
+    if queued:
+        # Offload to Celery: a chord of multi-document tasks, finalized once all of them are done
+        from celery import chord, group
+        from app.tasks.ingestion_tasks import process_document_batch_task, finalize_bulk_batch_task
+        per_task = settings.bulk_files_per_task
+        documents = [
+            {key: entry[key] for key in ("file_key", "doc_id", "s3_key", "s3_url")}
+            for entry in queued
+        ]
+        header = group(
+            process_document_batch_task.s(batch_id, tenant_id, user_id, documents[i : i + per_task])
+            for i in range(0, len(documents), per_task)
+        )
+        result = await run_in_threadpool(chord(header), finalize_bulk_batch_task.s(batch_id))
+        task_id = result.id
+        batch_status = "processing_started"
+    else:
+        await run_in_threadpool(status_store.set_batch_status, batch_id=batch_id, status=batch_status)
+
+    logger.info(f"Bulk batch {batch_id}: {len(queued)} of {len(entries)} files queued for tenant_id: {tenant_id}")
+    return BulkUploadResponse(
+        batch_id=batch_id,
+        tenant_id=tenant_id,
+        user_id=user_id,
+        task_id=task_id,
+        status=batch_status,
+        files=[BulkUploadFileStatus(**entry) for entry in entries]
+    )
+
+@router.get("/bulk/{batch_id}", response_model=BulkUploadResponse)
+async def get_bulk_upload_status(batch_id: str) -> BulkUploadResponse:
+    batch = await run_in_threadpool(status_store.get_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown batch_id: {batch_id}")
+    return BulkUploadResponse(
+        batch_id=batch["batch_id"],
+        tenant_id=batch["tenant_id"],
+        status=batch["status"],
+        files=[BulkUploadFileStatus(**info) for info in batch["files"]]
+    )
+
+@router.get("/documents/{doc_id}", response_model=DocumentStatusResponse)
+async def get_document_status(doc_id: str, tenant_id: str) -> DocumentStatusResponse:
+    document = await run_in_threadpool(status_store.get_document_status, tenant_id=tenant_id, doc_id=doc_id)
+    if document is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown doc_id: {doc_id}")
+    return DocumentStatusResponse(**document)
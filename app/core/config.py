@@ -15,15 +15,144 @@ class Settings(BaseSettings):
     aws_secret_access_key: str
     aws_region: str
     policy_bucket_name: str
-    chroma_api_key: str
-    chroma_tenant: str
-    chroma_database: str
+    # Alternative endpoints, e.g. local stand-ins for the benchmarks (None = AWS / OpenAI)
+    s3_endpoint_url: Optional[str] = None
+    openai_base_url: Optional[str] = None
+    # Shared S3 client: connection pool size and multipart / ranged-GET transfer settings
+    s3_max_pool_connections: int = 64
+    s3_multipart_threshold: int = 16 * 1024 ** 2
+    s3_multipart_chunksize: int = 8 * 1024 ** 2
+    s3_max_concurrency: int = 8
+    # Vector store backend: "cloud" (Chroma Cloud), "http" (self-hosted Chroma server),
+    # "persistent" (embedded on-disk Chroma) or "memory" (embedded, non-persistent)
+    vector_store_backend: str = "cloud"
+    chroma_api_key: Optional[str] = None
+    chroma_tenant: Optional[str] = None
+    chroma_database: Optional[str] = None
+    chroma_host: str = "localhost"
+    chroma_port: int = 8000
+    chroma_persist_path: str = ".chroma"
     chromadb_collection_name: str = "policy_rag_openai_v1"
+    # Tenant partitioning of collections: "none", "tenant" or "hash" (see vector_store.collection_name_for_tenant)
+    collection_sharding: str = "none"
+    collection_shard_count: int = 32
+    dedicated_collection_tenants: list[str] = []
     num_retrieved_chunks: int = 9
     redis_url: str = "redis://localhost:6379/0"
     openai_api_key: str
     openai_model_name: str
     openai_embedding_model: str = "text-embedding-3-small"
+    # Shortened embeddings (text-embedding-3 models), None = native size (1536 for -small).
+    # Changing it for an existing index needs `python -m app.scripts.reindex_embeddings`.
+    openai_embedding_dimensions: Optional[int] = None
+
+    # Prompt context: adjacent chunks of a document are merged (overlap removed) and blocks
+    # are added best first up to the token budget of openai_model_name
+    context_packing_enabled: bool = True
+    context_token_budget: int = 3000
+    context_token_budgets: dict[str, int] = {}  # per model override, e.g. {"gpt-4o-mini": 6000}
+
+    # /chat/ask_batch: questions per request and concurrent answer generations
+    chat_batch_max_questions: int = 500
+    chat_batch_max_concurrency: int = 8
+
+    # Coalesce identical (tenant, normalized question) /chat/ask requests that are in flight
+    single_flight_enabled: bool = True
+
+    # Semantic answer cache for /chat/ask
+    answer_cache_enabled: bool = True
+    answer_cache_similarity_threshold: float = 0.95
+    answer_cache_max_entries: int = 256  # per tenant
+    answer_cache_ttl_seconds: int = 3600
+
+    # Two-tier (in-process + Redis) cache for query embeddings
+    embedding_cache_enabled: bool = True
+    embedding_cache_l1_max_entries: int = 10000
+    embedding_cache_ttl_seconds: int = 7 * 24 * 3600
+
+    # Ingestion embedding requests (embed_chunks)
+    embedding_batch_max_inputs: int = 2048
+    embedding_batch_max_tokens: int = 250000
+    embedding_max_concurrency: int = 4
+    embedding_max_retries: int = 5
+    embedding_retry_base_delay: float = 1.0
+
+    # Shared OpenAI budget per model and one-minute window, coordinated through Redis by the
+    # API and the workers (see rate_limiter). The defaults apply until OpenAI's
+    # x-ratelimit-limit-* headers were seen. Ingestion leaves rate_limit_interactive_reserve
+    # of every window to chat and splits the rest evenly between the tenants ingesting.
+    rate_limit_enabled: bool = True
+    rate_limit_default_requests: int = 500
+    rate_limit_default_tokens: int = 200000
+    rate_limit_target_utilization: float = 0.95
+    rate_limit_interactive_reserve: float = 0.2
+    rate_limit_max_wait_seconds: float = 10.0  # interactive calls are sent anyway after this
+    rate_limit_chat_completion_tokens: int = 800  # reserved per chat call on top of the prompt
+    # Concurrent OpenAI calls per process and model, adapted (AIMD) between these bounds
+    openai_min_concurrency: int = 2
+    openai_max_concurrency: int = 64
+
+    # Streaming ingestion: chunks are embedded and stored in batches of this size
+    ingest_batch_size: int = 256
+    ingest_spool_dir: Optional[str] = None
+    # PDF text extraction processes per Celery worker process (1 = serial). Needs a non-prefork
+    # worker pool (--pool=threads or solo), prefork children can't start processes
+    pdf_extract_workers: int = 1
+    pdf_pages_per_task: int = 25
+    # Celery workers run async work (embedding, writes) on one long-lived event loop per
+    # process, with up to ingest_max_in_flight documents / write batches in progress at once
+    worker_persistent_loop: bool = True
+    ingest_max_in_flight: int = 4
+
+    # Large documents: new chunks beyond fanout_min_chunks are staged in Redis in slices of
+    # fanout_slice_size and embedded / stored by parallel Celery subtasks (a chord)
+    fanout_enabled: bool = True
+    fanout_min_chunks: int = 2000
+    fanout_slice_size: int = 500
+    fanout_slice_ttl_seconds: int = 24 * 3600
+
+    # Bulk uploads (/uploads/bulk): files are grouped into Celery tasks of bulk_files_per_task
+    # documents whose new chunks are written to Chroma in batches of bulk_write_batch_size
+    bulk_write_batch_size: int = 1000
+    bulk_files_per_task: int = 20
+    bulk_upload_concurrency: int = 8
+    bulk_max_files: int = 5000
+    bulk_max_uncompressed_bytes: int = 2 * 1024 ** 3
+
+    # Hybrid retrieval: per-tenant BM25 index fused with vector search (reciprocal-rank fusion).
+    # lexical_index_dir must be shared between the API and the ingestion workers.
+    hybrid_search_enabled: bool = False
+    lexical_index_dir: str = ".lexical_index"
+    lexical_max_segments: int = 16
+    lexical_top_k: int = 25
+    hybrid_candidate_pool: int = 20
+    rrf_k: int = 60
+
+    # Vector candidate pool passed to re-ranking. With adaptive_candidate_pool the pool
+    # narrows to retrieval_min_top_k when the top num_retrieved_chunks are separated from
+    # the rest by at least candidate_gap_threshold (cosine distance), and widens to
+    # retrieval_max_top_k when the distances over the initial pool spread less than
+    # candidate_flat_threshold.
+    retrieval_initial_top_k: int = 25
+    retrieval_min_top_k: int = 12
+    retrieval_max_top_k: int = 50
+    adaptive_candidate_pool: bool = True
+    candidate_gap_threshold: float = 0.08
+    candidate_flat_threshold: float = 0.03
+
+    # Cascaded re-ranking: rerank_cascade_model keeps the best rerank_cascade_keep candidates,
+    # the main model scores them num_retrieved_chunks first, then rerank_cascade_slice at a time
+    rerank_cascade_enabled: bool = False
+    rerank_cascade_model: str = "ms-marco-TinyBERT-L-2-v2"
+    rerank_cascade_keep: int = 15
+    rerank_cascade_slice: int = 3
+
+    # Re-ranking backend: "thread" (one call per request), "batch" (micro-batched)
+    # or "process" (pool of worker processes with the model preloaded)
+    rerank_backend: str = "thread"
+    rerank_max_batch_pairs: int = 256
+    rerank_max_wait_ms: float = 5.0
+    rerank_process_pool_size: int = 2
 
 
 def get_settings() -> Settings:
@@ -0,0 +1,81 @@
+# Long-lived asyncio event loop for the (sync) Celery worker processes.
+# The loop runs in a daemon thread started from worker init, so the AsyncOpenAI client
+# created there is always used from the same loop instead of a fresh asyncio.run() loop
+# per task. Sync code submits coroutines to it with run_coroutine / submit_coroutine.
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+
+
+def start_worker_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread
+    if _loop is not None:
+        return _loop
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def _run():
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    _thread = threading.Thread(target=_run, name="worker-event-loop", daemon=True)
+    _thread.start()
+    ready.wait()
+    _loop = loop
+    logger.info("Started persistent worker event loop")
+    return loop
+
+
+def stop_worker_loop(timeout: float = 10.0):
+    global _loop, _thread
+    if _loop is None:
+        return
+    loop, thread = _loop, _thread
+    _loop, _thread = None, None
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    if not loop.is_running():
+        loop.close()
+    logger.info("Stopped persistent worker event loop")
+
+
+def is_running() -> bool:
+    return _loop is not None
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    if _loop is None:
+        raise RuntimeError("Worker event loop not started. Ensure worker init has run.")
+    return _loop
+
+
+def submit_coroutine(coro: Coroutine) -> Future:
+    """
+    Schedules coro on the worker loop and returns a concurrent.futures.Future.
+    Without a worker loop (e.g. scripts) the coroutine runs to completion with asyncio.run
+    and an already resolved future is returned.
+    """
+    if _loop is not None:
+        if threading.current_thread() is _thread:
+            raise RuntimeError("submit_coroutine called from the worker loop thread, await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, _loop)
+    future = Future()
+    try:
+        future.set_result(asyncio.run(coro))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def run_coroutine(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    # Blocking: runs coro on the worker loop (or asyncio.run) and returns its result
+    return submit_coroutine(coro).result(timeout)
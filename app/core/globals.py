@@ -1,10 +1,15 @@
 import chromadb
+import redis
+import redis.asyncio as aioredis
 from openai import AsyncOpenAI
 from typing import Optional
 
 # Global variables to hold client instances
 _openai_client: Optional[AsyncOpenAI] = None
 _chroma_client: Optional[chromadb.Client] = None
+_redis_client: Optional[aioredis.Redis] = None
+_sync_redis_client: Optional[redis.Redis] = None
+_s3_client = None
 
 # OpenAI Client Management
 def set_openai_client(client: AsyncOpenAI):
@@ -27,3 +32,36 @@ def get_chroma_client() -> chromadb.Client:
     if _chroma_client is None:
         raise RuntimeError("Global ChromaDB Client not initialized. Ensure app startup or worker init has run.")
     return _chroma_client
+
+# Redis Client Management (async, API process)
+def set_redis_client(client: aioredis.Redis):
+    global _redis_client
+    _redis_client = client
+
+def get_redis_client() -> aioredis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        raise RuntimeError("Global Redis Client not initialized. Ensure app startup has run.")
+    return _redis_client
+
+# Redis Client Management (sync, workers and threadpool code)
+def set_sync_redis_client(client: redis.Redis):
+    global _sync_redis_client
+    _sync_redis_client = client
+
+def get_sync_redis_client() -> redis.Redis:
+    global _sync_redis_client
+    if _sync_redis_client is None:
+        raise RuntimeError("Global sync Redis Client not initialized. Ensure app startup or worker init has run.")
+    return _sync_redis_client
+
+# S3 Client Management (boto3 clients are thread-safe once created)
+def set_s3_client(client):
+    global _s3_client
+    _s3_client = client
+
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        raise RuntimeError("Global S3 Client not initialized. Ensure app startup or worker init has run.")
+    return _s3_client
@@ -6,25 +6,42 @@ from app.api.routes import uploads_router
 from app.api.routes import chat_router
 from app.core import globals
 from app.core.config import get_settings
-from app.services import vector_store
+from app.services import vector_store, reranker, s3_upload
 from openai import AsyncOpenAI
+import redis
+import redis.asyncio as aioredis
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     settings = get_settings()
     
     # Initialize OpenAI
-    openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
+    openai_client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
     globals.set_openai_client(openai_client)
     
     # Initialize ChromaDB (Sync)
     chroma_client = vector_store._create_chroma_client(settings)
     globals.set_chroma_client(chroma_client)
+
+    # Initialize S3 (shared, pooled)
+    globals.set_s3_client(s3_upload.create_s3_client(settings))
+
+    # Initialize Redis (caches and ingestion status)
+    redis_client = aioredis.from_url(settings.redis_url)
+    globals.set_redis_client(redis_client)
+    sync_redis_client = redis.Redis.from_url(settings.redis_url)
+    globals.set_sync_redis_client(sync_redis_client)
+
+    # Start the re-ranking backend (preloads the model in worker processes if configured)
+    reranker.start_rerank_backend(settings)
     
     yield
     
     # Cleanup
     await openai_client.close()
+    await redis_client.aclose()
+    sync_redis_client.close()
+    reranker.shutdown_rerank_backend()
 
 app = FastAPI(title="Policy RAG Chatbot", lifespan=lifespan)
 app.include_router(health_router)
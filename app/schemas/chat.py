@@ -16,3 +16,17 @@ class Source(BaseSchema):
 class ChatResponse(BaseSchema):
     answer: str
     sources: List[Source]
+
+class ChatBatchRequest(BaseSchema):
+    user_id: str
+    tenant_id: str
+    questions: List[str]
+
+class ChatBatchItem(BaseSchema):
+    question: str
+    answer: Optional[str] = None
+    sources: List[Source] = []
+    error: Optional[str] = None
+
+class ChatBatchResponse(BaseSchema):
+    results: List[ChatBatchItem]
@@ -1,12 +1,37 @@
+from typing import List, Optional
 from uuid import UUID
 from app.schemas.common import BaseSchema
 
 class UploadResponse(BaseSchema):
     tenant_id: str
     user_id: str
-    doc_id: UUID
+    doc_id: str
     task_id: UUID
     filename: str
     url: str
     bucket: str
     status: str
+
+class BulkUploadFileStatus(BaseSchema):
+    filename: str
+    doc_id: Optional[str] = None
+    s3_key: Optional[str] = None
+    status: str
+    detail: Optional[str] = None
+
+class BulkUploadResponse(BaseSchema):
+    batch_id: str
+    tenant_id: str
+    user_id: Optional[str] = None
+    task_id: Optional[str] = None
+    status: str
+    files: List[BulkUploadFileStatus]
+
+class DocumentStatusResponse(BaseSchema):
+    tenant_id: str
+    doc_id: str
+    status: str
+    detail: Optional[str] = None
+    # Only for large documents fanned out into parallel slice tasks
+    slices: Optional[int] = None
+    slices_done: Optional[int] = None
@@ -0,0 +1,78 @@
+# Moves vectors from the shared collection into the per-tenant collections selected by
+# COLLECTION_SHARDING. Safe to re-run: records are upserted with their original ids.
+#
+# Usage:
+#   COLLECTION_SHARDING=tenant python -m app.scripts.migrate_tenant_collections [--batch-size 500] [--delete-source]
+import argparse
+from collections import defaultdict
+
+import redis
+
+from app.core import globals
+from app.core.config import get_settings
+from app.core.logger_config import get_logger
+from app.services import vector_store
+from app.services.index_registry import get_active_index
+
+logger = get_logger(__name__)
+
+
+def migrate(*, batch_size: int, delete_source: bool):
+    settings = get_settings()
+    if settings.collection_sharding == "none":
+        raise SystemExit("COLLECTION_SHARDING is 'none', there is nothing to migrate to.")
+
+    client = vector_store._create_chroma_client(settings)
+    globals.set_chroma_client(client)
+    globals.set_sync_redis_client(redis.Redis.from_url(settings.redis_url))
+    # The shared collection of the live index (differs from chromadb_collection_name after a re-index)
+    base = get_active_index(settings).collection
+    source = vector_store._get_collection(client, collection_name=base)
+
+    total = source.count()
+    logger.info(f"Migrating {total} records out of {base} (sharding: {settings.collection_sharding})")
+
+    migrated_ids = []
+    offset = 0
+    while offset < total:
+        page = source.get(
+            include=["embeddings", "metadatas", "documents"],
+            limit=batch_size,
+            offset=offset
+        )
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+
+        # Group the page by destination collection so each one gets a single upsert
+        grouped = defaultdict(lambda: {"ids": [], "embeddings": [], "metadatas": [], "documents": []})
+        for id, embedding, metadata, document in zip(page["ids"], page["embeddings"], page["metadatas"], page["documents"]):
+            target = vector_store.collection_name_for_tenant(metadata["tenant_id"], settings, base=base)
+            if target == base:
+                continue
+            grouped[target]["ids"].append(id)
+            grouped[target]["embeddings"].append(embedding)
+            grouped[target]["metadatas"].append(metadata)
+            grouped[target]["documents"].append(document)
+
+        for target, records in grouped.items():
+            collection = vector_store._get_collection(client, collection_name=target)
+            collection.upsert(**records)
+            migrated_ids.extend(records["ids"])
+        logger.info(f"Migrated {offset}/{total} records into {len(grouped)} collections")
+
+    # Only remove from the source once everything was copied, so a failed run loses nothing
+    if delete_source:
+        for i in range(0, len(migrated_ids), batch_size):
+            source.delete(ids=migrated_ids[i : i + batch_size])
+        logger.info(f"Deleted {len(migrated_ids)} migrated records from {base}")
+
+    logger.info(f"Migration complete. {len(migrated_ids)} records moved.")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Move vectors into per-tenant collections")
+    arg_parser.add_argument("--batch-size", type=int, default=500)
+    arg_parser.add_argument("--delete-source", action="store_true", help="Delete migrated records from the shared collection")
+    args = arg_parser.parse_args()
+    migrate(batch_size=args.batch_size, delete_source=args.delete_source)
@@ -0,0 +1,230 @@
+# Re-embeds the live vector index into a new set of collections (e.g. with shortened
+# embeddings) and switches the API and workers over without downtime:
+#   1. every collection of the active index is copied, re-embedded in batches, into the
+#      collections of the new index (same ids, documents and metadata)
+#   2. the active index in Redis is switched to the new one, processes pick it up within
+#      ACTIVE_INDEX_CACHE_SECONDS, from then on ingestion writes to the new collections
+#   3. a catch-up pass applies what ingestion changed in the old collections during the copy
+#   4. optionally the old collections are deleted (otherwise --rollback can switch back)
+#
+# Usage:
+#   python -m app.scripts.reindex_embeddings --dimensions 512 [--model text-embedding-3-small] [--target-name policy-docs-d512] [--batch-size 200] [--delete-source]
+#   python -m app.scripts.reindex_embeddings --rollback
+# Afterwards set OPENAI_EMBEDDING_DIMENSIONS (and CHROMADB_COLLECTION_NAME) to match, so the
+# configuration agrees with the active index if the Redis key is ever lost.
+import argparse
+import hashlib
+import json
+import re
+import time
+from collections import defaultdict
+
+import redis
+from openai import AsyncOpenAI
+
+from app.core import event_loop, globals
+from app.core.config import Settings, get_settings
+from app.core.logger_config import get_logger
+from app.services import embeddings, index_registry, vector_store
+from app.services.chunker import Chunk
+from app.services.index_registry import IndexSpec
+
+logger = get_logger(__name__)
+
+
+def _record_hash(document: str, metadata: dict) -> str:
+    payload = json.dumps({"document": document, "metadata": metadata}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _source_collections(client, base: str) -> list[str]:
+    # The shared collection and every tenant / hash shard derived from it
+    shard = re.compile(rf"^{re.escape(base)}-(t-.+|s\d{{3}})$")
+    names = [getattr(collection, "name", collection) for collection in client.list_collections()]
+    return sorted(name for name in names if name == base or shard.match(name))
+
+
+def _iter_pages(collection, *, batch_size: int, include: list[str]):
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=batch_size, offset=offset)
+        if not page["ids"]:
+            return
+        offset += len(page["ids"])
+        yield page
+
+
+def _copy_records(client, *, ids: list[str], documents: list[str], metadatas: list[dict], target: IndexSpec, settings: Settings) -> dict[str, dict[str, str]]:
+    """Embeds the records for the target index and upserts them, returns {collection: {id: record hash}}."""
+    chunks = [Chunk(id=id, text=document, index=0) for id, document in zip(ids, documents)]
+    vectors = event_loop.run_coroutine(embeddings.embed_chunks(chunks, index=target))
+
+    grouped = defaultdict(lambda: {"ids": [], "embeddings": [], "metadatas": [], "documents": []})
+    for id, vector, metadata, document in zip(ids, vectors, metadatas, documents):
+        name = vector_store.collection_name_for_tenant(metadata["tenant_id"], settings, base=target.collection)
+        grouped[name]["ids"].append(id)
+        grouped[name]["embeddings"].append(vector)
+        grouped[name]["metadatas"].append(metadata)
+        grouped[name]["documents"].append(document)
+
+    copied = defaultdict(dict)
+    for name, records in grouped.items():
+        vector_store._get_collection(client, collection_name=name).upsert(**records)
+        for id, metadata, document in zip(records["ids"], records["metadatas"], records["documents"]):
+            copied[name][id] = _record_hash(document, metadata)
+    return copied
+
+
+def _catch_up(client, *, source_name: str, copied: dict[str, dict[str, str]], target: IndexSpec, batch_size: int, settings: Settings) -> int:
+    """
+    Applies changes made to a source collection after its records were copied. A record is
+    only touched in the target if the target still holds exactly what was copied, anything
+    else was written by ingestion after the switch and is newer.
+    """
+    source = vector_store._get_collection(client, collection_name=source_name)
+    copied_by_id = {id: (name, digest) for name, ids in copied.items() for id, digest in ids.items()}
+    seen = set()
+    to_copy = {"ids": [], "documents": [], "metadatas": []}
+    for page in _iter_pages(source, batch_size=batch_size, include=["metadatas", "documents"]):
+        for id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            seen.add(id)
+            if copied_by_id.get(id, (None, None))[1] != _record_hash(document, metadata):
+                to_copy["ids"].append(id)
+                to_copy["documents"].append(document)
+                to_copy["metadatas"].append(metadata)
+    removed = [id for id in copied_by_id if id not in seen]
+
+    def _unchanged_in_target(ids: list[str]) -> set[str]:
+        # ids whose target record is missing (never copied) or still the copied version
+        keep = set()
+        by_collection = defaultdict(list)
+        for id in ids:
+            if id in copied_by_id:
+                by_collection[copied_by_id[id][0]].append(id)
+            else:
+                keep.add(id)
+        for name, collection_ids in by_collection.items():
+            collection = vector_store._get_collection(client, collection_name=name)
+            for i in range(0, len(collection_ids), batch_size):
+                current = collection.get(ids=collection_ids[i : i + batch_size], include=["metadatas", "documents"])
+                for id, document, metadata in zip(current["ids"], current["documents"], current["metadatas"]):
+                    if _record_hash(document, metadata) == copied_by_id[id][1]:
+                        keep.add(id)
+        return keep
+
+    changed = 0
+    if to_copy["ids"]:
+        keep = _unchanged_in_target(to_copy["ids"])
+        # Records first seen here may already have been written to the target by ingestion
+        fresh = [id for id in to_copy["ids"] if id not in copied_by_id]
+        if fresh:
+            existing = set()
+            for name in {vector_store.collection_name_for_tenant(m["tenant_id"], settings, base=target.collection) for m in to_copy["metadatas"]}:
+                existing.update(vector_store._get_collection(client, collection_name=name).get(ids=fresh, include=[])["ids"])
+            keep -= existing
+        rows = [row for row in zip(to_copy["ids"], to_copy["documents"], to_copy["metadatas"]) if row[0] in keep]
+        for i in range(0, len(rows), batch_size):
+            ids, documents, metadatas = (list(column) for column in zip(*rows[i : i + batch_size]))
+            _copy_records(client, ids=ids, documents=documents, metadatas=metadatas, target=target, settings=settings)
+        changed += len(rows)
+
+    if removed:
+        keep = _unchanged_in_target(removed)
+        by_collection = defaultdict(list)
+        for id in removed:
+            if id in keep:
+                by_collection[copied_by_id[id][0]].append(id)
+        for name, ids in by_collection.items():
+            collection = vector_store._get_collection(client, collection_name=name)
+            for i in range(0, len(ids), batch_size):
+                collection.delete(ids=ids[i : i + batch_size])
+            changed += len(ids)
+    return changed
+
+
+def reindex(*, model: str, dimensions: int | None, target_name: str | None, batch_size: int, delete_source: bool):
+    settings = get_settings()
+    client = globals.get_chroma_client()
+    current = index_registry.get_active_index(settings)
+    target = IndexSpec(
+        collection=target_name or f"{settings.chromadb_collection_name}-d{dimensions or 'native'}-{int(time.time())}",
+        model=model,
+        dimensions=dimensions,
+    )
+    if target.collection == current.collection:
+        raise SystemExit(f"{target.collection} is already the active index, pick another --target-name.")
+    if not vector_store._VALID_COLLECTION_NAME.match(target.collection):
+        raise SystemExit(f"{target.collection} is not a valid Chroma collection name.")
+
+    sources = _source_collections(client, current.collection)
+    logger.info(f"Re-indexing {len(sources)} collections of {current.collection} into {target.collection} ({model}, dimensions: {dimensions or 'native'})")
+
+    copied: dict[str, dict[str, dict[str, str]]] = {}
+    for name in sources:
+        source = vector_store._get_collection(client, collection_name=name)
+        total = source.count()
+        copied[name] = defaultdict(dict)
+        done = 0
+        for page in _iter_pages(source, batch_size=batch_size, include=["metadatas", "documents"]):
+            result = _copy_records(client, ids=page["ids"], documents=page["documents"], metadatas=page["metadatas"], target=target, settings=settings)
+            for target_collection, ids in result.items():
+                copied[name][target_collection].update(ids)
+            done += len(page["ids"])
+            logger.info(f"Re-indexed {done}/{total} records of {name}")
+
+    index_registry.set_active_index(target, previous=current)
+    # Wait until every process has re-read the active index and writes only to the new one
+    time.sleep(index_registry.ACTIVE_INDEX_CACHE_SECONDS + 1)
+
+    for name in sources:
+        changed = _catch_up(client, source_name=name, copied=copied[name], target=target, batch_size=batch_size, settings=settings)
+        logger.info(f"Caught up {changed} records changed in {name} during the copy")
+
+    if delete_source:
+        for name in sources:
+            client.delete_collection(name)
+        logger.info(f"Deleted {len(sources)} collections of {current.collection}")
+
+    logger.info(f"Re-index complete. Set OPENAI_EMBEDDING_DIMENSIONS={dimensions or ''} and CHROMADB_COLLECTION_NAME={target.collection} in the environment.")
+
+
+def rollback():
+    settings = get_settings()
+    previous = index_registry.get_previous_index()
+    if previous is None:
+        raise SystemExit("No previous vector index recorded, nothing to roll back to.")
+    current = index_registry.get_active_index(settings)
+    index_registry.set_active_index(previous, previous=current)
+    logger.warning(f"Rolled back to {previous.collection}. Documents ingested into {current.collection} since the switch are not in it, re-upload them.")
+
+
+if __name__ == "__main__":
+    settings = get_settings()
+    arg_parser = argparse.ArgumentParser(description="Re-embed the vector index into new collections and switch over online")
+    arg_parser.add_argument("--dimensions", type=int, default=settings.openai_embedding_dimensions, help="Embedding size, omit for the model's native size")
+    arg_parser.add_argument("--model", default=settings.openai_embedding_model)
+    arg_parser.add_argument("--target-name", help="Base collection name of the new index")
+    arg_parser.add_argument("--batch-size", type=int, default=200)
+    arg_parser.add_argument("--delete-source", action="store_true", help="Delete the old collections once the new index is live")
+    arg_parser.add_argument("--rollback", action="store_true", help="Switch back to the previous index")
+    args = arg_parser.parse_args()
+
+    globals.set_sync_redis_client(redis.Redis.from_url(settings.redis_url))
+    if args.rollback:
+        rollback()
+    else:
+        globals.set_chroma_client(vector_store._create_chroma_client(settings))
+        # Embedding runs on the same kind of long-lived loop as in the Celery workers
+        event_loop.start_worker_loop()
+        globals.set_openai_client(AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url))
+        try:
+            reindex(
+                model=args.model,
+                dimensions=args.dimensions,
+                target_name=args.target_name,
+                batch_size=args.batch_size,
+                delete_source=args.delete_source,
+            )
+        finally:
+            event_loop.run_coroutine(globals.get_openai_client().close(), timeout=5)
+            event_loop.stop_worker_loop()
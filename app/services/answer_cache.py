@@ -0,0 +1,130 @@
+# Per-tenant semantic cache of /chat/ask answers.
+# Entries are keyed on the (unit-normalised) question embedding and a hit is any cached
+# question whose cosine similarity is above the configured threshold.
+# Invalidation works across processes: the ingestion worker bumps a per-tenant generation
+# counter in Redis, and the API drops a tenant's entries when it sees a newer generation.
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import count
+from typing import Optional
+
+import numpy as np
+
+from app.core import globals
+from app.core.config import Settings
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+GENERATION_KEY = "answer_cache:generation:{tenant_id}"
+
+_answer_cache_instance = None
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    embedding: np.ndarray
+    response: dict
+    generation: int
+    expires_at: float
+
+
+class AnswerCache:
+    def __init__(self, *, max_entries: int, ttl_seconds: int, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # tenant_id -> OrderedDict(entry_id -> CacheEntry), oldest first
+        self._entries: dict[str, OrderedDict[int, CacheEntry]] = {}
+        self._ids = count()
+
+    async def current_generation(self, tenant_id: str) -> Optional[int]:
+        # None means we cannot tell whether the cache is fresh, callers should bypass it
+        try:
+            value = await globals.get_redis_client().get(GENERATION_KEY.format(tenant_id=tenant_id))
+        except Exception as e:
+            logger.warning(f"Could not read answer cache generation for tenant_id: {tenant_id}. Error: {e}")
+            return None
+        return int(value) if value is not None else 0
+
+    def lookup(self, *, tenant_id: str, embedding: list[float], generation: int) -> Optional[dict]:
+        entries = self._entries.get(tenant_id)
+        if not entries:
+            return None
+
+        self._evict_stale(tenant_id, generation)
+        if not entries:
+            return None
+
+        query = _normalise(embedding)
+        # Answers cached before a re-index to another embedding size can't be compared
+        entry_ids = [entry_id for entry_id, entry in entries.items() if entry.embedding.shape == query.shape]
+        if not entry_ids:
+            return None
+        matrix = np.stack([entries[entry_id].embedding for entry_id in entry_ids])
+        similarities = matrix @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        # Mark as most recently used
+        entry_id = entry_ids[best]
+        entries.move_to_end(entry_id)
+        logger.info(f"Answer cache hit for tenant_id: {tenant_id} (similarity: {similarities[best]:.4f})")
+        return entries[entry_id].response
+
+    def store(self, *, tenant_id: str, embedding: list[float], response: dict, generation: int):
+        entries = self._entries.setdefault(tenant_id, OrderedDict())
+        entries[next(self._ids)] = CacheEntry(
+            embedding=_normalise(embedding),
+            response=response,
+            generation=generation,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def invalidate(self, tenant_id: str):
+        self._entries.pop(tenant_id, None)
+
+    def _evict_stale(self, tenant_id: str, generation: int):
+        entries = self._entries[tenant_id]
+        if any(entry.generation != generation for entry in entries.values()):
+            # New vectors were stored for this tenant since these answers were generated
+            logger.info(f"Invalidating answer cache for tenant_id: {tenant_id} (generation: {generation})")
+            entries.clear()
+            return
+        now = time.monotonic()
+        expired = [entry_id for entry_id, entry in entries.items() if entry.expires_at <= now]
+        for entry_id in expired:
+            del entries[entry_id]
+
+
+def _normalise(embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def get_answer_cache(settings: Settings) -> AnswerCache:
+    global _answer_cache_instance
+    if _answer_cache_instance is None:
+        _answer_cache_instance = AnswerCache(
+            max_entries=settings.answer_cache_max_entries,
+            ttl_seconds=settings.answer_cache_ttl_seconds,
+            similarity_threshold=settings.answer_cache_similarity_threshold,
+        )
+    return _answer_cache_instance
+
+
+def invalidate_tenant(tenant_id: str, settings: Settings):
+    # Called from the ingestion worker (sync) once new vectors are stored for a tenant
+    if _answer_cache_instance is not None:
+        _answer_cache_instance.invalidate(tenant_id)
+    try:
+        globals.get_sync_redis_client().incr(GENERATION_KEY.format(tenant_id=tenant_id))
+        logger.info(f"Bumped answer cache generation for tenant_id: {tenant_id}")
+    except Exception as e:
+        # Not fatal for ingestion, cached answers will still expire via TTL
+        logger.error(f"Failed to invalidate answer cache for tenant_id: {tenant_id}. Error: {e}")
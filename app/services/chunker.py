@@ -1,183 +1,150 @@
-import re
+import hashlib
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 @dataclass(slots=True)
 class Chunk:
     id: str
     text: str
     index: int
+    content_hash: str = ""
+    # Character offsets of the chunk in the source document text ([start, end))
+    start: int = 0
+    end: int = 0
+
+    def __post_init__(self):
+        # SHA-256 of the chunk text, used to skip re-embedding content we have already seen
+        if not self.content_hash:
+            self.content_hash = content_hash(self.text)
 
 class RecursiveChunker:
+    """
+    Splits text on a hierarchy of separators ("\\n\\n", then "\\n", ".", " " and finally
+    fixed-size slices) and merges the pieces greedily into chunks of at most chunk_size
+    characters, with up to chunk_overlap characters shared between consecutive chunks.
+
+    Works on offsets only: the text is scanned with str.find for separator positions and
+    substrings are only built for the emitted chunks, so cost is linear in the text size.
+    """
+
     def __init__(
-        self, 
-        chunk_size: int = 1000, 
-        chunk_overlap: int = 200, 
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
         separators: Optional[List[str]] = None
     ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.separators = separators or ["\n\n", "\n", ".", " ", ""]
 
     def split_text(self, text: str) -> List[str]:
-        final_chunks = []
-        self._split_text_recursive(text, self.separators, final_chunks)
-        return final_chunks
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def split_chunks(self, text: str, *, offset: int = 0, start_index: int = 0) -> List[Chunk]:
+        # offset is added to the chunk offsets, for text that is part of a larger document
+        return [
+            Chunk(id=f"chunk_{i}", text=text[start:end], index=i, start=start + offset, end=end + offset)
+            for i, (start, end) in enumerate(self.split_spans(text), start=start_index)
+        ]
 
-    def _split_text_recursive(self, text: str, separators: List[str], final_chunks: List[str]):
+    def iter_chunks(self, pieces: Iterable[str], piece_separator: str = "\n") -> Iterator[Chunk]:
         """
-        Recursively splits text by the first separator that produces chunks smaller than chunk_size.
+        Streaming variant of split_chunks over a sequence of text pieces (e.g. PDF pages),
+        with offsets relative to the pieces joined by piece_separator.
+        Keeps a rolling buffer across piece boundaries: every chunk but the last is emitted,
+        the buffer restarts at the last chunk since it may continue on the next page.
         """
-        # Base case: text is small enough
-        if len(text) <= self.chunk_size:
-            final_chunks.append(text)
+        buffer = ""
+        buffer_offset = 0
+        index = 0
+        for piece in pieces:
+            buffer = f"{buffer}{piece_separator}{piece}" if buffer else piece
+            if len(buffer) < 4 * self.chunk_size:
+                continue
+            spans = self.split_spans(buffer)
+            for start, end in spans[:-1]:
+                yield Chunk(id=f"chunk_{index}", text=buffer[start:end], index=index, start=start + buffer_offset, end=end + buffer_offset)
+                index += 1
+            carry_from = spans[-1][0] if spans else len(buffer)
+            buffer = buffer[carry_from:]
+            buffer_offset += carry_from
+        if buffer:
+            yield from self.split_chunks(buffer, offset=buffer_offset, start_index=index)
+
+    def split_spans(self, text: str) -> List[tuple[int, int]]:
+        """Returns the (start, end) offsets of the chunks, with surrounding whitespace trimmed."""
+        if not text:
+            return []
+        bounds = [0]
+        self._collect_bounds(text, 0, len(text), 0, bounds)
+
+        spans = []
+        last = len(bounds) - 1
+        i = 0
+        while i < last:
+            # Extend the chunk with whole pieces while it fits
+            j = i + 1
+            while j < last and bounds[j + 1] - bounds[i] <= self.chunk_size:
+                j += 1
+            start, end = self._trim(text, bounds[i], bounds[j])
+            if start < end:
+                spans.append((start, end))
+            if j == last:
+                break
+            # Next chunk starts at the earliest piece within chunk_overlap of this chunk's end,
+            # as long as the following piece still fits
+            k = j
+            while k - 1 > i and bounds[j] - bounds[k - 1] <= self.chunk_overlap:
+                k -= 1
+            while k < j and bounds[j + 1] - bounds[k] > self.chunk_size:
+                k += 1
+            i = k
+        return spans
+
+    def _collect_bounds(self, text: str, start: int, end: int, level: int, bounds: List[int]):
+        """
+        Appends the end offsets of consecutive pieces covering text[start:end], each at most
+        chunk_size long, splitting on separators[level] and recursing into oversized pieces.
+        The separator stays attached to the end of the piece it terminates.
+        """
+        if end - start <= self.chunk_size:
+            bounds.append(end)
             return
 
-        # Use the first separator in the list
-        separator = separators[0]
-        # If we run out of separators (hitting empty string), just force split
+        separator = self.separators[level] if level < len(self.separators) else ""
         if separator == "":
-            for i in range(0, len(text), self.chunk_size - self.chunk_overlap):
-                final_chunks.append(text[i : i + self.chunk_size])
+            # Out of separators: fixed-size slices, small enough for the overlap to apply
+            step = self.chunk_overlap if self.chunk_overlap > 0 else self.chunk_size
+            bounds.extend(range(start + step, end, step))
+            bounds.append(end)
             return
 
-        # Attempt to split
-        splits = text.split(separator)
-        
-        # Merge splits back into chunks
-        current_doc = []
-        current_length = 0
-        for s in splits:
-            s_len = len(s)
-            if current_length + s_len + len(separator) > self.chunk_size:
-                # If checking next layer of separators makes sense
-                if len(separators) > 1:
-                     # Recurse on the current buffer if it's too big? 
-                     # Actually better strategy: if a SINGLE split is too big, recurse on IT. 
-                     # If the buffer is too big, emit it (but we built it up so it should fit?)
-                     
-                     # Simple logic: emit current buffer
-                     if current_doc:
-                         doc = separator.join(current_doc)
-                         if len(doc) > self.chunk_size:
-                             # Recurse on this doc with next separator
-                             self._split_text_recursive(doc, separators[1:], final_chunks)
-                         else:
-                             final_chunks.append(doc)
-                     
-                     current_doc = []
-                     current_length = 0
-
-            current_doc.append(s)
-            current_length += s_len + len(separator)
-            
-        # Process remaining
-        if current_doc:
-            doc = separator.join(current_doc)
-            if len(doc) > self.chunk_size and len(separators) > 1:
-                self._split_text_recursive(doc, separators[1:], final_chunks)
+        piece_start = start
+        while True:
+            found = text.find(separator, piece_start, end)
+            piece_end = end if found == -1 else found + len(separator)
+            if piece_end - piece_start > self.chunk_size:
+                self._collect_bounds(text, piece_start, piece_end, level + 1, bounds)
             else:
-                final_chunks.append(doc)
-
-    def _merge_splits(self, splits: List[str], separator: str) -> List[str]:
-        # Improved logic for merging considering overlap (simplified here for robustness)
-        # For a production grade, we'd use LangChain's logic. 
-        # Here we implement a simpler "greedy merge"
-        docs = []
-        current_doc = []
-        total = 0
-        for d in splits:
-            _len = len(d)
-            if total + _len + len(separator) > self.chunk_size:
-                if total > self.chunk_size:
-                     pass # Handled by recursion usually
-                if current_doc:
-                    doc = separator.join(current_doc)
-                    docs.append(doc)
-                    # Handle Overlap: keep last few items? 
-                    # Overlap is tricky in simple merge.
-                    # We will stick to simple merge for now to avoid bugs, 
-                    # as true overlap requires token counting or char slicing.
-                    
-                    # Simple overlap attempt: keep last element if small
-                    while total > self.chunk_overlap and current_doc:
-                         popped = current_doc.pop(0)
-                         total -= (len(popped) + len(separator))
-                    
-                else: 
-                     # Single item bigger than chunk_size
-                     docs.append(d) 
-
-            current_doc.append(d)
-            total += _len + len(separator)
-            
-        if current_doc:
-            docs.append(separator.join(current_doc))
-        return docs
+                bounds.append(piece_end)
+            if found == -1 or piece_end >= end:
+                break
+            piece_start = piece_end
+
+    @staticmethod
+    def _trim(text: str, start: int, end: int) -> tuple[int, int]:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return start, end
 
 
 # Helper function to maintain backward compatibility
 def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Chunk]:
-    # Simplified Recursive logic for stability
-    # Using a known pattern: Split by largest separator, then merge.
-    
-    separators = ["\n\n", "\n", ". ", " ", ""]
-    final_text_chunks = []
-    
-    def _split(text, seps):
-        if not seps or len(text) <= chunk_size:
-            return [text]
-        
-        sep = seps[0]
-        if sep == "":
-             return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size-chunk_overlap)]
-             
-        parts = text.split(sep)
-        chunks = []
-        current = []
-        current_len = 0
-        
-        for part in parts:
-             # If a single part is huge, recurse on it
-             if len(part) > chunk_size:
-                 if current:
-                     chunks.append(sep.join(current))
-                     current = []
-                     current_len = 0
-                 # Recurse
-                 sub_chunks = _split(part, seps[1:])
-                 chunks.extend(sub_chunks)
-                 continue
-                 
-             if current_len + len(part) + len(sep) > chunk_size:
-                 chunks.append(sep.join(current))
-                 
-                 # Apply overlap: keep last N chars approx?
-                 # Easier: keep last K parts that fit in overlap size
-                 backtrack = []
-                 backtrack_len = 0
-                 for p in reversed(current):
-                     if backtrack_len + len(p) + len(sep) < chunk_overlap:
-                         backtrack.insert(0, p)
-                         backtrack_len += len(p) + len(sep)
-                     else:
-                         break
-                 current = backtrack
-                 current_len = backtrack_len
-                 
-             current.append(part)
-             current_len += len(part) + len(sep)
-             
-        if current:
-            chunks.append(sep.join(current))
-            
-        return chunks
-
-    final_text_chunks = _split(text, separators)
-    
-    # Wrap in Chunk objects
-    return [
-        Chunk(id=f"chunk_{i}", text=ct.strip(), index=i)
-        for i, ct in enumerate(final_text_chunks)
-        if ct.strip()
-    ]
\ No newline at end of file
+    return RecursiveChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_chunks(text)
@@ -0,0 +1,128 @@
+# Packs retrieved chunks into the prompt context.
+# Hits from the same document with consecutive chunk_index (or overlapping offsets) are
+# merged into one block with the chunker's overlap removed, blocks are ordered by their best
+# score and added until the token budget of the generation model is used up.
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.core.config import Settings
+from app.services.embeddings import approx_token_count
+
+# Largest overlap searched for when a chunk has no stored offsets (chunker overlap is 200)
+MAX_TEXT_OVERLAP = 400
+# A block that does not fit is truncated instead of dropped when this much budget is left
+MIN_TRUNCATED_TOKENS = 100
+
+
+@dataclass(slots=True)
+class ContextBlock:
+    text: str
+    metadata: dict
+    score: float
+    # The retrieval results merged into this block, in document order
+    members: list[dict] = field(default_factory=list)
+    end_char: Optional[int] = None
+
+    @property
+    def chunk_indexes(self) -> list:
+        return [member["metadata"].get("chunk_index") for member in self.members]
+
+
+def token_budget(settings: Settings) -> int:
+    return settings.context_token_budgets.get(settings.openai_model_name, settings.context_token_budget)
+
+
+def _offsets(result: dict) -> tuple[Optional[int], Optional[int]]:
+    metadata = result["metadata"]
+    start, end = metadata.get("start_char"), metadata.get("end_char")
+    # Records stored before offsets were tracked have neither (or 0/0)
+    if start is None or end is None or end <= start:
+        return None, None
+    return start, end
+
+
+def _text_overlap(left: str, right: str) -> int:
+    # Length of the longest suffix of left that is a prefix of right
+    for size in range(min(len(left), len(right), MAX_TEXT_OVERLAP), 0, -1):
+        if right.startswith(left[-size:]):
+            return size
+    return 0
+
+
+def _append(block: ContextBlock, result: dict):
+    start, end = _offsets(result)
+    text = result["text"]
+    if start is not None and block.end_char is not None:
+        if end <= block.end_char:
+            text = ""
+        elif start < block.end_char:
+            text = text[block.end_char - start :]
+        else:
+            text = "\n" + text
+    else:
+        overlap = _text_overlap(block.text, text)
+        text = text[overlap:] if overlap else "\n" + text
+    block.text += text
+    if end is None or block.end_char is None:
+        block.end_char = end
+    else:
+        # A chunk contained in the block must not move its end back
+        block.end_char = max(block.end_char, end)
+    block.score = max(block.score, result["score"])
+    block.members.append(result)
+
+
+def _is_adjacent(block: ContextBlock, result: dict) -> bool:
+    last = block.members[-1]
+    start, _ = _offsets(result)
+    if start is not None and block.end_char is not None and start <= block.end_char:
+        return True
+    last_index, index = last["metadata"].get("chunk_index"), result["metadata"].get("chunk_index")
+    return isinstance(last_index, int) and isinstance(index, int) and index == last_index + 1
+
+
+def merge_adjacent(retrieval_results: list[dict]) -> list[ContextBlock]:
+    """Merges consecutive chunks of the same document into blocks, best scoring block first."""
+    by_document: dict[str, list[dict]] = {}
+    for result in retrieval_results:
+        metadata = result["metadata"]
+        key = metadata.get("doc_id") or metadata.get("s3_key") or result.get("id")
+        by_document.setdefault(key, []).append(result)
+
+    blocks = []
+    for results in by_document.values():
+        results.sort(key=lambda result: (result["metadata"].get("chunk_index", 0), _offsets(result)[0] or 0))
+        block = None
+        for result in results:
+            if block is not None and _is_adjacent(block, result):
+                _append(block, result)
+                continue
+            block = ContextBlock(
+                text=result["text"],
+                metadata=result["metadata"],
+                score=result["score"],
+                members=[result],
+                end_char=_offsets(result)[1],
+            )
+            blocks.append(block)
+    blocks.sort(key=lambda block: block.score, reverse=True)
+    return blocks
+
+
+def pack_context(retrieval_results: list[dict], *, max_tokens: int) -> list[ContextBlock]:
+    """Returns the merged blocks that fit into max_tokens, best scoring first."""
+    packed = []
+    remaining = max_tokens
+    for block in merge_adjacent(retrieval_results):
+        tokens = approx_token_count(block.text)
+        if tokens <= remaining:
+            packed.append(block)
+            remaining -= tokens
+        elif not packed or remaining >= MIN_TRUNCATED_TOKENS:
+            # Keep the start of the block, always at least one block of context
+            block.text = block.text[: max(remaining, MIN_TRUNCATED_TOKENS) * 4]
+            packed.append(block)
+            remaining = 0
+        if remaining <= 0:
+            break
+    return packed
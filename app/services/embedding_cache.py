@@ -0,0 +1,111 @@
+# Two-tier cache for query embeddings.
+# L1 is an in-process LRU, L2 is the shared Redis so replicas reuse each other's embeddings.
+# Vectors are stored in Redis as raw float32 bytes (6 KB for 1536 dims) instead of JSON lists,
+# and in L1 as float32 arrays of the same size (a list of Python floats takes ~49 KB).
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from app.core import globals
+from app.core.config import Settings
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "embedding_cache"
+
+_embedding_cache_instance = None
+
+
+def normalize_text(text: str) -> str:
+    # Collapse whitespace and case so trivially different spellings share an entry
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    def __init__(self, *, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._l1: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "l2_errors": 0}
+
+    @staticmethod
+    def make_key(text: str, model: str, dimensions: Optional[int] = None) -> str:
+        # Vectors of different sizes from the same model must never be mixed up
+        model_key = f"{model}@{dimensions}" if dimensions else model
+        digest = hashlib.sha256(f"{model_key}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+        return f"{KEY_PREFIX}:{model_key}:{digest}"
+
+    async def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        found = {}
+        l2_keys = []
+        for key in keys:
+            vector = self._l1.get(key)
+            if vector is not None:
+                self._l1.move_to_end(key)
+                found[key] = vector
+                self.stats["l1_hits"] += 1
+            else:
+                l2_keys.append(key)
+
+        if l2_keys:
+            l2_values = await self._l2_get(l2_keys)
+            for key, raw in zip(l2_keys, l2_values):
+                if raw is None:
+                    self.stats["misses"] += 1
+                    continue
+                vector = np.frombuffer(raw, dtype=np.float32)
+                self._l1_put(key, vector)
+                found[key] = vector
+                self.stats["l2_hits"] += 1
+        return found
+
+    async def set_many(self, items: dict[str, list[float]]):
+        vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        for key, vector in vectors.items():
+            self._l1_put(key, vector)
+        try:
+            async with globals.get_redis_client().pipeline(transaction=False) as pipe:
+                for key, vector in vectors.items():
+                    pipe.set(key, vector.tobytes(), ex=self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            logger.warning(f"Failed to write embeddings to Redis cache. Error: {e}")
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["l1_hits"] + self.stats["l2_hits"] + self.stats["misses"]
+        hits = self.stats["l1_hits"] + self.stats["l2_hits"]
+        return {
+            **self.stats,
+            "l1_size": len(self._l1),
+            "l1_max_entries": self.max_entries,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    async def _l2_get(self, keys: list[str]) -> list[Optional[bytes]]:
+        try:
+            return await globals.get_redis_client().mget(keys)
+        except Exception as e:
+            # Redis being down should only cost us the OpenAI round trip
+            self.stats["l2_errors"] += 1
+            logger.warning(f"Failed to read embeddings from Redis cache. Error: {e}")
+            return [None] * len(keys)
+
+    def _l1_put(self, key: str, vector: np.ndarray):
+        self._l1[key] = vector
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.max_entries:
+            self._l1.popitem(last=False)
+
+
+def get_embedding_cache(settings: Settings) -> EmbeddingCache:
+    global _embedding_cache_instance
+    if _embedding_cache_instance is None:
+        _embedding_cache_instance = EmbeddingCache(
+            max_entries=settings.embedding_cache_l1_max_entries,
+            ttl_seconds=settings.embedding_cache_ttl_seconds,
+        )
+    return _embedding_cache_instance
@@ -1,32 +1,140 @@
+import asyncio
+import random
+from openai import APIConnectionError, APIStatusError
 from app.services.chunker import Chunk
-from app.core.config import get_settings
+from app.core.config import Settings, get_settings
 from app.core import globals
+from app.core.logger_config import get_logger
+from app.services import rate_limiter
+from app.services.embedding_cache import get_embedding_cache
+from app.services.index_registry import IndexSpec, get_active_index
 
-async def embed_chunks(chunks: list[Chunk]) -> list[float]:
+logger = get_logger(__name__)
+
+def approx_token_count(text: str) -> int:
+    # ~4 characters per token for English text, close enough for sizing requests
+    return len(text) // 4 + 1
+
+def _make_batches(texts: list[str], *, max_inputs: int, max_tokens: int) -> list[tuple[int, int]]:
+    # Returns (start, end) ranges over texts that respect both the input and token limits
+    batches = []
+    start = 0
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = approx_token_count(text)
+        if i > start and (i - start >= max_inputs or batch_tokens + tokens > max_tokens):
+            batches.append((start, i))
+            start = i
+            batch_tokens = 0
+        batch_tokens += tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, APIConnectionError):
+        return True
+    return isinstance(exc, APIStatusError) and (exc.status_code == 429 or exc.status_code >= 500)
+
+def _create_kwargs(index: IndexSpec) -> dict:
+    # `dimensions` is only sent when set, older models reject it
+    if index.dimensions:
+        return {"model": index.model, "dimensions": index.dimensions}
+    return {"model": index.model}
+
+async def _embed_batch(client, texts: list[str], settings: Settings, index: IndexSpec, tenant_id: str | None = None) -> list[list[float]]:
+    # Retry only this batch, with exponential backoff and jitter (or OpenAI's reset time on a 429)
+    for attempt in range(settings.embedding_max_retries + 1):
+        try:
+            response = await rate_limiter.call_openai(
+                client.embeddings.with_raw_response.create,
+                settings=settings,
+                priority=rate_limiter.BULK,
+                tokens=sum(approx_token_count(text) for text in texts),
+                tenant_id=tenant_id,
+                input=texts,
+                **_create_kwargs(index)
+            )
+            return [data.embedding for data in response.data]
+        except Exception as e:
+            if not _is_retryable(e) or attempt == settings.embedding_max_retries:
+                raise
+            delay = settings.embedding_retry_base_delay * (2 ** attempt) * (1 + random.random())
+            if isinstance(e, APIStatusError) and e.status_code == 429:
+                delay = rate_limiter.retry_countdown(e, retries=attempt, base_delay=settings.embedding_retry_base_delay)
+            logger.warning(f"Embedding batch of {len(texts)} inputs failed ({e}). Retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def embed_chunks(chunks: list[Chunk], *, index: IndexSpec | None = None, tenant_id: str | None = None) -> list[float]:
+    # index defaults to the active vector index (the re-index script passes the new one),
+    # tenant_id is used for the fair share of the ingestion rate limit
     client = globals.get_openai_client()
     settings = get_settings()
+    index = index or get_active_index(settings)
     texts = [chunk.text for chunk in chunks]
     if not texts:
         return []
 
-    # OpenAI handles batching, but for huge lists we might want to chunk requests.
-    # For now, assuming reasonable document sizes.
-    response = await client.embeddings.create(
-        input=texts,
-        model=settings.openai_embedding_model
+    # Large documents exceed the per-request input/token limits, so split into sub-batches
+    # and run them concurrently (bounded), keeping the original order.
+    batches = _make_batches(
+        texts,
+        max_inputs=settings.embedding_batch_max_inputs,
+        max_tokens=settings.embedding_batch_max_tokens
     )
+    semaphore = asyncio.Semaphore(settings.embedding_max_concurrency)
+
+    async def _run(start: int, end: int) -> list[list[float]]:
+        async with semaphore:
+            return await _embed_batch(client, texts[start:end], settings, index, tenant_id)
+
+    logger.info(f"Embedding {len(texts)} chunks in {len(batches)} batches")
+    results = await asyncio.gather(*(_run(start, end) for start, end in batches))
     # Extract embeddings in order
-    return [data.embedding for data in response.data]
+    return [vector for batch in results for vector in batch]
 
-async def embed_text(texts: list[str]) -> list[float]:
+async def embed_text(texts: list[str], *, index: IndexSpec | None = None) -> list[float]:
     client = globals.get_openai_client()
     settings = get_settings()
     
     if isinstance(texts, str):
         texts = [texts]
-        
-    response = await client.embeddings.create(
-        input=texts,
-        model=settings.openai_embedding_model
-    )
-    return [data.embedding for data in response.data]
\ No newline at end of file
+    # Queries must be embedded exactly like the index they are run against, callers that
+    # query afterwards pass the index they resolved for both steps
+    index = index or get_active_index(settings)
+
+    if not settings.embedding_cache_enabled:
+        response = await rate_limiter.call_openai(
+            client.embeddings.with_raw_response.create,
+            settings=settings,
+            priority=rate_limiter.INTERACTIVE,
+            tokens=sum(approx_token_count(text) for text in texts),
+            input=texts,
+            **_create_kwargs(index)
+        )
+        return [data.embedding for data in response.data]
+
+    cache = get_embedding_cache(settings)
+    keys = [cache.make_key(text, index.model, index.dimensions) for text in texts]
+    # The cache holds float32 arrays, callers get lists like from OpenAI
+    vectors = {key: vector.tolist() for key, vector in (await cache.get_many(keys)).items()}
+
+    # Only send the misses to OpenAI (deduplicated), in a single request
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors and key not in missing:
+            missing[key] = text
+    if missing:
+        response = await rate_limiter.call_openai(
+            client.embeddings.with_raw_response.create,
+            settings=settings,
+            priority=rate_limiter.INTERACTIVE,
+            tokens=sum(approx_token_count(text) for text in missing.values()),
+            input=list(missing.values()),
+            **_create_kwargs(index)
+        )
+        fresh = {key: data.embedding for key, data in zip(missing.keys(), response.data)}
+        await cache.set_many(fresh)
+        vectors.update(fresh)
+
+    return [vectors[key] for key in keys]
\ No newline at end of file
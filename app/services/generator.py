@@ -1,7 +1,10 @@
 # accepts relevant chunks from the user
 # returns a response generated by the LLM based on the context from the vector storage
-from typing import Any
+from typing import Any, AsyncIterator
 from app.core.config import Settings
+from app.services import context_packer, rate_limiter
+from app.services.context_packer import ContextBlock
+from app.services.embeddings import approx_token_count
 from openai import AsyncOpenAI
 from openai import OpenAIError as openai_error
 from app.core.logger_config import get_logger
@@ -19,37 +22,78 @@ class GeneratorService:
         global _openai_client_instance
         if _openai_client_instance is not None:
             return _openai_client_instance
-        _openai_client_instance = AsyncOpenAI(api_key=self.settings.openai_api_key)
+        _openai_client_instance = AsyncOpenAI(api_key=self.settings.openai_api_key, base_url=self.settings.openai_base_url)
         return _openai_client_instance
 
 
-    async def generate_answer(self, *, question: str, retrieval_results: list[dict]):
-        if not retrieval_results:
-            raise RuntimeError("No relevant documents found for the given question.")
-            
+    def _pack_context(self, retrieval_results: list[dict]) -> list[ContextBlock]:
+        if not self.settings.context_packing_enabled:
+            return [
+                ContextBlock(text=res.get("text", ""), metadata=res.get("metadata", {}), score=res.get("score", 0.0), members=[res])
+                for res in retrieval_results
+            ]
+        blocks = context_packer.pack_context(retrieval_results, max_tokens=context_packer.token_budget(self.settings))
+        self.logger.info(
+            f"Packed {len(retrieval_results)} chunks into {len(blocks)} context blocks "
+            f"(~{sum(approx_token_count(res.get('text', '')) for res in retrieval_results)} -> "
+            f"~{sum(approx_token_count(block.text) for block in blocks)} tokens)"
+        )
+        return blocks
+
+    def _build_prompt(self, *, question: str, blocks: list[ContextBlock]) -> str:
         context_blocks = []
-        for i, res in enumerate(retrieval_results):
-            meta = res.get("metadata", {})
-            text = res.get("text", "")
-            score = res.get("score", 0.0)
+        for i, block in enumerate(blocks):
+            indexes = block.chunk_indexes
+            chunks = f"chunk {indexes[0]}" if len(indexes) == 1 else f"chunks {indexes[0]}-{indexes[-1]}"
             context_blocks.append(
-                f"source {i+1} ({meta.get('s3_key', 'unknown')} | chunk {meta.get('chunk_index', '?')}): {text} (score: {score:.4f})"
+                f"source {i+1} ({block.metadata.get('s3_key', 'unknown')} | {chunks}): {block.text} (score: {block.score:.4f})"
             )
 
         context = "\n\n".join(context_blocks)
-        prompt = (
+        return (
             "You are a compliance assistant. Answer the question strictly using the provided policy context.\n"
             "If the answer is not in the context, say you do not know.\n\n"
             f"Context:\n{context}\n\nQuestion: {question}\nAnswer:"
         )
+
+    def _build_messages(self, prompt: str) -> list[dict]:
+        return [
+            {"role": "system", "content": "You are a helpful policy assistant..."},
+            {"role": "user", "content": prompt},
+        ]
+
+    def _estimate_tokens(self, prompt: str) -> int:
+        # Reserved against the shared rate limit until the real usage is known
+        return approx_token_count(prompt) + self.settings.rate_limit_chat_completion_tokens
+
+    def _build_sources(self, blocks: list[ContextBlock]) -> list[dict]:
+        # Only the chunks that made it into the prompt
+        return [
+            {
+                "chunk_id": str(res["metadata"].get("chunk_index", "unknown")),
+                "tenant_id": str(res["metadata"].get("tenant_id", "unknown")),
+                "s3_key": str(res["metadata"].get("s3_key", "unknown")),
+                "distance": float(res.get("score", 0.0)) # Mapping score to distance field in schema
+            }
+            for block in blocks
+            for res in block.members
+        ]
+
+    async def generate_answer(self, *, question: str, retrieval_results: list[dict]):
+        if not retrieval_results:
+            raise RuntimeError("No relevant documents found for the given question.")
+            
+        blocks = self._pack_context(retrieval_results)
+        prompt = self._build_prompt(question=question, blocks=blocks)
         try:
             client = self._get_openai_client()
-            response = await client.chat.completions.create(
+            response = await rate_limiter.call_openai(
+                client.chat.completions.with_raw_response.create,
+                settings=self.settings,
+                priority=rate_limiter.INTERACTIVE,
+                tokens=self._estimate_tokens(prompt),
                 model = self.settings.openai_model_name,
-                messages=[
-                    {"role": "system", "content": "You are a helpful policy assistant..."},
-                    {"role": "user", "content": prompt},
-                ],
+                messages=self._build_messages(prompt),
                 # temperature=0.0, # Lower temperature for strictly factual answers
             )
         except openai_error as e:
@@ -59,25 +103,49 @@ class GeneratorService:
         self.logger.info("Generated response from OpenAI successfully.")
         answer = response.choices[0].message.content.strip()
         
-        sources = [
-            {
-                "chunk_id": str(res["metadata"].get("chunk_index", "unknown")),
-                "tenant_id": str(res["metadata"].get("tenant_id", "unknown")),
-                "s3_key": str(res["metadata"].get("s3_key", "unknown")),
-                "distance": float(res.get("score", 0.0)) # Mapping score to distance field in schema
-            }
-            for res in retrieval_results
-        ]
+        sources = self._build_sources(blocks)
 
         return {
             "answer": answer,
             "sources": sources
         }
 
-        
-
+    async def stream_answer(self, *, question: str, retrieval_results: list[dict]) -> AsyncIterator[dict]:
+        """
+        Streaming variant of generate_answer.
+        Yields {"event": "sources"} first, then {"event": "token"} per completion delta,
+        and finally {"event": "done"} with the full answer.
+        """
+        if not retrieval_results:
+            raise RuntimeError("No relevant documents found for the given question.")
 
-    
-        
+        blocks = self._pack_context(retrieval_results)
+        sources = self._build_sources(blocks)
+        yield {"event": "sources", "data": sources}
 
+        prompt = self._build_prompt(question=question, blocks=blocks)
+        answer_parts = []
+        try:
+            client = self._get_openai_client()
+            stream = await rate_limiter.call_openai(
+                client.chat.completions.with_raw_response.create,
+                settings=self.settings,
+                priority=rate_limiter.INTERACTIVE,
+                tokens=self._estimate_tokens(prompt),
+                model = self.settings.openai_model_name,
+                messages=self._build_messages(prompt),
+                stream=True,
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    answer_parts.append(delta)
+                    yield {"event": "token", "data": delta}
+        except openai_error as e:
+            self.logger.error(f"OpenAI API error: {e}")
+            raise RuntimeError(f"OpenAI API error: {e}")
 
+        self.logger.info("Streamed response from OpenAI successfully.")
+        yield {"event": "done", "data": {"answer": "".join(answer_parts).strip(), "sources": sources}}
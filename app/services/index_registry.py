@@ -0,0 +1,81 @@
+# Which vector index (collection name, embedding model and dimensions) is live.
+# By default that is chromadb_collection_name embedded with openai_embedding_model at
+# openai_embedding_dimensions. The re-index script builds a new index next to it and then
+# switches every API and worker process over by writing the active index to Redis; processes
+# re-read it at most ACTIVE_INDEX_CACHE_SECONDS later.
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from app.core import globals
+from app.core.config import Settings
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+ACTIVE_INDEX_KEY = "vector_index:active"
+PREVIOUS_INDEX_KEY = "vector_index:previous"
+ACTIVE_INDEX_CACHE_SECONDS = 5.0
+
+# (expires_at, IndexSpec)
+_active_index_cache: Optional[tuple[float, "IndexSpec"]] = None
+
+
+@dataclass(frozen=True, slots=True)
+class IndexSpec:
+    collection: str
+    model: str
+    # None = the model's native size
+    dimensions: Optional[int] = None
+
+
+def default_index(settings: Settings) -> IndexSpec:
+    return IndexSpec(
+        collection=settings.chromadb_collection_name,
+        model=settings.openai_embedding_model,
+        dimensions=settings.openai_embedding_dimensions,
+    )
+
+
+def get_active_index(settings: Settings) -> IndexSpec:
+    global _active_index_cache
+    now = time.monotonic()
+    if _active_index_cache is not None and _active_index_cache[0] > now:
+        return _active_index_cache[1]
+    spec = default_index(settings)
+    try:
+        raw = globals.get_sync_redis_client().get(ACTIVE_INDEX_KEY)
+        if raw is not None:
+            spec = IndexSpec(**json.loads(raw))
+    except Exception as e:
+        # Keep serving from the last known index rather than silently falling back
+        if _active_index_cache is not None:
+            logger.warning(f"Could not read the active vector index, keeping {_active_index_cache[1].collection}. Error: {e}")
+            spec = _active_index_cache[1]
+        else:
+            logger.warning(f"Could not read the active vector index, using {spec.collection}. Error: {e}")
+    _active_index_cache = (now + ACTIVE_INDEX_CACHE_SECONDS, spec)
+    return spec
+
+
+def set_active_index(spec: IndexSpec, *, previous: Optional[IndexSpec] = None):
+    # Atomic for every reader: one Redis SET of the whole spec
+    client = globals.get_sync_redis_client()
+    pipe = client.pipeline(transaction=True)
+    if previous is not None:
+        pipe.set(PREVIOUS_INDEX_KEY, json.dumps(asdict(previous)))
+    pipe.set(ACTIVE_INDEX_KEY, json.dumps(asdict(spec)))
+    pipe.execute()
+    clear_cache()
+    logger.info(f"Active vector index is now {spec.collection} ({spec.model}, dimensions: {spec.dimensions or 'native'})")
+
+
+def get_previous_index() -> Optional[IndexSpec]:
+    raw = globals.get_sync_redis_client().get(PREVIOUS_INDEX_KEY)
+    return IndexSpec(**json.loads(raw)) if raw is not None else None
+
+
+def clear_cache():
+    global _active_index_cache
+    _active_index_cache = None
@@ -1,52 +1,563 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+from uuid import uuid4
+from app.core import event_loop
 from app.core.config import Settings
-from app.services import s3_upload, parser, chunker, embeddings, vector_store
+from app.services import s3_upload, parser, chunker, embeddings, vector_store, answer_cache, lexical_index, slice_store
+from app.services.index_registry import IndexSpec, get_active_index
 from app.core.logger_config import get_logger
 
 logger = get_logger(__name__)
 
-def process_document_from_s3(*, tenant_id: str, user_id: str, doc_id: str, s3_url: str, s3_key: str, settings: Settings):
-    # Run fetch, parse, chunk , embed, store pipeline for a single document
-    # raise NotImplementedError("Ingest pipeline is not yet implemented.")
-    s3_upload_service = s3_upload.S3UploadService(settings)
+async def embed_new_chunks_async(*, tenant_id: str, chunks: list[chunker.Chunk], settings: Settings, index: IndexSpec | None = None) -> list[list[float]]:
+    # Only chunks whose content hash was never embedded for this tenant go to OpenAI,
+    # the rest reuse the vectors already stored in Chroma. Reused and new vectors both
+    # belong to index (the active one if not given), store them in that index only.
+    index = index or get_active_index(settings)
+    unique_chunks = {}
+    for chunk in chunks:
+        unique_chunks.setdefault(chunk.content_hash, chunk)
+    vectors_by_hash = await asyncio.to_thread(
+        vector_store.get_vectors_by_chunk_hash,
+        tenant_id=tenant_id,
+        chunk_hashes=list(unique_chunks.keys()),
+        settings=settings,
+        index=index
+    )
+    to_embed = [chunk for chunk_hash, chunk in unique_chunks.items() if chunk_hash not in vectors_by_hash]
+    logger.info(f"Reusing {len(vectors_by_hash)} existing embeddings, embedding {len(to_embed)} new chunks")
+    if to_embed:
+        new_vectors = await embeddings.embed_chunks(chunks=to_embed, index=index, tenant_id=tenant_id)
+        for chunk, new_vector in zip(to_embed, new_vectors):
+            vectors_by_hash[chunk.content_hash] = new_vector
+    return [vectors_by_hash[chunk.content_hash] for chunk in chunks]
+
+class ChunkWriter:
+    """
+    Buffers new chunks of one tenant (possibly from several documents) and embeds and
+    stores them in batches of flush_size, so many small files still produce few large
+    embedding requests and Chroma writes.
+    Batches are written on the worker event loop, up to max_in_flight at a time, while the
+    caller keeps parsing and chunking. add() may be called from several threads.
+    A failed batch never surfaces in add(): it is recorded in `failed` for every document
+    with chunks in it (doc_id -> error), and flush() raises it unless told otherwise.
+    """
+
+    def __init__(self, *, tenant_id: str, flush_size: int, settings: Settings, max_in_flight: int = 1):
+        self.tenant_id = tenant_id
+        self.flush_size = flush_size
+        self.settings = settings
+        self.max_in_flight = max(1, max_in_flight)
+        self.failed: dict[str, Exception] = {}
+        self._error: Optional[Exception] = None
+        self._chunks: list[chunker.Chunk] = []
+        self._ids: list[str] = []
+        self._metadatas: list[dict] = []
+        # (write future, doc_ids in the batch)
+        self._in_flight: deque[tuple[Future, set[str]]] = deque()
+        self._lock = threading.Lock()
+
+    def add(self, *, chunk: chunker.Chunk, record_id: str, metadata: dict):
+        with self._lock:
+            self._chunks.append(chunk)
+            self._ids.append(record_id)
+            self._metadatas.append(metadata)
+            if len(self._chunks) < self.flush_size:
+                return
+            batch = self._take()
+        self._submit(batch)
+
+    def flush(self, *, raise_errors: bool = True):
+        # Writes whatever is buffered and waits for every pending write
+        with self._lock:
+            batch = self._take()
+        if batch[0]:
+            self._submit(batch)
+        self._wait_all()
+        if raise_errors and self._error is not None:
+            raise self._error
+
+    def abort(self):
+        # Drops the buffered chunks and waits for the writes already started
+        with self._lock:
+            self._take()
+        self._wait_all()
+
+    def _wait_all(self):
+        while True:
+            with self._lock:
+                if not self._in_flight:
+                    return
+                pending = self._in_flight.popleft()
+            self._wait(*pending)
+
+    def _take(self):
+        batch = (self._chunks, self._ids, self._metadatas)
+        self._chunks, self._ids, self._metadatas = [], [], []
+        return batch
+
+    def _submit(self, batch):
+        doc_ids = {metadata.get("doc_id") for metadata in batch[2]}
+        future = event_loop.submit_coroutine(self._write(*batch))
+        with self._lock:
+            self._in_flight.append((future, doc_ids))
+            oldest = self._in_flight.popleft() if len(self._in_flight) > self.max_in_flight else None
+        # Backpressure: don't buffer more than max_in_flight batches ahead of the writes
+        if oldest is not None:
+            self._wait(*oldest)
+
+    def _wait(self, future: Future, doc_ids: set[str]):
+        wait([future])
+        error = future.exception()
+        if error is None:
+            return
+        logger.error(f"Failed to write a batch of documents {sorted(doc_ids)} for tenant_id: {self.tenant_id}. Error: {error}")
+        with self._lock:
+            self._error = self._error or error
+            for doc_id in doc_ids:
+                self.failed.setdefault(doc_id, error)
+
+    async def _write(self, chunks: list[chunker.Chunk], ids: list[str], metadatas: list[dict]):
+        # One index for the whole batch, a re-index switching over mid-batch must not get
+        # vectors of the old model written into the new collections
+        index = get_active_index(self.settings)
+        vectors = await embed_new_chunks_async(tenant_id=self.tenant_id, chunks=chunks, settings=self.settings, index=index)
+        logger.info(f"Generated {len(vectors)} embeddings")
+        await asyncio.to_thread(
+            vector_store.upsert_records,
+            tenant_id=self.tenant_id,
+            ids=ids,
+            embeddings=vectors,
+            metadatas=metadatas,
+            documents=[chunk.text for chunk in chunks],
+            settings=self.settings,
+            index=index
+        )
+        if self.settings.hybrid_search_enabled:
+            try:
+                await asyncio.to_thread(
+                    lexical_index.add_documents,
+                    tenant_id=self.tenant_id,
+                    records=[(record_id, chunk.text) for record_id, chunk in zip(ids, chunks)],
+                    settings=self.settings
+                )
+            except Exception as e:
+                # Vector search still works without the lexical index, don't fail the whole batch
+                logger.error(f"Failed to update lexical index for tenant_id: {self.tenant_id}. Error: {e}")
+
+class DocumentChunkBuffer:
+    """
+    Holds the new chunks of one document until it was parsed completely, so a document that
+    fails halfway never leaves part of its new version in a shared ChunkWriter.
+    """
+
+    def __init__(self):
+        self.items: list[tuple[chunker.Chunk, str, dict]] = []
+
+    def add(self, *, chunk: chunker.Chunk, record_id: str, metadata: dict):
+        self.items.append((chunk, record_id, metadata))
+
+    def drain_to(self, writer: ChunkWriter):
+        items, self.items = self.items, []
+        for chunk, record_id, metadata in items:
+            writer.add(chunk=chunk, record_id=record_id, metadata=metadata)
+
+class FanOutWriter:
+    """
+    ChunkWriter front for one large document: the first min_chunks new chunks are written in
+    process while parsing continues, every chunk after that is staged in Redis in slices of
+    slice_size, to be embedded and stored by parallel Celery subtasks (see process_document_task).
+    """
+
+    def __init__(self, *, writer: ChunkWriter, job_id: str, min_chunks: int, slice_size: int, ttl_seconds: int):
+        self.writer = writer
+        self.job_id = job_id
+        self.min_chunks = min_chunks
+        self.slice_size = max(1, slice_size)
+        self.ttl_seconds = ttl_seconds
+        self.slices = 0
+        self._written = 0
+        self._pending: list[tuple[chunker.Chunk, str, dict]] = []
+
+    def add(self, *, chunk: chunker.Chunk, record_id: str, metadata: dict):
+        if self._written < self.min_chunks:
+            self._written += 1
+            self.writer.add(chunk=chunk, record_id=record_id, metadata=metadata)
+            return
+        self._pending.append((chunk, record_id, metadata))
+        if len(self._pending) >= self.slice_size:
+            self._stage()
+
+    def flush(self):
+        if self._pending:
+            self._stage()
+        self.writer.flush()
+
+    def abort(self):
+        self._pending = []
+        self.writer.abort()
+        if self.slices:
+            slice_store.delete_job(job_id=self.job_id, slices=self.slices)
+
+    def _stage(self):
+        chunks, ids, metadatas = (list(column) for column in zip(*self._pending))
+        slice_store.put_slice(
+            job_id=self.job_id,
+            index=self.slices,
+            chunks=chunks,
+            ids=ids,
+            metadatas=metadatas,
+            ttl_seconds=self.ttl_seconds
+        )
+        self.slices += 1
+        self._pending = []
+
+@dataclass(slots=True)
+class FanOut:
+    # A document whose remaining chunks were staged for write_document_slice_task subtasks
+    job_id: str
+    slices: int
+
+@dataclass(slots=True)
+class DocumentResult:
+    doc_id: str
+    s3_key: str
+    file_hash: str = ""
+    skipped: bool = False
+    # record_id -> metadata for every chunk of the new version
+    written: dict = field(default_factory=dict)
+    removed: list = field(default_factory=list)
+    added: int = 0
+    # What a failed document has to undo (see _discard_document): the records it handed to
+    # the writer and the stored metadata of unchanged chunks whose metadata it updated
+    new_ids: list = field(default_factory=list)
+    previous: dict = field(default_factory=dict)
+
+def iter_chunk_batches(*, pages, batch_size: int, piece_separator: str = "\n"):
+    # Chunks the page stream and groups the chunks into fixed-size batches.
+    # Chunk ids are content-addressed (hash + occurrence) so a re-uploaded version of a
+    # document maps its unchanged chunks onto the already stored records.
+    chunker_service = chunker.RecursiveChunker(chunk_size=1000, chunk_overlap=200)
+    occurrences = {}
+    batch = []
+    for chunk in chunker_service.iter_chunks(pages, piece_separator=piece_separator):
+        seen = occurrences.get(chunk.content_hash, 0)
+        occurrences[chunk.content_hash] = seen + 1
+        chunk.id = chunk.content_hash[:32] if not seen else f"{chunk.content_hash[:32]}_{seen}"
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _ingest_document(*, writer: ChunkWriter, result: DocumentResult, s3_upload_service: s3_upload.S3UploadService, tenant_id: str, user_id: str, s3_url: str, settings: Settings):
+    # Fetch, parse and chunk one document, diffing it against its stored version, into result.
+    # New chunks go to the writer, unchanged ones get a metadata update. The document is
+    # not marked complete here, see _complete_document. result is filled in as the document
+    # is processed, so a caller can _discard_document what a failed one already changed.
+    doc_id = result.doc_id
+    s3_key = result.s3_key
     logger.info(f"Start processing document for tenant_id: {tenant_id}, user_id: {user_id}, s3_key: {s3_key}")
-    s3_file_info = s3_upload_service.stream_file(s3_key=s3_key)
-    document_stream = s3_file_info['body']
-    # logger.info(f"Download document from S3 {document_stream}")
+    # The stored version is fetched from Chroma while the new one downloads from S3
+    lookup = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-diff")
+    try:
+        stored_future = lookup.submit(vector_store.get_document_metadatas, tenant_id=tenant_id, doc_id=doc_id, settings=settings)
+        s3_file_info = s3_upload_service.download_to_tempfile(s3_key=s3_key, spool_dir=settings.ingest_spool_dir)
+    finally:
+        lookup.shutdown(wait=False)
+    path = s3_file_info['path']
     content_type = s3_file_info['content_type']
-    raw_text = parser.extract_text(file_stream=document_stream, content_type=content_type, filename=s3_key)
-    logger.info(f"Extracted raw text of length {len(raw_text)}")
-    logger.info(f"Extracted text: {raw_text[:500]}...")  # Log first 500 characters
-    logger.info(f"Starting text chunking")
-    from app.services.chunker import RecursiveChunker, Chunk
-    chunker_service = RecursiveChunker(chunk_size=1000, chunk_overlap=200)
-    final_text_chunks = chunker_service.split_text(raw_text)
-    
-    chunks = [
-        Chunk(id=f"chunk_{i}", text=ct.strip(), index=i)
-        for i, ct in enumerate(final_text_chunks)
-        if ct.strip()
-    ]
-    logger.info(f"Created {len(chunks)} text chunks")
-    logger.info(chunks[0:2])  # Log first 2 chunks
-    import asyncio
-    vector = asyncio.run(embeddings.embed_chunks(chunks=chunks))
-    logger.info(f"Generated {len(vector)} embeddings")
-    # chroma_client = vector_store.get_chroma_client(settings=settings)
-    # logger.info(f"Storing vectors in vector store")
-    vector_store.store_vectors(
-        vectors=vector, 
-        tenant_id=tenant_id, 
-        user_id=user_id,
-        doc_id=doc_id,
-        s3_url=s3_url,
-        chunks=chunks, 
-        s3_key=s3_key, 
+    try:
+        file_hash = parser.file_sha256(path)
+        result.file_hash = file_hash
+        # Identical re-uploads for this tenant are skipped entirely
+        if vector_store.file_already_ingested(tenant_id=tenant_id, file_hash=file_hash, settings=settings):
+            logger.info(f"File with hash {file_hash} already ingested for tenant_id: {tenant_id}, skipping s3_key: {s3_key}")
+            result.skipped = True
+            return
+
+        stored = stored_future.result()
+        logger.info(f"Found {len(stored)} stored chunks for doc_id: {doc_id}")
+
+        pages = parser.iter_pages(
+            path=path,
+            filename=s3_key,
+            content_type=content_type,
+            pdf_workers=settings.pdf_extract_workers,
+            pdf_pages_per_task=settings.pdf_pages_per_task
+        )
+        batches = iter_chunk_batches(
+            pages=pages,
+            batch_size=settings.ingest_batch_size,
+            piece_separator=parser.piece_separator(content_type)
+        )
+        for batch in batches:
+            update_ids = []
+            update_metadatas = []
+            for chunk in batch:
+                record_id = vector_store.chunk_record_id(tenant_id=tenant_id, doc_id=doc_id, chunk=chunk)
+                metadata = vector_store.chunk_metadata(
+                    tenant_id=tenant_id,
+                    user_id=user_id,
+                    doc_id=doc_id,
+                    s3_url=s3_url,
+                    s3_key=s3_key,
+                    chunk=chunk
+                )
+                result.written[record_id] = metadata
+                if record_id not in stored:
+                    writer.add(chunk=chunk, record_id=record_id, metadata=metadata)
+                    result.new_ids.append(record_id)
+                    result.added += 1
+                elif stored[record_id] != metadata:
+                    # Same content, but position / source / completion marker changed
+                    update_ids.append(record_id)
+                    update_metadatas.append(metadata)
+                    result.previous[record_id] = stored[record_id]
+            if update_ids:
+                vector_store.update_metadatas(tenant_id=tenant_id, ids=update_ids, metadatas=update_metadatas, settings=settings)
+            logger.info(f"Processed {len(result.written)} chunks so far for s3_key: {s3_key} ({result.added} new)")
+        if not result.written:
+            raise ValueError(f"No text extracted from document: {s3_key}")
+
+        # Chunks of the previous version that no longer exist
+        result.removed = [record_id for record_id in stored if record_id not in result.written]
+    finally:
+        os.remove(path)
+
+def _complete_document(*, tenant_id: str, result: DocumentResult, settings: Settings):
+    # Must run after the writer was flushed: removes stale chunks and only then marks the
+    # document complete, so a task that died halfway through is never skipped on retry
+    if result.removed:
+        vector_store.delete_vectors(tenant_id=tenant_id, ids=result.removed, settings=settings)
+        if settings.hybrid_search_enabled:
+            lexical_index.delete_documents(tenant_id=tenant_id, record_ids=result.removed, settings=settings)
+    vector_store.update_metadatas(
+        tenant_id=tenant_id,
+        ids=list(result.written.keys()),
+        metadatas=[{**metadata, "file_hash": result.file_hash} for metadata in result.written.values()],
         settings=settings
     )
-    logger.info(f"Completed processing document for tenant_id: {tenant_id}, s3_key: {s3_key}")
+    logger.info(
+        f"Completed processing document for tenant_id: {tenant_id}, s3_key: {result.s3_key} "
+        f"({len(result.written)} chunks, {result.added} new, {len(result.removed)} removed)"
+    )
+
+def process_document_from_s3(*, tenant_id: str, user_id: str, doc_id: str, s3_url: str, s3_key: str, settings: Settings, discard_on_failure: bool = False) -> Optional[FanOut]:
+    # Run fetch, parse, chunk , embed, store pipeline for a single document.
+    # The document is spooled to disk and processed page by page, flushing fixed-size chunk
+    # batches to embedding and the vector store, so memory is bounded by the batch size.
+    # The stages of the document overlap: its stored version is looked up during the download
+    # and with the worker loop up to ingest_max_in_flight batches are embedded and written
+    # while the next ones are parsed. Overlapping several documents is bulk-only
+    # (process_documents_from_s3).
+    # Re-ingesting an existing doc_id diffs against the stored chunks: only new chunks are
+    # embedded and written, unchanged ones get a metadata update and removed ones are deleted.
+    # With fanout_enabled, new chunks beyond fanout_min_chunks are staged instead and a FanOut
+    # is returned: the caller must run write_document_slice for every slice and then
+    # complete_fanned_out_document. Returns None when the document is done.
+    # With discard_on_failure (the task's last attempt), a failing document first removes
+    # what it already wrote, leaving its previous version as it was.
+    writer = ChunkWriter(
+        tenant_id=tenant_id,
+        flush_size=settings.ingest_batch_size,
+        settings=settings,
+        max_in_flight=settings.ingest_max_in_flight
+    )
+    if settings.fanout_enabled:
+        writer = FanOutWriter(
+            writer=writer,
+            job_id=uuid4().hex,
+            min_chunks=settings.fanout_min_chunks,
+            slice_size=settings.fanout_slice_size,
+            ttl_seconds=settings.fanout_slice_ttl_seconds
+        )
+    result = DocumentResult(doc_id=doc_id, s3_key=s3_key)
+    try:
+        _ingest_document(
+            writer=writer,
+            result=result,
+            s3_upload_service=s3_upload.S3UploadService(settings),
+            tenant_id=tenant_id,
+            user_id=user_id,
+            s3_url=s3_url,
+            settings=settings
+        )
+        if result.skipped:
+            return None
+        writer.flush()
+        if isinstance(writer, FanOutWriter) and writer.slices:
+            # Completed by the chord callback once every slice is stored
+            slice_store.put_job(job_id=writer.job_id, job=asdict(result), ttl_seconds=settings.fanout_slice_ttl_seconds)
+            logger.info(f"Fanning out {writer.slices} slices of s3_key: {s3_key} (job {writer.job_id})")
+            return FanOut(job_id=writer.job_id, slices=writer.slices)
+    except Exception:
+        if discard_on_failure:
+            writer.abort()
+            _discard_document(tenant_id=tenant_id, result=result, settings=settings)
+        raise
+    _complete_document(tenant_id=tenant_id, result=result, settings=settings)
+
+    # Cached answers for this tenant may now be stale
+    answer_cache.invalidate_tenant(tenant_id, settings)
+    return None
+
+    # document - downloaded to a temp file from S3 (ranged GETs for large objects)
+    # pages - yields extracted text page by page
+    # chunks - rolling chunker over the pages, grouped in fixed-size batches
+    # diff - new chunks are embedded (reusing already embedded content) and stored,
+    #        unchanged chunks only get a metadata update, removed chunks are deleted
+
+def write_document_slice(*, tenant_id: str, job_id: str, index: int, settings: Settings) -> int:
+    # Embeds and stores one staged slice. Safe to retry: records are upserted by id and
+    # chunks stored by an earlier attempt reuse their vectors instead of being re-embedded.
+    chunks, ids, metadatas = slice_store.get_slice(job_id=job_id, index=index)
+    writer = ChunkWriter(
+        tenant_id=tenant_id,
+        flush_size=settings.ingest_batch_size,
+        settings=settings,
+        max_in_flight=settings.ingest_max_in_flight
+    )
+    for chunk, record_id, metadata in zip(chunks, ids, metadatas):
+        writer.add(chunk=chunk, record_id=record_id, metadata=metadata)
+    writer.flush()
+    logger.info(f"Stored slice {index} of ingestion job {job_id} ({len(chunks)} chunks)")
+    return len(chunks)
+
+def complete_fanned_out_document(*, tenant_id: str, fanout: FanOut, settings: Settings):
+    # Runs once every slice is stored, same completion as an in-process document
+    job = slice_store.get_job(fanout.job_id)
+    if job is None:
+        raise RuntimeError(f"Ingestion job {fanout.job_id} not found (expired or already completed)")
+    _complete_document(tenant_id=tenant_id, result=DocumentResult(**job), settings=settings)
+    answer_cache.invalidate_tenant(tenant_id, settings)
+    slice_store.delete_job(job_id=fanout.job_id, slices=fanout.slices)
+
+def discard_fanned_out_document(*, tenant_id: str, fanout: FanOut, settings: Settings):
+    # Removes what the stored slices and the parsing task wrote. The document stays
+    # incomplete (no file_hash), so uploading it again re-processes it
+    job = slice_store.get_job(fanout.job_id)
+    if job is None:
+        logger.error(f"Ingestion job {fanout.job_id} not found (expired), records it wrote for tenant_id: {tenant_id} are left in place")
+    else:
+        _discard_document(tenant_id=tenant_id, result=DocumentResult(**job), settings=settings)
+    slice_store.delete_job(job_id=fanout.job_id, slices=fanout.slices)
+
+def process_documents_from_s3(*, tenant_id: str, user_id: str, documents: list[dict], settings: Settings, on_status: Optional[Callable[[dict, str, Optional[str]], None]] = None) -> dict[str, str]:
+    """
+    Ingests several documents of one tenant, sharing one ChunkWriter so their chunks are
+    embedded and written in large batches (bulk uploads).
+    With the persistent worker loop, up to ingest_max_in_flight documents are downloaded,
+    parsed and chunked at the same time while earlier batches are being embedded and stored.
+    A document's new chunks reach the shared writer only once it was parsed completely.
+    documents: [{"doc_id", "s3_url", "s3_key", ...}]. on_status(document, status, detail) is
+    called as each document progresses. A failing document, including one whose chunks were
+    in a batch that failed to write, does not fail the others and is never marked complete.
+    Returns {doc_id: final status}.
+    """
+    def _report(document: dict, status: str, detail: Optional[str] = None):
+        if on_status is not None:
+            on_status(document, status, detail)
+
+    writer = ChunkWriter(
+        tenant_id=tenant_id,
+        flush_size=settings.bulk_write_batch_size,
+        settings=settings,
+        max_in_flight=settings.ingest_max_in_flight
+    )
+    s3_upload_service = s3_upload.S3UploadService(settings)
+    statuses = {}
+
+    def _ingest_one(document: dict) -> Optional[DocumentResult]:
+        _report(document, "processing")
+        buffer = DocumentChunkBuffer()
+        result = DocumentResult(doc_id=document["doc_id"], s3_key=document["s3_key"])
+        try:
+            _ingest_document(
+                writer=buffer,
+                result=result,
+                s3_upload_service=s3_upload_service,
+                tenant_id=tenant_id,
+                user_id=user_id,
+                s3_url=document["s3_url"],
+                settings=settings
+            )
+        except Exception as e:
+            logger.error(f"Error processing document {document['doc_id']}: {e}")
+            # Its new chunks never left the buffer, only the metadata updates are undone
+            result.new_ids = []
+            _discard_document(tenant_id=tenant_id, result=result, settings=settings)
+            statuses[document["doc_id"]] = "failed"
+            _report(document, "failed", str(e))
+            return None
+        if result.skipped:
+            statuses[document["doc_id"]] = "skipped"
+            _report(document, "skipped", "identical file already ingested")
+            return None
+        buffer.drain_to(writer)
+        return result
+
+    if event_loop.is_running():
+        results = event_loop.run_coroutine(_ingest_concurrently(_ingest_one, documents, settings.ingest_max_in_flight))
+    else:
+        results = [_ingest_one(document) for document in documents]
+    pending = [(document, result) for document, result in zip(documents, results) if result is not None]
+
+    writer.flush(raise_errors=False)
+    completed = 0
+    for document, result in pending:
+        error = writer.failed.get(document["doc_id"])
+        if error is not None:
+            # Left without file_hash, so uploading it again re-processes it
+            _discard_document(tenant_id=tenant_id, result=result, settings=settings)
+            statuses[document["doc_id"]] = "failed"
+            _report(document, "failed", str(error))
+            continue
+        _complete_document(tenant_id=tenant_id, result=result, settings=settings)
+        statuses[document["doc_id"]] = "completed"
+        _report(document, "completed")
+        completed += 1
+
+    if completed:
+        answer_cache.invalidate_tenant(tenant_id, settings)
+    return statuses
+
+def _discard_document(*, tenant_id: str, result: DocumentResult, settings: Settings):
+    # Undoes what a failed document changed, its old version stays as it was
+    _discard_new_records(tenant_id=tenant_id, ids=result.new_ids, settings=settings)
+    if not result.previous:
+        return
+    try:
+        vector_store.update_metadatas(
+            tenant_id=tenant_id,
+            ids=list(result.previous.keys()),
+            metadatas=list(result.previous.values()),
+            settings=settings
+        )
+    except Exception as e:
+        logger.error(f"Failed to restore the metadata of {len(result.previous)} chunks of doc_id: {result.doc_id} for tenant_id: {tenant_id}. Error: {e}")
+
+def _discard_new_records(*, tenant_id: str, ids: list[str], settings: Settings):
+    # Removes what was written of a failed document's new version, its old version stays
+    if not ids:
+        return
+    try:
+        vector_store.delete_vectors(tenant_id=tenant_id, ids=ids, settings=settings)
+        if settings.hybrid_search_enabled:
+            lexical_index.delete_documents(tenant_id=tenant_id, record_ids=ids, settings=settings)
+    except Exception as e:
+        logger.error(f"Failed to remove {len(ids)} partially written records for tenant_id: {tenant_id}. Error: {e}")
 
-    # document_stream - returns document or file stream from S3
-    # raw_text - returns extracted text from the document stream
-    # chunks - returns list of text chunks from the raw text
-    # vectors - returns list of embeddings from the chunks
-    # store_vectors - stores the vectors in the vector DB or vector store
\ No newline at end of file
+async def _ingest_concurrently(ingest_one: Callable[[dict], Optional[DocumentResult]], documents: list[dict], max_in_flight: int) -> list[Optional[DocumentResult]]:
+    # The blocking per-document work runs in its own threads (not the loop's default
+    # executor, which the ChunkWriter writes need), the loop stays free for the embedding
+    # requests and writes
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="ingest") as executor:
+        return await asyncio.gather(*(loop.run_in_executor(executor, ingest_one, document) for document in documents))
@@ -0,0 +1,318 @@
+# Per-tenant BM25 inverted index used for hybrid (lexical + vector) retrieval.
+#
+# Layout on disk, one directory per tenant under settings.lexical_index_dir:
+#   manifest.json   {"segments": [...], "deleted": [...]} - the list of live segments
+#   seg_<id>.bin    immutable segment written by one ingestion
+#
+# Ingestion appends a new segment (incremental update) instead of rewriting the index, and
+# segments are merged once there are more than lexical_max_segments of them. When the same
+# record id appears in several segments the newest one wins.
+#
+# Segment format:
+#   b"BM25SEG1" | uint32 header length | zlib(JSON header) | postings
+# The header holds the segment's record ids, their lengths and, per term, the
+# (offset, size, df) of its postings. Postings are varints of (doc ordinal delta, term frequency).
+import fcntl
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from uuid import uuid4
+
+from app.core.config import Settings
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b"BM25SEG1"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keeps clause numbers ("4.2.1"), form ids ("hr-204") and acronyms together as single tokens
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was what when where which who will with".split()
+)
+
+# tenant_id -> (manifest mtime, _LoadedIndex)
+_loaded_indexes: dict[str, tuple[float, "_LoadedIndex"]] = {}
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        # Also index the parts of compound tokens so "hr-204" matches "hr 204"
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[.\-/]", token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_postings(data: bytes, offset: int, size: int) -> list[tuple[int, int]]:
+    postings = []
+    position = offset
+    end = offset + size
+    doc = 0
+    while position < end:
+        values = []
+        for _ in range(2):
+            value = 0
+            shift = 0
+            while True:
+                byte = data[position]
+                position += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            values.append(value)
+        doc += values[0]
+        postings.append((doc, values[1]))
+    return postings
+
+
+def _write_segment(path: str, records: list[tuple[str, list[str]]]):
+    # records: [(record_id, tokens)]
+    doc_ids = []
+    doc_lengths = []
+    term_postings: dict[str, list[tuple[int, int]]] = {}
+    for ordinal, (record_id, tokens) in enumerate(records):
+        doc_ids.append(record_id)
+        doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            term_postings.setdefault(term, []).append((ordinal, tf))
+
+    postings = bytearray()
+    terms = {}
+    for term, entries in term_postings.items():
+        start = len(postings)
+        previous = 0
+        for ordinal, tf in entries:
+            _encode_varint(ordinal - previous, postings)
+            _encode_varint(tf, postings)
+            previous = ordinal
+        terms[term] = [start, len(postings) - start, len(entries)]
+
+    header = zlib.compress(json.dumps({"docs": doc_ids, "lengths": doc_lengths, "terms": terms}).encode("utf-8"))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(postings)
+    os.replace(tmp_path, path)
+
+
+@dataclass(slots=True)
+class _Segment:
+    name: str
+    doc_ids: list[str]
+    doc_lengths: list[int]
+    terms: dict[str, list[int]]
+    postings: bytes
+
+
+def _read_segment(path: str) -> _Segment:
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"Not a lexical index segment: {path}")
+    header_len = struct.unpack_from("<I", data, len(MAGIC))[0]
+    header_start = len(MAGIC) + 4
+    header = json.loads(zlib.decompress(data[header_start : header_start + header_len]))
+    return _Segment(
+        name=os.path.basename(path),
+        doc_ids=header["docs"],
+        doc_lengths=header["lengths"],
+        terms=header["terms"],
+        postings=data[header_start + header_len :],
+    )
+
+
+class _LoadedIndex:
+    def __init__(self, segments: list[_Segment], deleted: set[str]):
+        self.segments = segments
+        self.deleted = deleted
+        # Newest segment wins when a record id was indexed more than once
+        self.owner: dict[str, int] = {}
+        for seg_index, segment in enumerate(segments):
+            for record_id in segment.doc_ids:
+                self.owner[record_id] = seg_index
+
+        live_lengths = [
+            length
+            for seg_index, segment in enumerate(segments)
+            for record_id, length in zip(segment.doc_ids, segment.doc_lengths)
+            if self._is_live(record_id, seg_index)
+        ]
+        self.num_docs = len(live_lengths)
+        self.avg_length = (sum(live_lengths) / self.num_docs) if self.num_docs else 0.0
+        self.avg_length = self.avg_length or 1.0
+
+    def _is_live(self, record_id: str, seg_index: int) -> bool:
+        return self.owner.get(record_id) == seg_index and record_id not in self.deleted
+
+    def search(self, query: str, top_k: int) -> list[tuple[str, float]]:
+        if not self.num_docs:
+            return []
+        terms = set(tokenize(query))
+        scores: dict[str, float] = {}
+        for term in terms:
+            # Only live postings count towards df, so superseded / deleted records can't push it above num_docs
+            matches = []
+            for seg_index, segment in enumerate(self.segments):
+                entry = segment.terms.get(term)
+                if entry is None:
+                    continue
+                for ordinal, tf in _decode_postings(segment.postings, entry[0], entry[1]):
+                    record_id = segment.doc_ids[ordinal]
+                    if self._is_live(record_id, seg_index):
+                        matches.append((record_id, tf, segment.doc_lengths[ordinal]))
+            if not matches:
+                continue
+            df = len(matches)
+            idf = max(0.0, math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5)))
+            for record_id, tf, length in matches:
+                length_norm = 1 - BM25_B + BM25_B * length / self.avg_length
+                scores[record_id] = scores.get(record_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def _tenant_dir(tenant_id: str, settings: Settings) -> str:
+    digest = hashlib.sha1(tenant_id.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(settings.lexical_index_dir, digest)
+
+
+def _read_manifest(tenant_dir: str) -> dict:
+    try:
+        with open(os.path.join(tenant_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"segments": [], "deleted": []}
+
+
+def _write_manifest(tenant_dir: str, manifest: dict):
+    path = os.path.join(tenant_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _tenant_lock(tenant_dir: str):
+    # Several Celery workers may update the same tenant's index
+    os.makedirs(tenant_dir, exist_ok=True)
+    with open(os.path.join(tenant_dir, LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _compact(tenant_dir: str, manifest: dict) -> dict:
+    # Merge every segment into one, dropping deleted and superseded records
+    segments = [_read_segment(os.path.join(tenant_dir, name)) for name in manifest["segments"]]
+    index = _LoadedIndex(segments, set(manifest["deleted"]))
+    records = []
+    for seg_index, segment in enumerate(segments):
+        live = [i for i, record_id in enumerate(segment.doc_ids) if index._is_live(record_id, seg_index)]
+        if not live:
+            continue
+        # Postings only hold term frequencies, so rebuild each record's token bag from them
+        bags: dict[int, list[str]] = {i: [] for i in live}
+        for term, entry in segment.terms.items():
+            for ordinal, tf in _decode_postings(segment.postings, entry[0], entry[1]):
+                if ordinal in bags:
+                    bags[ordinal].extend([term] * tf)
+        records.extend((segment.doc_ids[i], bags[i]) for i in live)
+
+    name = f"seg_{uuid4().hex}.bin"
+    _write_segment(os.path.join(tenant_dir, name), records)
+    compacted = {"segments": [name], "deleted": []}
+    _write_manifest(tenant_dir, compacted)
+    for old_name in manifest["segments"]:
+        try:
+            os.remove(os.path.join(tenant_dir, old_name))
+        except FileNotFoundError:
+            pass
+    logger.info(f"Compacted {len(segments)} lexical index segments into {name} ({len(records)} records)")
+    return compacted
+
+
+def add_documents(*, tenant_id: str, records: list[tuple[str, str]], settings: Settings):
+    """Adds [(record_id, text)] to the tenant's index as a new segment."""
+    if not records:
+        return
+    tenant_dir = _tenant_dir(tenant_id, settings)
+    with _tenant_lock(tenant_dir):
+        name = f"seg_{uuid4().hex}.bin"
+        _write_segment(os.path.join(tenant_dir, name), [(record_id, tokenize(text)) for record_id, text in records])
+        manifest = _read_manifest(tenant_dir)
+        manifest["segments"].append(name)
+        added = {record_id for record_id, _ in records}
+        manifest["deleted"] = [record_id for record_id in manifest["deleted"] if record_id not in added]
+        _write_manifest(tenant_dir, manifest)
+        if len(manifest["segments"]) > settings.lexical_max_segments:
+            _compact(tenant_dir, manifest)
+    logger.info(f"Indexed {len(records)} records in lexical index for tenant_id: {tenant_id}")
+
+
+def delete_documents(*, tenant_id: str, record_ids: list[str], settings: Settings):
+    if not record_ids:
+        return
+    tenant_dir = _tenant_dir(tenant_id, settings)
+    with _tenant_lock(tenant_dir):
+        manifest = _read_manifest(tenant_dir)
+        manifest["deleted"] = sorted(set(manifest["deleted"]) | set(record_ids))
+        _write_manifest(tenant_dir, manifest)
+
+
+def search(*, tenant_id: str, query: str, top_k: int, settings: Settings) -> list[tuple[str, float]]:
+    """Returns [(record_id, bm25_score)] best first. Empty if the tenant has no index yet."""
+    tenant_dir = _tenant_dir(tenant_id, settings)
+    manifest_path = os.path.join(tenant_dir, MANIFEST_FILE)
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except FileNotFoundError:
+        return []
+
+    cached = _loaded_indexes.get(tenant_id)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, _load_index(tenant_dir))
+        _loaded_indexes[tenant_id] = cached
+    return cached[1].search(query, top_k)
+
+
+def _load_index(tenant_dir: str) -> _LoadedIndex:
+    # A concurrent compaction can remove segments between reading the manifest and the
+    # segment files, in which case the manifest is simply read again.
+    for attempt in range(3):
+        manifest = _read_manifest(tenant_dir)
+        try:
+            segments = [_read_segment(os.path.join(tenant_dir, name)) for name in manifest["segments"]]
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+            continue
+        return _LoadedIndex(segments, set(manifest["deleted"]))
@@ -1,49 +1,123 @@
-from io import BytesIO
-from typing import BinaryIO
+import codecs
+import hashlib
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
 from striprtf.striprtf import rtf_to_text
 from pypdf import PdfReader
 
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
 SUPPORTED_FILE_TYPES = ['application/pdf', 'text/plain', 'application/rtf']
 
-def extract_text(
-        *,
-        file_stream: BinaryIO,
-        filename: str,
-        content_type: str 
-) -> str:
+# Read size used when hashing spooled downloads and streaming plain text
+READ_BLOCK_SIZE = 1024 * 1024
+
+# One pool per (Celery worker) process, created on first use. Daemonic processes (the
+# children of Celery's default prefork pool) can't start one and extract in-process.
+_pdf_process_pool = None
+_pdf_pool_unavailable = False
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+def _get_pdf_process_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    global _pdf_process_pool, _pdf_pool_unavailable
+    if _pdf_process_pool is None:
+        if multiprocessing.current_process().daemon:
+            if not _pdf_pool_unavailable:
+                _pdf_pool_unavailable = True
+                logger.warning(
+                    f"PDF_EXTRACT_WORKERS={workers} needs a non-prefork Celery pool (e.g. --pool=threads), "
+                    "daemonic worker processes can't have children. Extracting PDFs in-process."
+                )
+            return None
+        _pdf_process_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pdf_process_pool
+
+def _extract_pdf_page_range(path: str, start: int, end: int) -> list[str]:
+    # Runs in a pool process: each worker opens the spooled file itself, only the path
+    # and page range are sent over and only the extracted text comes back
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def iter_pdf_pages(path: str, *, workers: int = 1, pages_per_task: int = 25) -> Iterator[str]:
+    """
+    Yields page texts in page order. With workers > 1, page ranges are extracted in
+    parallel by a process pool, with at most 2 * workers ranges in flight.
+    """
+    reader = PdfReader(path)
+    num_pages = len(reader.pages)
+    pool = _get_pdf_process_pool(workers) if workers > 1 and num_pages > pages_per_task else None
+    if pool is None:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+    del reader
+
+    ranges = deque((start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task))
+    in_flight = deque()
+    while ranges or in_flight:
+        while ranges and len(in_flight) < 2 * workers:
+            start, end = ranges.popleft()
+            in_flight.append(pool.submit(_extract_pdf_page_range, path, start, end))
+        yield from in_flight.popleft().result()
+
+def piece_separator(content_type: str) -> str:
+    # How iter_pages pieces join into the document text: PDF pages are separate lines,
+    # plain text blocks are cut at arbitrary byte offsets and must be joined as is
+    return "" if content_type == 'text/plain' else "\n"
+
+def iter_pages(*, path: str, filename: str, content_type: str, pdf_workers: int = 1, pdf_pages_per_task: int = 25) -> Iterator[str]:
+    """
+    Yields the text of a spooled document piece by piece (pages for PDFs, blocks for plain
+    text) so the whole document never has to be held in memory. Join the pieces with
+    piece_separator(content_type).
+    """
     if content_type not in SUPPORTED_FILE_TYPES:
         raise ValueError(f"Unsupported file type: {content_type} for text extraction. Supported types are: {SUPPORTED_FILE_TYPES}")
-    
-    data = file_stream.read()
-    if not data:
+    if os.path.getsize(path) == 0:
         raise ValueError(f"No data found in file: {filename}")
-    
+
     if content_type == 'application/pdf':
-        return extract_pdf_text(data)
-    
+        for page_text in iter_pdf_pages(path, workers=pdf_workers, pages_per_task=pdf_pages_per_task):
+            if page_text:
+                yield page_text
+        return
+
     if content_type == 'text/plain':
-        return data.decode('utf-8')
-    
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(READ_BLOCK_SIZE)
+                text = decoder.decode(block, final=not block)
+                if text:
+                    yield text
+                if not block:
+                    return
+
     if content_type == 'application/rtf':
-        return extract_rtf_text(data)
-    
+        # striprtf needs the whole document, RTF policies are small in practice
+        with open(path, "rb") as f:
+            yield extract_rtf_text(f.read())
+
 def extract_rtf_text(data: bytes) -> str:
     rtf_content = data.decode('utf-8', errors='ignore')
     text = rtf_to_text(rtf_content)
     if not text:
         raise ValueError("No text extracted from RTF document")
     return text
-
-    
-def extract_pdf_text(data: bytes) -> str:
-    reader = PdfReader(BytesIO(data))
-    text = []
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text.append(page_text)
-    
-    if not text:
-        raise ValueError("No text extracted from PDF document.")
-    
-    return "\n".join(text)
\ No newline at end of file
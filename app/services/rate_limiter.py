@@ -0,0 +1,369 @@
+# Shared OpenAI rate-limit budget for the API replicas and the Celery workers.
+# Every call reserves one request and its estimated tokens in the current one-minute window
+# of its model, in Redis, before it is sent:
+#   - the limits are learned from OpenAI's x-ratelimit-limit-* response headers
+#   - interactive calls (chat, query embeddings) may use the whole window, bulk calls
+#     (ingestion embeddings) leave rate_limit_interactive_reserve of it free and share the
+#     rest evenly between the tenants ingesting in that window
+#   - a 429 or an exhausted x-ratelimit-remaining-* pauses the model for everyone until
+#     the reset time OpenAI reports
+# On top of that each process adapts its number of concurrent calls per model (AIMD):
+# +1 after every `limit` successful calls, halved on a 429. Redis errors never block a call.
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+from openai import APIStatusError
+
+from app.core import globals
+from app.core.config import Settings
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+KEY_PREFIX = "openai_rate_limit"
+WINDOW_SECONDS = 60
+LIMITS_TTL_SECONDS = 3600
+
+_rate_limiter_instances: dict[str, "RateLimiter"] = {}
+_instances_lock = threading.Lock()
+
+# Returns 0 when the call was reserved, otherwise the milliseconds to wait before retrying
+_RESERVE_SCRIPT = """
+local paused = redis.call('PTTL', KEYS[5])
+if paused > 0 then return paused end
+
+local window_ms = tonumber(ARGV[6])
+local function wait() local ttl = redis.call('PTTL', KEYS[1]) if ttl > 0 then return ttl end return window_ms end
+
+local tokens = tonumber(ARGV[1])
+local share = tonumber(ARGV[4])
+local limit_requests = tonumber(redis.call('HGET', KEYS[6], 'requests') or ARGV[2])
+local limit_tokens = tonumber(redis.call('HGET', KEYS[6], 'tokens') or ARGV[3])
+local cap_requests = math.max(1, math.floor(limit_requests * share))
+local cap_tokens = math.max(1, math.floor(limit_tokens * share))
+
+local used_requests = tonumber(redis.call('GET', KEYS[1]) or '0')
+local used_tokens = tonumber(redis.call('GET', KEYS[2]) or '0')
+-- A single call larger than the whole budget still goes through in an empty window
+if used_requests + 1 > cap_requests or (used_tokens > 0 and used_tokens + tokens > cap_tokens) then
+  return wait()
+end
+
+local tenant = ARGV[5]
+if tenant ~= '' then
+  redis.call('SADD', KEYS[4], tenant)
+  redis.call('PEXPIRE', KEYS[4], window_ms * 2)
+  local tenant_cap = math.floor(cap_tokens / redis.call('SCARD', KEYS[4]))
+  local tenant_tokens = tonumber(redis.call('GET', KEYS[3]) or '0')
+  if tenant_tokens > 0 and tenant_tokens + tokens > tenant_cap then
+    return wait()
+  end
+  redis.call('INCRBY', KEYS[3], tokens)
+  redis.call('PEXPIRE', KEYS[3], window_ms * 2)
+end
+
+redis.call('INCR', KEYS[1])
+redis.call('PEXPIRE', KEYS[1], window_ms * 2)
+redis.call('INCRBY', KEYS[2], tokens)
+redis.call('PEXPIRE', KEYS[2], window_ms * 2)
+return 0
+"""
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds from an x-ratelimit-reset-* header ("1s", "6m0s", "20ms") or retry-after ("2")."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    # The longest of the reported waits, that is when both budgets allow a call again
+    waits = [
+        parse_reset(headers.get(name))
+        for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+    ]
+    waits = [wait for wait in waits if wait is not None]
+    return max(waits) if waits else None
+
+
+def _is_rate_limited(exc: BaseException) -> bool:
+    return isinstance(exc, APIStatusError) and exc.status_code == 429
+
+
+def retry_countdown(exc: BaseException, *, retries: int, base_delay: float = 5.0) -> float:
+    """Celery retry countdown: OpenAI's reset time for rate-limit errors, exponential backoff otherwise."""
+    # Ingestion wraps errors in RuntimeError, look through the chain
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if _is_rate_limited(exc):
+            wait = retry_after_seconds(exc.response.headers)
+            if wait is not None:
+                return wait + random.uniform(0, 1)
+            break
+        exc = exc.__cause__ or exc.__context__
+    return base_delay * (2 ** retries)
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency cap that grows by one per `limit` successful calls and halves on a rate-limit
+    error (at most once per second). Waiting interactive calls get free slots first.
+    Not bound to an event loop, the Celery workers may run calls from several loops.
+    """
+
+    def __init__(self, *, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._waiters = {INTERACTIVE: deque(), BULK: deque()}
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+        self.stats = {"decreases": 0, "waits": 0}
+
+    async def acquire(self, priority: str):
+        with self._lock:
+            if self.in_flight < int(self.limit) and not any(self._waiters.values()):
+                self.in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[priority].append(waiter)
+            self.stats["waits"] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters[priority]:
+                    self._waiters[priority].remove(waiter)
+                    raise
+            # The slot was handed over just before the cancellation, pass it on
+            self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_rate_limited(self):
+        with self._lock:
+            now = time.monotonic()
+            # One 429 burst from many concurrent calls counts as a single signal
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            self.limit = max(float(self.minimum), self.limit / 2)
+            self.stats["decreases"] += 1
+
+    def _wake(self):
+        # Called with the lock held, the slot is taken on behalf of the woken waiter
+        while self.in_flight < int(self.limit):
+            queue = self._waiters[INTERACTIVE] or self._waiters[BULK]
+            if not queue:
+                return
+            waiter = queue.popleft()
+            self.in_flight += 1
+            waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RateLimiter:
+    """Shared budget and adaptive concurrency for one model."""
+
+    def __init__(self, *, model: str, settings: Settings):
+        self.model = model
+        self.settings = settings
+        self.concurrency = AdaptiveConcurrency(
+            initial=settings.openai_min_concurrency * 2,
+            minimum=settings.openai_min_concurrency,
+            maximum=settings.openai_max_concurrency,
+        )
+        self._reserve = None
+        self.stats = {"calls": 0, "throttled": 0, "rate_limited": 0, "redis_errors": 0}
+
+    def _key(self, *parts) -> str:
+        return ":".join((KEY_PREFIX, self.model, *map(str, parts)))
+
+    def _share(self, priority: str) -> float:
+        share = self.settings.rate_limit_target_utilization
+        if priority == BULK:
+            share *= 1.0 - self.settings.rate_limit_interactive_reserve
+        return share
+
+    def _try_reserve(self, *, window: int, tokens: int, priority: str, tenant_id: Optional[str]) -> int:
+        client = globals.get_sync_redis_client()
+        if self._reserve is None:
+            self._reserve = client.register_script(_RESERVE_SCRIPT)
+        tenant = tenant_id if priority == BULK and tenant_id else ""
+        keys = [
+            self._key("requests", window),
+            self._key("tokens", window),
+            self._key("tenant_tokens", window, tenant),
+            self._key("tenants", window),
+            self._key("paused"),
+            self._key("limits"),
+        ]
+        args = [
+            tokens,
+            self.settings.rate_limit_default_requests,
+            self.settings.rate_limit_default_tokens,
+            self._share(priority),
+            tenant,
+            WINDOW_SECONDS * 1000,
+        ]
+        return int(self._reserve(keys=keys, args=args, client=client))
+
+    async def _wait_for_budget(self, *, tokens: int, priority: str, tenant_id: Optional[str]) -> Optional[int]:
+        # Returns the window the call was counted in, None when it was let through uncounted
+        deadline = time.monotonic() + self.settings.rate_limit_max_wait_seconds
+        while True:
+            window = int(time.time() // WINDOW_SECONDS)
+            try:
+                wait_ms = await asyncio.to_thread(
+                    self._try_reserve, window=window, tokens=tokens, priority=priority, tenant_id=tenant_id
+                )
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Rate limit budget unavailable, calling {self.model} without it. Error: {e}")
+                return None
+            if wait_ms <= 0:
+                return window
+            self.stats["throttled"] += 1
+            delay = wait_ms / 1000 * (1 + random.random() * 0.1)
+            if priority == INTERACTIVE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Better to risk a 429 than to keep a user waiting indefinitely
+                    logger.warning(f"Interactive {self.model} call waited {self.settings.rate_limit_max_wait_seconds}s for budget, sending it anyway")
+                    return None
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+
+    def _record(self, *, window: Optional[int], headers, tokens_estimated: int, tokens_used: Optional[int], rate_limited: bool = False):
+        client = globals.get_sync_redis_client()
+        pipe = client.pipeline(transaction=False)
+        if window is not None and tokens_used is not None and tokens_used != tokens_estimated:
+            # Replace the estimate with the tokens OpenAI actually counted
+            pipe.incrby(self._key("tokens", window), tokens_used - tokens_estimated)
+            pipe.expire(self._key("tokens", window), WINDOW_SECONDS * 2)
+        if headers is not None:
+            limits = {
+                field: headers.get(f"x-ratelimit-limit-{field}")
+                for field in ("requests", "tokens")
+            }
+            limits = {field: int(value) for field, value in limits.items() if value and value.isdigit()}
+            if limits:
+                pipe.hset(self._key("limits"), mapping=limits)
+                pipe.expire(self._key("limits"), LIMITS_TTL_SECONDS)
+            exhausted = rate_limited or any(headers.get(f"x-ratelimit-remaining-{field}") == "0" for field in ("requests", "tokens"))
+            pause = retry_after_seconds(headers) if exhausted else None
+            if pause:
+                pipe.set(self._key("paused"), 1, px=max(1, int(pause * 1000)))
+        pipe.execute()
+
+    async def _record_safely(self, **kwargs):
+        try:
+            await asyncio.to_thread(self._record, **kwargs)
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Failed to record {self.model} rate limit usage. Error: {e}")
+
+    @asynccontextmanager
+    async def _slot(self, priority: str):
+        await self.concurrency.acquire(priority)
+        try:
+            yield
+        finally:
+            self.concurrency.release()
+
+    async def call(self, create: Callable[..., Awaitable[Any]], *, priority: str, tokens: int, tenant_id: Optional[str] = None, **kwargs) -> Any:
+        """
+        Runs a `with_raw_response` OpenAI create method within the budget and returns the
+        parsed response. tokens is the estimate that is reserved until the usage is known.
+        """
+        self.stats["calls"] += 1
+        # Budget first, so calls waiting for the next window do not hold concurrency slots
+        window = await self._wait_for_budget(tokens=tokens, priority=priority, tenant_id=tenant_id)
+        async with self._slot(priority):
+            try:
+                raw = await create(**kwargs)
+            except APIStatusError as e:
+                if _is_rate_limited(e):
+                    self.stats["rate_limited"] += 1
+                    self.concurrency.on_rate_limited()
+                    await self._record_safely(
+                        window=window,
+                        headers=e.response.headers,
+                        tokens_estimated=tokens,
+                        tokens_used=None,
+                        rate_limited=True,
+                    )
+                raise
+            response = raw.parse()
+            usage = getattr(response, "usage", None)
+            self.concurrency.on_success()
+            await self._record_safely(
+                window=window,
+                headers=raw.headers,
+                tokens_estimated=tokens,
+                tokens_used=getattr(usage, "total_tokens", None),
+            )
+            return response
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            **{f"concurrency_{name}": value for name, value in self.concurrency.stats.items()},
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+        }
+
+
+def get_rate_limiter(model: str, settings: Settings) -> RateLimiter:
+    with _instances_lock:
+        limiter = _rate_limiter_instances.get(model)
+        if limiter is None:
+            limiter = _rate_limiter_instances[model] = RateLimiter(model=model, settings=settings)
+        return limiter
+
+
+async def call_openai(create: Callable[..., Awaitable[Any]], *, settings: Settings, priority: str, tokens: int, tenant_id: Optional[str] = None, **kwargs) -> Any:
+    """Calls a `with_raw_response` create method through the model's limiter (directly when disabled)."""
+    if not settings.rate_limit_enabled:
+        return (await create(**kwargs)).parse()
+    limiter = get_rate_limiter(kwargs["model"], settings)
+    return await limiter.call(create, priority=priority, tokens=tokens, tenant_id=tenant_id, **kwargs)
+
+
+def get_stats() -> dict:
+    return {model: limiter.get_stats() for model, limiter in _rate_limiter_instances.items()}
@@ -0,0 +1,356 @@
+# Cross-encoder re-ranking (FlashRank) and the backends used to run it.
+# "thread": one FlashRank call per request on Starlette's threadpool (original behaviour).
+# "batch":  requests are coalesced for a few ms by RerankScheduler and scored in one ONNX run.
+# "process": each request is scored in a pool of worker processes with the model preloaded,
+#            so tokenization and pre/post-processing no longer hold the API process' GIL.
+# With rerank_cascade_enabled a tiny cross-encoder first prunes the candidates and the main
+# model only scores the survivors, in slices, stopping once the top-n no longer changes.
+import asyncio
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from flashrank import Ranker, RerankRequest
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import Settings
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# distinct model for re-ranking. 'ms-marco-MiniLM-L-12-v2' is a good balance.
+RERANK_MODEL_NAME = "ms-marco-MiniLM-L-12-v2"
+
+# Cache the rankers to avoid reloading models on every request
+_ranker_instances: dict[str, Ranker] = {}
+_rerank_scheduler_instances: dict[str, "RerankScheduler"] = {}
+_rerank_process_pool = None
+# (query, passage) pairs scored per model, i.e. the rerank cost
+_pairs_scored: Counter = Counter()
+
+
+def _get_ranker(model_name: str = RERANK_MODEL_NAME) -> Ranker:
+    ranker = _ranker_instances.get(model_name)
+    if ranker is None:
+        # FlashRank defaults to a small quantization.
+        ranker = Ranker(model_name=model_name, cache_dir=".cache")
+        _ranker_instances[model_name] = ranker
+    return ranker
+
+
+def _score_pairs(ranker: Ranker, pairs: list[tuple[str, str]]) -> np.ndarray:
+    """
+    Scores (query, passage) pairs in a single cross-encoder inference.
+    Mirrors Ranker.rerank, but lets pairs from different queries share one ONNX run.
+    """
+    session = getattr(ranker, "session", None)
+    if session is None:
+        # Listwise (LLM) rankers have no pairwise session, score one query at a time
+        scores = []
+        for query, text in pairs:
+            result = ranker.rerank(RerankRequest(query=query, passages=[{"id": 0, "text": text}]))
+            scores.append(result[0]["score"])
+        return np.asarray(scores, dtype=np.float32)
+
+    encoded = ranker.tokenizer.encode_batch([[query, text] for query, text in pairs])
+    input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+    token_type_ids = np.array([e.type_ids for e in encoded], dtype=np.int64)
+    attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+
+    onnx_input = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if not np.all(token_type_ids == 0):
+        onnx_input["token_type_ids"] = token_type_ids
+
+    logits = session.run(None, onnx_input)[0]
+    if logits.shape[1] == 1:
+        return (1 / (1 + np.exp(-logits.flatten()))).astype(np.float32)
+    exp_logits = np.exp(logits)
+    return (exp_logits[:, 1] / np.sum(exp_logits, axis=1)).astype(np.float32)
+
+
+def _apply_scores(passages: list[dict], scores) -> list[dict]:
+    for passage, score in zip(passages, scores):
+        passage["score"] = float(score)
+    return sorted(passages, key=lambda x: x["score"], reverse=True)
+
+
+@dataclass(slots=True)
+class _PendingRerank:
+    question: str
+    passages: list[dict]
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class RerankScheduler:
+    """
+    Collects rerank requests for up to max_wait_ms (or until max_batch_pairs pairs are queued)
+    and scores them with one batched inference, handing each caller back its own ranked slice.
+    """
+
+    def __init__(self, *, model_name: str, max_batch_pairs: int, max_wait_ms: float):
+        self.model_name = model_name
+        self.max_batch_pairs = max_batch_pairs
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._task = None
+        self.stats = {
+            "batches": 0,
+            "requests": 0,
+            "pairs": 0,
+            "queue_wait_ms_total": 0.0,
+            "inference_ms_total": 0.0,
+        }
+
+    async def rerank(self, question: str, passages: list[dict]) -> list[dict]:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingRerank(question, passages, future, time.perf_counter()))
+        return await future
+
+    def get_stats(self) -> dict:
+        batches = self.stats["batches"]
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "avg_batch_requests": requests / batches if batches else 0.0,
+            "avg_queue_wait_ms": self.stats["queue_wait_ms_total"] / requests if requests else 0.0,
+            "avg_inference_ms": self.stats["inference_ms_total"] / batches if batches else 0.0,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        ranker = await run_in_threadpool(_get_ranker, self.model_name)
+        while True:
+            batch = [await self._queue.get()]
+            num_pairs = len(batch[0].passages)
+            deadline = loop.time() + self.max_wait
+            while num_pairs < self.max_batch_pairs:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                num_pairs += len(item.passages)
+            await self._process(ranker, batch)
+
+    async def _process(self, ranker: Ranker, batch: list[_PendingRerank]):
+        started = time.perf_counter()
+        # Callers that went away (cancelled requests) are dropped before inference
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+        pairs = [(item.question, passage["text"]) for item in batch for passage in item.passages]
+        try:
+            scores = await run_in_threadpool(_score_pairs, ranker, pairs)
+        except Exception as e:
+            logger.error(f"Batched rerank of {len(pairs)} pairs failed. Error: {e}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(batch)
+        self.stats["pairs"] += len(pairs)
+        self.stats["inference_ms_total"] += (finished - started) * 1000
+        offset = 0
+        for item in batch:
+            self.stats["queue_wait_ms_total"] += (started - item.enqueued_at) * 1000
+            item_scores = scores[offset : offset + len(item.passages)]
+            offset += len(item.passages)
+            if not item.future.done():
+                item.future.set_result(_apply_scores(item.passages, item_scores))
+        logger.debug(
+            f"Reranked batch of {len(batch)} requests ({len(pairs)} pairs) in {(finished - started) * 1000:.1f} ms"
+        )
+
+
+def get_rerank_scheduler(settings: Settings, model_name: str = RERANK_MODEL_NAME) -> RerankScheduler:
+    scheduler = _rerank_scheduler_instances.get(model_name)
+    if scheduler is None:
+        scheduler = RerankScheduler(
+            model_name=model_name,
+            max_batch_pairs=settings.rerank_max_batch_pairs,
+            max_wait_ms=settings.rerank_max_wait_ms,
+        )
+        _rerank_scheduler_instances[model_name] = scheduler
+    return scheduler
+
+
+def get_rerank_stats() -> dict:
+    return {
+        "pairs_scored": dict(_pairs_scored),
+        "schedulers": {model_name: scheduler.get_stats() for model_name, scheduler in _rerank_scheduler_instances.items()},
+    }
+
+
+def _init_rerank_worker(model_names: list[str]):
+    # Runs once in every pool process, so requests never pay for model loading
+    for model_name in model_names:
+        _get_ranker(model_name)
+
+
+def _score_in_worker(model_name: str, question: str, texts: list[str]) -> np.ndarray:
+    # Only the passage texts are sent to the worker and a single float32 array comes back,
+    # metadata stays in the API process.
+    return _score_pairs(_get_ranker(model_name), [(question, text) for text in texts])
+
+
+def _score_pairs_in_worker(model_name: str, pairs: list[tuple[str, str]]) -> np.ndarray:
+    # Pairs from several questions in one inference (rerank_many)
+    return _score_pairs(_get_ranker(model_name), pairs)
+
+
+def _warmup_worker() -> bool:
+    return True
+
+
+def _rerank_model_names(settings: Settings) -> list[str]:
+    if settings.rerank_cascade_enabled:
+        return [settings.rerank_cascade_model, RERANK_MODEL_NAME]
+    return [RERANK_MODEL_NAME]
+
+
+def get_rerank_process_pool(settings: Settings) -> ProcessPoolExecutor:
+    global _rerank_process_pool
+    if _rerank_process_pool is None:
+        # spawn rather than fork: the API process has an event loop and threads running
+        _rerank_process_pool = ProcessPoolExecutor(
+            max_workers=settings.rerank_process_pool_size,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_rerank_worker,
+            initargs=(_rerank_model_names(settings),),
+        )
+    return _rerank_process_pool
+
+
+def start_rerank_backend(settings: Settings):
+    # Called on app startup so the pool processes load the model before the first request
+    if settings.rerank_backend == "process":
+        pool = get_rerank_process_pool(settings)
+        for _ in range(settings.rerank_process_pool_size):
+            pool.submit(_warmup_worker)
+        logger.info(f"Started rerank process pool with {settings.rerank_process_pool_size} workers")
+
+
+def shutdown_rerank_backend():
+    global _rerank_process_pool
+    if _rerank_process_pool is not None:
+        _rerank_process_pool.shutdown(wait=False, cancel_futures=True)
+        _rerank_process_pool = None
+
+
+async def rerank_with_model(*, question: str, passages: list[dict], settings: Settings, model_name: str = RERANK_MODEL_NAME) -> list[dict]:
+    # Scores every passage with one model on the configured backend, best first
+    _pairs_scored[model_name] += len(passages)
+    if settings.rerank_backend == "batch":
+        return await get_rerank_scheduler(settings, model_name).rerank(question, passages)
+    if settings.rerank_backend == "process":
+        pool = get_rerank_process_pool(settings)
+        scores = await asyncio.get_running_loop().run_in_executor(
+            pool, _score_in_worker, model_name, question, [passage["text"] for passage in passages]
+        )
+        return _apply_scores(passages, scores)
+    ranker = _get_ranker(model_name)
+    rerank_request = RerankRequest(query=question, passages=passages)
+    return await run_in_threadpool(ranker.rerank, rerank_request)
+
+
+async def _cascade_rerank(*, question: str, passages: list[dict], top_n: int, settings: Settings) -> list[dict]:
+    """
+    Stage 1: the tiny model orders all candidates and only the best rerank_cascade_keep survive.
+    Stage 2: the main model scores the survivors in that order, top_n first and then
+    rerank_cascade_slice at a time, and stops as soon as a slice does not change the top_n.
+    Only passages scored by the main model are returned.
+    """
+    pruned = await rerank_with_model(
+        question=question,
+        passages=[dict(passage) for passage in passages],
+        settings=settings,
+        model_name=settings.rerank_cascade_model
+    )
+    survivors = pruned[: max(top_n, settings.rerank_cascade_keep)]
+
+    scored = []
+    top_ids = None
+    position = 0
+    while position < len(survivors):
+        size = top_n if position == 0 else settings.rerank_cascade_slice
+        scored += await rerank_with_model(
+            question=question,
+            passages=survivors[position : position + size],
+            settings=settings,
+            model_name=RERANK_MODEL_NAME
+        )
+        scored.sort(key=lambda x: x["score"], reverse=True)
+        position += size
+        # Early exit: the slice that was just scored did not enter the top_n
+        current_ids = [passage["id"] for passage in scored[:top_n]]
+        if current_ids == top_ids:
+            break
+        top_ids = current_ids
+    logger.info(
+        f"Cascade rerank: {len(passages)} candidates, {len(survivors)} survivors, "
+        f"{len(scored)} scored by {RERANK_MODEL_NAME}"
+    )
+    return scored
+
+
+async def rerank(*, question: str, passages: list[dict], settings: Settings, top_n: int | None = None) -> list[dict]:
+    # Returns passages sorted by cross-encoder score (each passage gets a "score" key).
+    # top_n is the number of passages the caller keeps, the cascade is tuned for it.
+    top_n = top_n or settings.num_retrieved_chunks
+    if settings.rerank_cascade_enabled and len(passages) > max(top_n, settings.rerank_cascade_keep):
+        return await _cascade_rerank(question=question, passages=passages, top_n=top_n, settings=settings)
+    return await rerank_with_model(question=question, passages=passages, settings=settings)
+
+
+async def rerank_many(*, items: list[tuple[str, list[dict]]], settings: Settings, top_n: int | None = None) -> list[list[dict]]:
+    """
+    Re-ranks the candidate sets of several questions, [(question, passages)] -> ranked passages
+    per question. The pairs of all questions are scored together, in inferences of at most
+    rerank_max_batch_pairs pairs.
+    """
+    if settings.rerank_cascade_enabled or settings.rerank_backend == "batch":
+        # The cascade decides per question what to score next, and the batch backend already
+        # coalesces concurrent calls into shared inferences
+        return list(await asyncio.gather(*(
+            rerank(question=question, passages=passages, settings=settings, top_n=top_n)
+            for question, passages in items
+        )))
+
+    pairs = [(question, passage["text"]) for question, passages in items for passage in passages]
+    if not pairs:
+        return [[] for _ in items]
+    _pairs_scored[RERANK_MODEL_NAME] += len(pairs)
+    step = max(1, settings.rerank_max_batch_pairs)
+    slices = [pairs[i : i + step] for i in range(0, len(pairs), step)]
+    if settings.rerank_backend == "process":
+        # Slices run in parallel across the pool processes
+        loop = asyncio.get_running_loop()
+        pool = get_rerank_process_pool(settings)
+        slice_scores = await asyncio.gather(*(
+            loop.run_in_executor(pool, _score_pairs_in_worker, RERANK_MODEL_NAME, pairs_slice)
+            for pairs_slice in slices
+        ))
+    else:
+        ranker = _get_ranker(RERANK_MODEL_NAME)
+        slice_scores = await run_in_threadpool(lambda: [_score_pairs(ranker, pairs_slice) for pairs_slice in slices])
+    scores = np.concatenate(slice_scores)
+
+    ranked = []
+    offset = 0
+    for _, passages in items:
+        ranked.append(_apply_scores(passages, scores[offset : offset + len(passages)]))
+        offset += len(passages)
+    return ranked
@@ -1,87 +1,212 @@
-from app.services import embeddings, vector_store
+import asyncio
+from app.services import embeddings, vector_store, reranker, lexical_index
+from app.services.index_registry import IndexSpec, get_active_index
 from app.core.logger_config import get_logger
-from flashrank import Ranker, RerankRequest
 from starlette.concurrency import run_in_threadpool
-from app.core import globals
 
 logger = get_logger(__name__)
 
-# Cache the ranker to avoid reloading model on every request
-_ranker_instance = None
+def _reciprocal_rank_fusion(rankings: list[list[str]], k: int) -> list[str]:
+    # score(d) = sum over rankings of 1 / (k + rank(d)), rank starting at 1
+    scores = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
 
-def _get_ranker():
-    global _ranker_instance
-    if _ranker_instance is None:
-        # distinct model for re-ranking. 'ms-marco-MiniLM-L-12-v2' is a good balance.
-        # FlashRank defaults to a small quantization.
-        _ranker_instance = Ranker(model_name="ms-marco-MiniLM-L-12-v2", cache_dir=".cache")
-    return _ranker_instance
+async def _fuse_with_lexical(*, tenant_id: str, passages: list[dict], lexical_hits: list[tuple[str, float]], settings) -> list[dict]:
+    fused_ids = _reciprocal_rank_fusion(
+        [[passage["id"] for passage in passages], [id for id, _ in lexical_hits]],
+        k=settings.rrf_k
+    )[: settings.hybrid_candidate_pool]
 
-async def retrieve_relevant_chunks(*, tenant_id: str, question: str, settings) -> list[dict]:
+    by_id = {passage["id"]: passage for passage in passages}
+    missing = [id for id in fused_ids if id not in by_id]
+    if missing:
+        # Lexical-only hits, fetch their text and metadata from the vector store
+        records = await run_in_threadpool(
+            vector_store.get_records, tenant_id=tenant_id, ids=missing, settings=settings
+        )
+        for id, doc, meta in zip(records.get("ids", []), records.get("documents", []), records.get("metadatas", [])):
+            by_id[id] = {"id": id, "text": doc, "meta": meta}
+    # Ids the vector store no longer has (deleted since indexing) are dropped
+    return [by_id[id] for id in fused_ids if id in by_id]
+
+def _candidate_pool_size(distances: list[float], settings) -> int:
+    # How many vector candidates go to re-ranking, based on the shape of the distances
+    if not settings.adaptive_candidate_pool:
+        return settings.retrieval_initial_top_k
+    keep = settings.num_retrieved_chunks
+    if len(distances) > keep and distances[keep] - distances[keep - 1] >= settings.candidate_gap_threshold:
+        # Clear winners: the rest is unlikely to be re-ranked into the top
+        return max(settings.retrieval_min_top_k, keep)
+    window = distances[: settings.retrieval_initial_top_k]
+    if len(distances) > len(window) and window and window[-1] - window[0] < settings.candidate_flat_threshold:
+        # Flat distances: the vector ranking says little, give the re-ranker more to choose from
+        return settings.retrieval_max_top_k
+    return settings.retrieval_initial_top_k
+
+def _vector_passages(results: dict, i: int, settings) -> tuple[list[dict], int]:
+    # Candidates of the i-th query embedding, cut to the adaptive pool size
+    docs = results.get('documents', [[]])[i]
+    metas = results.get('metadatas', [[]])[i]
+    ids = results.get('ids', [[]])[i]
+    distances = (results.get('distances') or [[]] * (i + 1))[i]
+
+    pool_size = _candidate_pool_size(distances, settings)
+    passages = [
+        {"id": id, "text": doc, "meta": meta}
+        for id, doc, meta in zip(ids[:pool_size], docs[:pool_size], metas[:pool_size])
+    ]
+    return passages, pool_size
+
+def _standardize(ranked_results: list[dict]) -> list[dict]:
+    return [
+        {
+            "text": res["text"],
+            "metadata": res["meta"],
+            "score": res["score"],
+            "id": res["id"]
+        }
+        for res in ranked_results
+    ]
+
+async def retrieve_relevant_chunks(*, tenant_id: str, question: str, settings, question_embedding: list | None = None, index: IndexSpec | None = None) -> list[dict]:
     """
     Retrieves and re-ranks chunks.
+    question_embedding can be passed in when the caller already embedded the question, together
+    with the index it was embedded for (embedding and query must use the same index).
     Returns a list of dicts: {'text': str, 'metadata': dict, 'score': float}
     """
+    index = index or get_active_index(settings)
     try:
         # Stage 1: Vector Retrieval (High Recall)
-        # Fetch 25 candidates (to be re-ranked down to 'num_retrieved_chunks')
-        INITIAL_TOP_K = 25
+        # Fetch enough candidates for the widest pool, the pool size is picked from the distances
+        query_top_k = settings.retrieval_max_top_k if settings.adaptive_candidate_pool else settings.retrieval_initial_top_k
          
-        question_embedding = await embeddings.embed_text(question)
-        logger.info(f"Generated question embedding for tenant_id: {tenant_id}")
-        
-        client = globals.get_chroma_client()
-        collection = vector_store._get_collection(client, collection_name=settings.chromadb_collection_name)
+        if question_embedding is None:
+            question_embedding = await embeddings.embed_text(question, index=index)
+            logger.info(f"Generated question embedding for tenant_id: {tenant_id}")
         
-        logger.info(f"Querying vector store (Top-{INITIAL_TOP_K}) for tenant_id: {tenant_id}")
+        logger.info(f"Querying vector store (Top-{query_top_k}) for tenant_id: {tenant_id}")
         
         def _query_chroma():
-            return collection.query(
+            return vector_store.query_vectors(
+                tenant_id=tenant_id,
                 query_embeddings=question_embedding,
-                n_results=INITIAL_TOP_K,
-                where={"tenant_id": tenant_id}
+                n_results=query_top_k,
+                settings=settings,
+                index=index
             )
         
-        results = await run_in_threadpool(_query_chroma)
+        if settings.hybrid_search_enabled:
+            # Lexical (BM25) and vector search run concurrently
+            results, lexical_hits = await asyncio.gather(
+                run_in_threadpool(_query_chroma),
+                run_in_threadpool(
+                    lexical_index.search,
+                    tenant_id=tenant_id,
+                    query=question,
+                    top_k=settings.lexical_top_k,
+                    settings=settings
+                )
+            )
+        else:
+            results = await run_in_threadpool(_query_chroma)
+            lexical_hits = []
         
         # Parse Chroma results into flat list for Reranker
-        docs = results.get('documents', [[]])[0]
-        metas = results.get('metadatas', [[]])[0]
-        ids = results.get('ids', [[]])[0]
+        passages, pool_size = _vector_passages(results, 0, settings)
         
-        if not docs:
+        if not passages and not lexical_hits:
             logger.info("No documents found in vector store.")
             return []
 
-        passages = [
-            {"id": id, "text": doc, "meta": meta} 
-            for id, doc, meta in zip(ids, docs, metas)
-        ]
+        if lexical_hits:
+            passages = await _fuse_with_lexical(
+                tenant_id=tenant_id,
+                passages=passages,
+                lexical_hits=lexical_hits,
+                settings=settings
+            )
         
-        logger.info(f"Fetched {len(passages)} candidates. Starting Re-ranking.")
+        logger.info(f"Fetched {len(passages)} candidates (vector pool: {pool_size}). Starting Re-ranking.")
 
         # Stage 2: Re-ranking (High Precision)
-        ranker = _get_ranker()
-        rerank_request = RerankRequest(query=question, passages=passages)
-        ranked_results = await run_in_threadpool(ranker.rerank, rerank_request)
+        final_top_k = settings.num_retrieved_chunks
+        ranked_results = await reranker.rerank(question=question, passages=passages, settings=settings, top_n=final_top_k)
         
         # Take Top N (e.g. 5)
-        final_top_k = settings.num_retrieved_chunks
         top_results = ranked_results[:final_top_k]
         
         logger.info(f"Re-ranking complete. Returning top {len(top_results)} results.")
         
         # Standardize Output
-        return [
-            {
-                "text": res["text"],
-                "metadata": res["meta"],
-                "score": res["score"],
-                "id": res["id"]
-            }
-            for res in top_results
-        ]
+        return _standardize(top_results)
 
     except Exception as e:
         logger.error(f"Failed to retrieve/rerank answers. Error: {e}")
         raise RuntimeError(f"Failed to retrieve answers. Error: {e}")
+
+async def retrieve_relevant_chunks_batch(*, tenant_id: str, questions: list[str], settings, question_embeddings: list | None = None, index: IndexSpec | None = None) -> list[list[dict]]:
+    """
+    Batched retrieve_relevant_chunks for many questions of one tenant: one embedding request,
+    one multi-vector Chroma query and one batched re-ranking pass over all candidate sets.
+    Returns one result list per question, in order.
+    """
+    if not questions:
+        return []
+    index = index or get_active_index(settings)
+    try:
+        query_top_k = settings.retrieval_max_top_k if settings.adaptive_candidate_pool else settings.retrieval_initial_top_k
+        if question_embeddings is None:
+            question_embeddings = await embeddings.embed_text(questions, index=index)
+
+        logger.info(f"Querying vector store (Top-{query_top_k}) for {len(questions)} questions of tenant_id: {tenant_id}")
+        vector_query = run_in_threadpool(
+            vector_store.query_vectors,
+            tenant_id=tenant_id,
+            query_embeddings=question_embeddings,
+            n_results=query_top_k,
+            settings=settings,
+            index=index
+        )
+        if settings.hybrid_search_enabled:
+            results, *lexical_hits = await asyncio.gather(vector_query, *(
+                run_in_threadpool(
+                    lexical_index.search,
+                    tenant_id=tenant_id,
+                    query=question,
+                    top_k=settings.lexical_top_k,
+                    settings=settings
+                )
+                for question in questions
+            ))
+        else:
+            results = await vector_query
+            lexical_hits = [[] for _ in questions]
+
+        candidate_sets = []
+        for i in range(len(questions)):
+            passages, _ = _vector_passages(results, i, settings)
+            if lexical_hits[i]:
+                passages = await _fuse_with_lexical(
+                    tenant_id=tenant_id,
+                    passages=passages,
+                    lexical_hits=lexical_hits[i],
+                    settings=settings
+                )
+            candidate_sets.append(passages)
+        logger.info(f"Fetched {sum(len(passages) for passages in candidate_sets)} candidates. Starting batched Re-ranking.")
+
+        final_top_k = settings.num_retrieved_chunks
+        ranked_sets = await reranker.rerank_many(
+            items=list(zip(questions, candidate_sets)),
+            settings=settings,
+            top_n=final_top_k
+        )
+        return [_standardize(ranked[:final_top_k]) for ranked in ranked_sets]
+
+    except Exception as e:
+        logger.error(f"Failed to retrieve/rerank answers for a batch of {len(questions)} questions. Error: {e}")
+        raise RuntimeError(f"Failed to retrieve answers. Error: {e}")
@@ -4,9 +4,14 @@
 # Return response containing useful metadata like (key, bucket_name, URL)
 # Surface errors in a way that can be understood by the API layer
 
+import os
+import tempfile
 from typing import Optional
 from dataclasses import dataclass
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from app.core import globals
 from app.core.config import Settings
 from botocore.exceptions import BotoCoreError, ClientError
 from uuid import uuid4
@@ -19,15 +24,36 @@ class UploadObject:
     url: Optional[str] = None
 
 
+def create_s3_client(settings: Settings):
+    # One client per process (API lifespan / worker init), shared by all requests and threads.
+    # The connection pool must cover the concurrent uploads plus the multipart threads of each.
+    return boto3.session.Session().client(
+        's3',
+        region_name=settings.aws_region,
+        endpoint_url=settings.s3_endpoint_url,
+        aws_access_key_id=settings.aws_access_key_id,
+        aws_secret_access_key=settings.aws_secret_access_key,
+        config=Config(
+            max_pool_connections=settings.s3_max_pool_connections,
+            retries={"max_attempts": 5, "mode": "adaptive"}
+        )
+    )
+
+def create_transfer_config(settings: Settings) -> TransferConfig:
+    # Objects above the threshold are uploaded in parts / downloaded with concurrent ranged GETs
+    return TransferConfig(
+        multipart_threshold=settings.s3_multipart_threshold,
+        multipart_chunksize=settings.s3_multipart_chunksize,
+        max_concurrency=settings.s3_max_concurrency,
+        use_threads=True
+    )
+
+
 class S3UploadService:
     def __init__(self, settings: Settings):
         self.settings = settings
-        self.s3_client = boto3.client(
-            's3',
-            region_name=self.settings.aws_region,
-            aws_access_key_id=self.settings.aws_access_key_id,
-            aws_secret_access_key=self.settings.aws_secret_access_key
-        )
+        self.s3_client = globals.get_s3_client()
+        self.transfer_config = create_transfer_config(settings)
         self.logger = get_logger(__class__.__name__)
         
     def upload_file(self, tenant_id: str, file) -> UploadObject:
@@ -39,7 +65,8 @@ class S3UploadService:
                 file.file,
                 self.settings.policy_bucket_name,
                 key,
-                ExtraArgs={"ContentType": file.content_type}                
+                ExtraArgs={"ContentType": file.content_type},
+                Config=self.transfer_config
             )
             self.logger.info(f"File uploaded successfully to S3 with key: {key}")
         except (BotoCoreError, ClientError) as exc:
@@ -56,17 +83,33 @@ class S3UploadService:
         )
     
 
-    def stream_file(self, *, s3_key: str):
+    def download_to_tempfile(self, *, s3_key: str, spool_dir: Optional[str] = None):
+        """
+        Downloads the object to a temp file, large objects with concurrent ranged GETs.
+        Returns {'path', 'content_type', 'size'}. The caller is responsible for removing the file.
+        """
         s3_client = self.s3_client
+        fd, path = tempfile.mkstemp(prefix="ingest_", dir=spool_dir)
+        os.close(fd)
         try:
-            response = s3_client.get_object(
+            head = s3_client.head_object(
                 Bucket=self.settings.policy_bucket_name,
                 Key=s3_key
             )
-            return {
-                'body': response['Body'],
-                'content_type' : response['ContentType']
-            }
+            s3_client.download_file(
+                self.settings.policy_bucket_name,
+                s3_key,
+                path,
+                Config=self.transfer_config
+            )
         except (BotoCoreError, ClientError) as exc:
+            os.remove(path)
             raise RuntimeError(f"Failed to download file from S3 with err: {exc}")
-
+        except Exception:
+            os.remove(path)
+            raise
+        return {
+            'path': path,
+            'content_type': head['ContentType'],
+            'size': head['ContentLength']
+        }
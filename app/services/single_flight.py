@@ -0,0 +1,60 @@
+# Coalesces identical concurrent work within one API process.
+# The first caller for a key (the leader) starts the work as an independent task and every
+# caller arriving while it runs (followers) awaits that same task. The task is shielded, so a
+# disconnecting client cancels only its own wait, never the shared work. If the work fails,
+# followers retry once instead of inheriting the leader's error.
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+_single_flight_instance = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self.stats = {"leaders": 0, "followers": 0, "follower_retries": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], *, retry_on_error: bool = True) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            return await asyncio.shield(task)
+
+        self.stats["followers"] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Our own request was cancelled, or the shared task was (e.g. on shutdown)
+            if not task.cancelled() or not retry_on_error:
+                raise
+        except Exception as e:
+            if not retry_on_error:
+                raise
+            logger.warning(f"Coalesced call failed ({e}), retrying once")
+        # Joins a newer flight for the key if another follower already started one
+        self.stats["follower_retries"] += 1
+        return await self.do(key, fn, retry_on_error=False)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "in_flight": len(self._calls)}
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+
+def get_single_flight() -> SingleFlight:
+    global _single_flight_instance
+    if _single_flight_instance is None:
+        _single_flight_instance = SingleFlight()
+    return _single_flight_instance
@@ -0,0 +1,45 @@
+# Staging area in Redis for fanned-out documents (see ingest.FanOutWriter).
+# The task that parsed a large document stores its new chunks as fixed-size slices plus the
+# document's diff result (the "job"); each slice is embedded and stored by its own Celery
+# subtask and the chord callback completes the document from the job. Everything expires
+# after settings.fanout_slice_ttl_seconds, so abandoned jobs clean themselves up.
+import json
+from dataclasses import asdict
+from typing import Optional
+
+from app.core import globals
+from app.services.chunker import Chunk
+
+JOB_KEY = "ingest_job:{job_id}"
+SLICE_KEY = "ingest_job:{job_id}:slice:{index}"
+
+
+def put_slice(*, job_id: str, index: int, chunks: list[Chunk], ids: list[str], metadatas: list[dict], ttl_seconds: int):
+    payload = {
+        "chunks": [asdict(chunk) for chunk in chunks],
+        "ids": ids,
+        "metadatas": metadatas,
+    }
+    globals.get_sync_redis_client().set(SLICE_KEY.format(job_id=job_id, index=index), json.dumps(payload), ex=ttl_seconds)
+
+
+def get_slice(*, job_id: str, index: int) -> tuple[list[Chunk], list[str], list[dict]]:
+    raw = globals.get_sync_redis_client().get(SLICE_KEY.format(job_id=job_id, index=index))
+    if raw is None:
+        raise RuntimeError(f"Slice {index} of ingestion job {job_id} not found (expired or already completed)")
+    payload = json.loads(raw)
+    return [Chunk(**chunk) for chunk in payload["chunks"]], payload["ids"], payload["metadatas"]
+
+
+def put_job(*, job_id: str, job: dict, ttl_seconds: int):
+    globals.get_sync_redis_client().set(JOB_KEY.format(job_id=job_id), json.dumps(job), ex=ttl_seconds)
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    raw = globals.get_sync_redis_client().get(JOB_KEY.format(job_id=job_id))
+    return json.loads(raw) if raw is not None else None
+
+
+def delete_job(*, job_id: str, slices: int):
+    keys = [JOB_KEY.format(job_id=job_id)] + [SLICE_KEY.format(job_id=job_id, index=index) for index in range(slices)]
+    globals.get_sync_redis_client().delete(*keys)
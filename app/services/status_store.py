@@ -0,0 +1,97 @@
+# Ingestion status tracking in Redis, shared by the API (reads) and the Celery workers (writes)
+import json
+from typing import Optional
+
+from app.core import globals
+from app.core.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+BATCH_KEY = "ingest_batch:{batch_id}"
+BATCH_FILES_KEY = "ingest_batch:{batch_id}:files"
+STATUS_TTL_SECONDS = 7 * 24 * 3600
+
+
+def create_batch(*, batch_id: str, tenant_id: str, files: dict[str, dict]):
+    # files: {file_key: {"filename", "doc_id", "s3_key", "status", "detail"}}
+    client = globals.get_sync_redis_client()
+    pipe = client.pipeline(transaction=True)
+    pipe.hset(BATCH_KEY.format(batch_id=batch_id), mapping={"tenant_id": tenant_id, "status": "processing"})
+    if files:
+        pipe.hset(
+            BATCH_FILES_KEY.format(batch_id=batch_id),
+            mapping={file_key: json.dumps(info) for file_key, info in files.items()}
+        )
+    pipe.expire(BATCH_KEY.format(batch_id=batch_id), STATUS_TTL_SECONDS)
+    pipe.expire(BATCH_FILES_KEY.format(batch_id=batch_id), STATUS_TTL_SECONDS)
+    pipe.execute()
+
+
+def set_file_status(*, batch_id: str, file_key: str, status: str, detail: Optional[str] = None):
+    client = globals.get_sync_redis_client()
+    key = BATCH_FILES_KEY.format(batch_id=batch_id)
+    raw = client.hget(key, file_key)
+    info = json.loads(raw) if raw else {}
+    info.update({"status": status, "detail": detail})
+    client.hset(key, file_key, json.dumps(info))
+
+
+def set_batch_status(*, batch_id: str, status: str):
+    globals.get_sync_redis_client().hset(BATCH_KEY.format(batch_id=batch_id), "status", status)
+
+
+def get_batch(batch_id: str) -> Optional[dict]:
+    client = globals.get_sync_redis_client()
+    batch = client.hgetall(BATCH_KEY.format(batch_id=batch_id))
+    if not batch:
+        return None
+    files = client.hgetall(BATCH_FILES_KEY.format(batch_id=batch_id))
+    return {
+        "batch_id": batch_id,
+        "tenant_id": batch[b"tenant_id"].decode(),
+        "status": batch[b"status"].decode(),
+        "files": [json.loads(info) for _, info in sorted(files.items())],
+    }
+
+
+DOCUMENT_KEY = "ingest_document:{tenant_id}:{doc_id}"
+DOCUMENT_SLICES_KEY = "ingest_document:{tenant_id}:{doc_id}:slices_done"
+
+
+def set_document_status(*, tenant_id: str, doc_id: str, status: str, detail: Optional[str] = None, slices: Optional[int] = None):
+    client = globals.get_sync_redis_client()
+    key = DOCUMENT_KEY.format(tenant_id=tenant_id, doc_id=doc_id)
+    pipe = client.pipeline(transaction=True)
+    pipe.hset(key, mapping={"status": status, "detail": detail or ""})
+    if slices is not None:
+        # A new fan-out of the document, forget the progress of an earlier one
+        pipe.hset(key, "slices", slices)
+        pipe.delete(DOCUMENT_SLICES_KEY.format(tenant_id=tenant_id, doc_id=doc_id))
+    pipe.expire(key, STATUS_TTL_SECONDS)
+    pipe.execute()
+
+
+def mark_slice_done(*, tenant_id: str, doc_id: str, index: int):
+    # A set, so a retried slice is only counted once
+    key = DOCUMENT_SLICES_KEY.format(tenant_id=tenant_id, doc_id=doc_id)
+    client = globals.get_sync_redis_client()
+    pipe = client.pipeline(transaction=True)
+    pipe.sadd(key, index)
+    pipe.expire(key, STATUS_TTL_SECONDS)
+    pipe.execute()
+
+
+def get_document_status(*, tenant_id: str, doc_id: str) -> Optional[dict]:
+    client = globals.get_sync_redis_client()
+    document = client.hgetall(DOCUMENT_KEY.format(tenant_id=tenant_id, doc_id=doc_id))
+    if not document:
+        return None
+    slices = document.get(b"slices")
+    return {
+        "tenant_id": tenant_id,
+        "doc_id": doc_id,
+        "status": document[b"status"].decode(),
+        "detail": document.get(b"detail", b"").decode() or None,
+        "slices": int(slices) if slices is not None else None,
+        "slices_done": client.scard(DOCUMENT_SLICES_KEY.format(tenant_id=tenant_id, doc_id=doc_id)) if slices is not None else None,
+    }
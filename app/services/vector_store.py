@@ -1,8 +1,11 @@
+import re
+import hashlib
 import chromadb
 from app.core.config import Settings
 from app.core.logger_config import get_logger
 from app.services.chunker import Chunk
 from app.core.globals import get_chroma_client
+from app.services.index_registry import IndexSpec, get_active_index
 
 
 logger = get_logger(__name__)
@@ -10,13 +13,27 @@ logger = get_logger(__name__)
 _chroma_collection_cache = {}
 
 def _create_chroma_client(settings: Settings) -> chromadb.Client:
+    backend = settings.vector_store_backend
     try:
-        client = chromadb.CloudClient(
-            api_key=settings.chroma_api_key,
-            tenant=settings.chroma_tenant,
-            database=settings.chroma_database
-        )
-        logger.info("ChromaDB client created successfully")
+        if backend == "cloud":
+            client = chromadb.CloudClient(
+                api_key=settings.chroma_api_key,
+                tenant=settings.chroma_tenant,
+                database=settings.chroma_database
+            )
+        elif backend == "http":
+            client = chromadb.HttpClient(
+                host=settings.chroma_host,
+                port=settings.chroma_port
+            )
+        elif backend == "persistent":
+            # Embedded on-disk index, no network hop (and usable air-gapped / offline)
+            client = chromadb.PersistentClient(path=settings.chroma_persist_path)
+        elif backend == "memory":
+            client = chromadb.EphemeralClient()
+        else:
+            raise ValueError(f"Unsupported vector store backend: {backend}. Supported backends are: cloud, http, persistent, memory")
+        logger.info(f"ChromaDB client created successfully (backend: {backend})")
         return client
     except Exception as e:
         raise RuntimeError(f"Failed to create ChromaDB client: {e}")
@@ -40,43 +57,200 @@ def _get_collection(client: chromadb.Client, collection_name: str) -> chromadb.a
         _chroma_collection_cache[collection_name] = collection
         return collection
 
-def store_vectors(*, vectors: list[float], tenant_id: str, user_id: str, doc_id: str, s3_url: str, chunks: list[Chunk], s3_key: str, settings: Settings):
+# Chroma collection names: 3-63 chars of [a-zA-Z0-9._-], starting and ending alphanumeric
+_VALID_COLLECTION_NAME = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{1,61}[a-zA-Z0-9]$")
+
+def collection_name_for_tenant(tenant_id: str, settings: Settings, base: str | None = None) -> str:
+    """
+    Routes a tenant to its collection according to settings.collection_sharding:
+    "none" keeps everyone in the base collection, "tenant" gives every tenant its own
+    collection, "hash" gives dedicated_collection_tenants their own collection and spreads
+    the long tail over collection_shard_count hash buckets.
+    base defaults to the active index's collection (chromadb_collection_name unless re-indexed).
+    """
+    base = base or get_active_index(settings).collection
+    mode = settings.collection_sharding
+    if mode == "none":
+        return base
+    if mode == "tenant" or (mode == "hash" and tenant_id in settings.dedicated_collection_tenants):
+        name = f"{base}-t-{tenant_id}"
+        if not _VALID_COLLECTION_NAME.match(name) or ".." in name:
+            # Tenant ids that are not valid collection names get a stable digest instead
+            name = f"{base}-t-{hashlib.sha1(tenant_id.encode('utf-8')).hexdigest()[:16]}"
+        return name
+    if mode == "hash":
+        bucket = int(hashlib.md5(tenant_id.encode("utf-8")).hexdigest(), 16) % settings.collection_shard_count
+        return f"{base}-s{bucket:03d}"
+    raise ValueError(f"Unsupported collection sharding mode: {mode}. Supported modes are: none, tenant, hash")
+
+def get_tenant_collection(*, tenant_id: str, settings: Settings, index: IndexSpec | None = None) -> chromadb.api.models.Collection.Collection:
+    # Pass index when the vectors read or written must match an embedding made with it,
+    # the active index may switch in between (see index_registry)
     client = get_chroma_client()
-    collection = _get_collection(client, collection_name=settings.chromadb_collection_name)
+    base = index.collection if index is not None else None
+    return _get_collection(client, collection_name=collection_name_for_tenant(tenant_id, settings, base=base))
+
+# Max number of hashes per `$in` filter when looking up existing chunks
+_HASH_LOOKUP_BATCH_SIZE = 500
+
+def file_already_ingested(*, tenant_id: str, file_hash: str, settings: Settings) -> bool:
+    collection = get_tenant_collection(tenant_id=tenant_id, settings=settings)
+    try:
+        result = collection.get(
+            where={"$and": [{"tenant_id": tenant_id}, {"file_hash": file_hash}]},
+            limit=1,
+            include=[]
+        )
+    except Exception as e:
+        raise RuntimeError(f"Failed to look up file hash in ChromaDB: {e}")
+    return bool(result.get("ids"))
+
+def get_vectors_by_chunk_hash(*, tenant_id: str, chunk_hashes: list[str], settings: Settings, index: IndexSpec | None = None) -> dict[str, list[float]]:
+    # Returns {chunk_hash: embedding} for chunks of this tenant that were already embedded
+    collection = get_tenant_collection(tenant_id=tenant_id, settings=settings, index=index)
+    vectors = {}
+    try:
+        for i in range(0, len(chunk_hashes), _HASH_LOOKUP_BATCH_SIZE):
+            batch = chunk_hashes[i : i + _HASH_LOOKUP_BATCH_SIZE]
+            result = collection.get(
+                where={"$and": [{"tenant_id": tenant_id}, {"chunk_hash": {"$in": batch}}]},
+                include=["embeddings", "metadatas"]
+            )
+            for embedding, meta in zip(result.get("embeddings", []), result.get("metadatas", [])):
+                vectors[meta["chunk_hash"]] = [float(x) for x in embedding]
+    except Exception as e:
+        raise RuntimeError(f"Failed to look up chunk hashes in ChromaDB: {e}")
+    return vectors
+
+# Max number of records per metadata update / delete call
+_WRITE_BATCH_SIZE = 500
+
+def chunk_record_id(*, tenant_id: str, doc_id: str, chunk: Chunk) -> str:
+    return f"{tenant_id}_{doc_id}_{chunk.id}"
+
+def chunk_metadata(*, tenant_id: str, user_id: str, doc_id: str, s3_url: str, s3_key: str, chunk: Chunk, file_hash: str | None = None) -> dict:
+    # file_hash is only set once the whole document is stored (see ingest), "" until then
+    return {
+        "tenant_id": tenant_id,
+        "user_id": user_id,
+        "doc_id": doc_id,
+        "s3_url": s3_url,
+        "chunk_index": chunk.index,
+        "s3_key": s3_key,
+        "chunk_hash": chunk.content_hash,
+        "start_char": chunk.start,
+        "end_char": chunk.end,
+        "file_hash": file_hash or ""
+    }
+
+def get_document_metadatas(*, tenant_id: str, doc_id: str, settings: Settings) -> dict[str, dict]:
+    # Returns {record_id: metadata} for every stored chunk of a document (no embeddings)
+    collection = get_tenant_collection(tenant_id=tenant_id, settings=settings)
+    records = {}
+    offset = 0
+    try:
+        while True:
+            result = collection.get(
+                where={"$and": [{"tenant_id": tenant_id}, {"doc_id": doc_id}]},
+                include=["metadatas"],
+                limit=_WRITE_BATCH_SIZE,
+                offset=offset
+            )
+            ids = result.get("ids", [])
+            records.update(zip(ids, result.get("metadatas", [])))
+            if len(ids) < _WRITE_BATCH_SIZE:
+                break
+            offset += len(ids)
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch document records from ChromaDB: {e}")
+    return records
+
+def update_metadatas(*, tenant_id: str, ids: list[str], metadatas: list[dict], settings: Settings):
+    # Metadata-only update, the stored embeddings and documents are untouched
+    collection = get_tenant_collection(tenant_id=tenant_id, settings=settings)
+    try:
+        for i in range(0, len(ids), _WRITE_BATCH_SIZE):
+            collection.update(
+                ids=ids[i : i + _WRITE_BATCH_SIZE],
+                metadatas=metadatas[i : i + _WRITE_BATCH_SIZE]
+            )
+    except Exception as e:
+        raise RuntimeError(f"Failed to update metadata in ChromaDB: {e}")
+
+def store_vectors(*, vectors: list[float], tenant_id: str, user_id: str, doc_id: str, s3_url: str, chunks: list[Chunk], s3_key: str, settings: Settings, file_hash: str | None = None):
     ids = []
     metadatas = []
     documents = []
     try:
         for chunk in chunks:
-            id = f"{tenant_id}_{doc_id}_{chunk.id}"
+            id = chunk_record_id(tenant_id=tenant_id, doc_id=doc_id, chunk=chunk)
             ids.append(id)
-            metadatas.append({
-                "tenant_id": tenant_id,
-                "user_id": user_id,
-                "doc_id": doc_id,
-                "s3_url": s3_url,
-                "chunk_index": chunk.index,
-                "s3_key": s3_key
-            })
+            metadatas.append(chunk_metadata(
+                tenant_id=tenant_id,
+                user_id=user_id,
+                doc_id=doc_id,
+                s3_url=s3_url,
+                s3_key=s3_key,
+                chunk=chunk,
+                file_hash=file_hash
+            ))
             documents.append(chunk.text)
     except Exception as e:
         raise RuntimeError(f"Failed to prepare vectors for ChromaDB: {e}")
+    upsert_records(
+        tenant_id=tenant_id,
+        ids=ids,
+        embeddings=vectors,
+        metadatas=metadatas,
+        documents=documents,
+        settings=settings
+    )
+
+def upsert_records(*, tenant_id: str, ids: list[str], embeddings: list, metadatas: list[dict], documents: list[str], settings: Settings, index: IndexSpec | None = None):
+    collection = get_tenant_collection(tenant_id=tenant_id, settings=settings, index=index)
     try:
-        collection.add(
+        # upsert so a retried ingestion task can safely re-write the same chunks
+        collection.upsert(
             ids = ids,
-            embeddings = vectors,
+            embeddings = embeddings,
             metadatas = metadatas,
             documents = documents
         )
     except Exception as e:
         logger.info(f"Error details: {e}")
         raise RuntimeError(f"Failed to store vectors in ChromaDB: {e}")
-    logger.info(f"Stored {len(vectors)} vectors in ChromaDB")
-    
-
-
+    logger.info(f"Stored {len(ids)} vectors in ChromaDB")
 
+def query_vectors(*, tenant_id: str, query_embeddings: list, n_results: int, settings: Settings, index: IndexSpec | None = None) -> dict:
+    collection = get_tenant_collection(tenant_id=tenant_id, settings=settings, index=index)
+    try:
+        return collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where={"tenant_id": tenant_id}
+        )
+    except Exception as e:
+        raise RuntimeError(f"Failed to query ChromaDB: {e}")
 
-  
+def get_records(*, tenant_id: str, ids: list[str], settings: Settings) -> dict:
+    # Fetches documents and metadata for known record ids (e.g. lexical-only hits)
+    collection = get_tenant_collection(tenant_id=tenant_id, settings=settings)
+    try:
+        return collection.get(ids=ids, include=["documents", "metadatas"])
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch records from ChromaDB: {e}")
 
-    
\ No newline at end of file
+def delete_vectors(*, tenant_id: str, settings: Settings, doc_id: str | None = None, ids: list[str] | None = None):
+    # Deletes either every chunk of a document or an explicit list of record ids, in one call
+    collection = get_tenant_collection(tenant_id=tenant_id, settings=settings)
+    try:
+        if ids is not None:
+            for i in range(0, len(ids), _WRITE_BATCH_SIZE):
+                collection.delete(ids=ids[i : i + _WRITE_BATCH_SIZE])
+        elif doc_id is not None:
+            collection.delete(where={"$and": [{"tenant_id": tenant_id}, {"doc_id": doc_id}]})
+        else:
+            raise ValueError("Either doc_id or ids is required to delete vectors")
+    except Exception as e:
+        raise RuntimeError(f"Failed to delete vectors from ChromaDB: {e}")
+    logger.info(f"Deleted vectors for tenant_id: {tenant_id} (doc_id: {doc_id}, ids: {len(ids) if ids else 0})")
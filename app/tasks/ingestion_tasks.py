@@ -1,26 +1,133 @@
+from typing import Optional
+from celery import chord, group
 from app.worker import celery_app
-from app.services import ingest
+from app.services import ingest, rate_limiter, status_store
 from app.core.config import get_settings
 from celery.utils.log import get_task_logger
 
 logger = get_task_logger(__name__)
 
+def _set_document_status(*, tenant_id: str, doc_id: str, status: str, detail: Optional[str] = None, slices: Optional[int] = None):
+    # Status tracking must never fail the ingestion itself
+    try:
+        status_store.set_document_status(tenant_id=tenant_id, doc_id=doc_id, status=status, detail=detail, slices=slices)
+    except Exception as e:
+        logger.error(f"Failed to update status of document {doc_id}: {e}")
+
 @celery_app.task(bind=True, max_retries=3)
 def process_document_task(self, tenant_id: str, user_id: str, doc_id: str, s3_url: str, s3_key: str):
     logger.info(f"Processing document {doc_id} for tenant {tenant_id}")
+    _set_document_status(tenant_id=tenant_id, doc_id=doc_id, status="processing")
     try:
         settings = get_settings()
-        ingest.process_document_from_s3(
+        fanout = ingest.process_document_from_s3(
             tenant_id=tenant_id,
             user_id=user_id,
             doc_id=doc_id,
             s3_url=s3_url,
             s3_key=s3_key,
-            settings=settings
+            settings=settings,
+            # Last attempt: a failure removes what was already written of the new version
+            discard_on_failure=self.request.retries >= self.max_retries
         )
-        logger.info(f"Successfully processed document {doc_id}")
-        return {"status": "success", "doc_id": doc_id}
+        if fanout is not None:
+            # Large document: the staged slices are embedded and stored by any free worker
+            _set_document_status(tenant_id=tenant_id, doc_id=doc_id, status="processing", slices=fanout.slices)
+            header = group(
+                write_document_slice_task.s(tenant_id, doc_id, fanout.job_id, index)
+                for index in range(fanout.slices)
+            )
+            chord(header)(finalize_document_task.s(tenant_id, doc_id, fanout.job_id, fanout.slices))
+            logger.info(f"Fanned out {fanout.slices} slices of document {doc_id}")
+            return {"status": "fanned_out", "doc_id": doc_id, "slices": fanout.slices}
     except Exception as e:
         logger.error(f"Error processing document {doc_id}: {e}")
-        # Retry in 5s, 10s, 20s...
+        if self.request.retries >= self.max_retries:
+            _set_document_status(tenant_id=tenant_id, doc_id=doc_id, status="failed", detail=str(e))
+        # Retry in 5s, 10s, 20s... or when OpenAI's rate limit resets
+        raise self.retry(exc=e, countdown=rate_limiter.retry_countdown(e, retries=self.request.retries))
+
+    _set_document_status(tenant_id=tenant_id, doc_id=doc_id, status="completed")
+    logger.info(f"Successfully processed document {doc_id}")
+    return {"status": "success", "doc_id": doc_id}
+
+@celery_app.task(bind=True, max_retries=3)
+def write_document_slice_task(self, tenant_id: str, doc_id: str, job_id: str, index: int):
+    # Chord header member of a fanned-out document
+    try:
+        written = ingest.write_document_slice(tenant_id=tenant_id, job_id=job_id, index=index, settings=get_settings())
+    except Exception as e:
+        logger.error(f"Error storing slice {index} of document {doc_id}: {e}")
+        if self.request.retries >= self.max_retries:
+            # Returned instead of raised, so the chord callback still runs
+            return {"status": "failed", "index": index, "detail": str(e)}
+        raise self.retry(exc=e, countdown=rate_limiter.retry_countdown(e, retries=self.request.retries))
+    try:
+        status_store.mark_slice_done(tenant_id=tenant_id, doc_id=doc_id, index=index)
+    except Exception as e:
+        logger.error(f"Failed to record progress of document {doc_id}: {e}")
+    return {"status": "success", "index": index, "chunks": written}
+
+@celery_app.task(bind=True, max_retries=3)
+def finalize_document_task(self, results: list[dict], tenant_id: str, doc_id: str, job_id: str, slices: int):
+    # Chord callback, runs once every slice of the document was stored (or gave up)
+    fanout = ingest.FanOut(job_id=job_id, slices=slices)
+    failed = [result["index"] for result in results if result["status"] == "failed"]
+    if failed:
+        try:
+            ingest.discard_fanned_out_document(tenant_id=tenant_id, fanout=fanout, settings=get_settings())
+        except Exception as e:
+            logger.error(f"Failed to discard the stored slices of document {doc_id}: {e}")
+        detail = f"{len(failed)} of {slices} slices failed: {sorted(failed)}"
+        _set_document_status(tenant_id=tenant_id, doc_id=doc_id, status="failed", detail=detail)
+        logger.error(f"Document {doc_id} failed: {detail}")
+        return {"status": "failed", "doc_id": doc_id, "failed_slices": sorted(failed)}
+    try:
+        ingest.complete_fanned_out_document(tenant_id=tenant_id, fanout=fanout, settings=get_settings())
+    except Exception as e:
+        logger.error(f"Error completing document {doc_id}: {e}")
+        if self.request.retries >= self.max_retries:
+            _set_document_status(tenant_id=tenant_id, doc_id=doc_id, status="failed", detail=str(e))
         raise self.retry(exc=e, countdown=5 * (2 ** self.request.retries))
+    _set_document_status(tenant_id=tenant_id, doc_id=doc_id, status="completed")
+    logger.info(f"Successfully processed document {doc_id} ({slices} slices)")
+    return {"status": "success", "doc_id": doc_id, "slices": slices}
+
+@celery_app.task(bind=True, max_retries=3)
+def process_document_batch_task(self, batch_id: str, tenant_id: str, user_id: str, documents: list[dict]):
+    # One group member of a bulk upload: several documents sharing large batched writes
+    logger.info(f"Processing {len(documents)} documents of bulk batch {batch_id} for tenant {tenant_id}")
+
+    def on_status(document: dict, status: str, detail: Optional[str] = None):
+        try:
+            status_store.set_file_status(batch_id=batch_id, file_key=document["file_key"], status=status, detail=detail)
+        except Exception as e:
+            logger.error(f"Failed to update status of {document['file_key']} in bulk batch {batch_id}: {e}")
+
+    try:
+        settings = get_settings()
+        statuses = ingest.process_documents_from_s3(
+            tenant_id=tenant_id,
+            user_id=user_id,
+            documents=documents,
+            settings=settings,
+            on_status=on_status
+        )
+        return {"status": "success", "batch_id": batch_id, "documents": statuses}
+    except Exception as e:
+        logger.error(f"Error processing documents of bulk batch {batch_id}: {e}")
+        if self.request.retries >= self.max_retries:
+            for document in documents:
+                on_status(document, "failed", str(e))
+            return {"status": "failed", "batch_id": batch_id, "documents": {document["doc_id"]: "failed" for document in documents}}
+        raise self.retry(exc=e, countdown=rate_limiter.retry_countdown(e, retries=self.request.retries))
+
+@celery_app.task
+def finalize_bulk_batch_task(results: list[dict], batch_id: str):
+    # Chord callback, runs once every group member of the bulk upload has finished
+    statuses = [status for result in results for status in result["documents"].values()]
+    failed = sum(1 for status in statuses if status == "failed")
+    batch_status = "completed" if not failed else "completed_with_errors"
+    status_store.set_batch_status(batch_id=batch_id, status=batch_status)
+    logger.info(f"Bulk batch {batch_id} finished: {len(statuses)} documents, {failed} failed")
+    return {"status": batch_status, "batch_id": batch_id, "documents": len(statuses), "failed": failed}
@@ -18,22 +18,43 @@ celery_app.conf.update(
     enable_utc=True,
 )
 
-from celery.signals import worker_process_init
-from app.core import globals
-from app.services import vector_store
+from celery.signals import worker_process_init, worker_process_shutdown
+from app.core import event_loop, globals
+from app.services import vector_store, s3_upload
 from openai import AsyncOpenAI
 import asyncio
+import redis
 
 @worker_process_init.connect
 def init_worker(**kwargs):
     settings = get_settings()
     
+    # Long-lived event loop for the async parts of ingestion, the OpenAI client below is
+    # only ever used from this loop
+    if settings.worker_persistent_loop:
+        event_loop.start_worker_loop()
+
     # Initialize OpenAI (Global)
-    openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
+    openai_client = AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
     globals.set_openai_client(openai_client)
     
     # Initialize ChromaDB (Sync)
     chroma_client = vector_store._create_chroma_client(settings)
     globals.set_chroma_client(chroma_client)
+
+    # Initialize S3 (shared, pooled)
+    globals.set_s3_client(s3_upload.create_s3_client(settings))
+
+    # Initialize Redis (Sync) for cache invalidation and ingestion status
+    globals.set_sync_redis_client(redis.Redis.from_url(settings.redis_url))
     
     print("Worker initialized global clients.")
+
+@worker_process_shutdown.connect
+def shutdown_worker(**kwargs):
+    if event_loop.is_running():
+        try:
+            event_loop.run_coroutine(globals.get_openai_client().close(), timeout=5)
+        except Exception as e:
+            print(f"Failed to close OpenAI client: {e}")
+        event_loop.stop_worker_loop()
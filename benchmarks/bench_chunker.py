@@ -0,0 +1,52 @@
+# Chunker benchmark on multi-MB synthetic policy text.
+#
+# Usage:
+#   python -m benchmarks.bench_chunker [--sizes-mb 1 4 16] [--repeat 3] [--output results.json]
+import argparse
+import time
+import tracemalloc
+
+from app.services.chunker import RecursiveChunker
+from benchmarks.corpus import policy_document
+from benchmarks.stats import write_report
+
+
+def bench(size_mb: float, repeat: int, chunk_size: int, chunk_overlap: int) -> dict:
+    text = policy_document(int(size_mb * 1024 * 1024))
+    chunker = RecursiveChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        spans = chunker.split_spans(text)
+        timings.append(time.perf_counter() - started)
+
+    # Allocation of a full split_chunks run (chunk strings + Chunk objects included)
+    tracemalloc.start()
+    chunks = chunker.split_chunks(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        "size_mb": size_mb,
+        "chars": len(text),
+        "chunks": len(spans),
+        "best_seconds": best,
+        "mb_per_second": size_mb / best if best else None,
+        "split_chunks_peak_alloc_mb": peak / (1024 * 1024),
+        "avg_chunk_chars": sum(len(chunk.text) for chunk in chunks) / len(chunks) if chunks else 0,
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark RecursiveChunker")
+    arg_parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4, 16])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--chunk-size", type=int, default=1000)
+    arg_parser.add_argument("--chunk-overlap", type=int, default=200)
+    arg_parser.add_argument("--output", help="Write results as JSON to this file")
+    args = arg_parser.parse_args()
+
+    results = [bench(size, args.repeat, args.chunk_size, args.chunk_overlap) for size in args.sizes_mb]
+    write_report({"benchmark": "chunker", "results": results}, args.output)
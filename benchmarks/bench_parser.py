@@ -0,0 +1,78 @@
+# Parser benchmark: hashing and page-wise text extraction of synthetic
+# plain-text and RTF policies, plus any real PDFs passed with --pdf.
+#
+# Usage:
+#   python -m benchmarks.bench_parser [--sizes-mb 1 8] [--repeat 3] [--pdf a.pdf b.pdf] [--pdf-workers 4] [--output results.json]
+import argparse
+import os
+import time
+
+from app.services import parser
+from benchmarks.corpus import policy_document, write_temp_file
+from benchmarks.stats import write_report
+
+
+def _best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def _rtf(text: str) -> bytes:
+    body = text.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}").replace("\n", "\\par\n")
+    return ("{\\rtf1\\ansi\\deff0 {\\fonttbl {\\f0 Times;}}\\f0 " + body + "}").encode("utf-8")
+
+
+def _bench_file(path: str, content_type: str, repeat: int, **page_options) -> dict:
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    pages = []
+
+    def _extract():
+        pages[:] = list(parser.iter_pages(path=path, filename=path, content_type=content_type, **page_options))
+
+    extract_seconds = _best_of(repeat, _extract)
+    hash_seconds = _best_of(repeat, lambda: parser.file_sha256(path))
+    return {
+        "content_type": content_type,
+        "size_mb": round(size_mb, 3),
+        "pieces": len(pages),
+        "chars": sum(len(page) for page in pages),
+        "extract_best_seconds": extract_seconds,
+        "extract_mb_per_second": size_mb / extract_seconds if extract_seconds else None,
+        "sha256_mb_per_second": size_mb / hash_seconds if hash_seconds else None,
+        **page_options,
+    }
+
+
+def bench_synthetic(size_mb: float, repeat: int) -> list[dict]:
+    text = policy_document(int(size_mb * 1024 * 1024))
+    results = []
+    for content_type, data in (("text/plain", text.encode("utf-8")), ("application/rtf", _rtf(text))):
+        path = write_temp_file(data)
+        try:
+            results.append(_bench_file(path, content_type, repeat))
+        finally:
+            os.remove(path)
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark document parsing")
+    arg_parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 8])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--pdf", nargs="*", default=[], help="PDF files to benchmark (not synthesized)")
+    arg_parser.add_argument("--pdf-workers", type=int, default=1)
+    arg_parser.add_argument("--pdf-pages-per-task", type=int, default=25)
+    arg_parser.add_argument("--output", help="Write results as JSON to this file")
+    args = arg_parser.parse_args()
+
+    results = [result for size in args.sizes_mb for result in bench_synthetic(size, args.repeat)]
+    for pdf_path in args.pdf:
+        results.append({
+            "file": os.path.basename(pdf_path),
+            **_bench_file(pdf_path, "application/pdf", args.repeat, pdf_workers=args.pdf_workers, pdf_pages_per_task=args.pdf_pages_per_task),
+        })
+    write_report({"benchmark": "parser", "results": results}, args.output)
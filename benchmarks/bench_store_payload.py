@@ -0,0 +1,77 @@
+# Benchmark of the CPU side of storing vectors: chunking a synthetic document into
+# content-addressed chunks and building the ids / metadatas / documents payload that
+# store_vectors sends to Chroma. No Chroma or OpenAI calls are made.
+#
+# Usage:
+#   python -m benchmarks.bench_store_payload [--sizes-mb 1 8] [--dimensions 1536] [--repeat 3] [--output results.json]
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.services import ingest, vector_store
+from benchmarks.corpus import policy_pages
+from benchmarks.stats import write_report
+
+
+def build_payload(chunks, vectors) -> dict:
+    # Mirrors store_vectors / ChunkWriter.add for one document
+    ids = []
+    metadatas = []
+    for chunk in chunks:
+        ids.append(vector_store.chunk_record_id(tenant_id="bench-tenant", doc_id="bench-doc", chunk=chunk))
+        metadatas.append(vector_store.chunk_metadata(
+            tenant_id="bench-tenant",
+            user_id="bench-user",
+            doc_id="bench-doc",
+            s3_url="https://bench-policies.s3.us-east-1.amazonaws.com/bench-tenant/bench.txt",
+            s3_key="bench-tenant/bench.txt",
+            chunk=chunk
+        ))
+    return {"ids": ids, "embeddings": vectors, "metadatas": metadatas, "documents": [chunk.text for chunk in chunks]}
+
+
+def bench(size_mb: float, dimensions: int, batch_size: int, repeat: int) -> dict:
+    pages = policy_pages(max(1, int(size_mb * 1024 * 1024 / 3000)))
+
+    chunk_timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = [chunk for batch in ingest.iter_chunk_batches(pages=pages, batch_size=batch_size) for chunk in batch]
+        chunk_timings.append(time.perf_counter() - started)
+
+    vectors = np.random.default_rng(0).standard_normal((len(chunks), dimensions)).astype(np.float32).tolist()
+    payload_timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        payload = build_payload(chunks, vectors)
+        payload_timings.append(time.perf_counter() - started)
+
+    # Rough size of the request body an HTTP Chroma client sends
+    started = time.perf_counter()
+    body = json.dumps(payload)
+    serialize_seconds = time.perf_counter() - started
+    return {
+        "size_mb": size_mb,
+        "chunks": len(chunks),
+        "dimensions": dimensions,
+        "chunk_and_hash_seconds": min(chunk_timings),
+        "payload_seconds": min(payload_timings),
+        "payload_us_per_chunk": min(payload_timings) / len(chunks) * 1e6 if chunks else None,
+        "json_serialize_seconds": serialize_seconds,
+        "json_body_mb": len(body) / (1024 * 1024),
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark store_vectors payload preparation")
+    arg_parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 8])
+    arg_parser.add_argument("--dimensions", type=int, default=1536)
+    arg_parser.add_argument("--batch-size", type=int, default=256)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--output", help="Write results as JSON to this file")
+    args = arg_parser.parse_args()
+
+    results = [bench(size, args.dimensions, args.batch_size, args.repeat) for size in args.sizes_mb]
+    write_report({"benchmark": "store_payload", "results": results}, args.output)
@@ -0,0 +1,51 @@
+# Deterministic synthetic policy corpus used by the benchmarks
+import os
+import random
+import tempfile
+
+_TERMS = [
+    "employee", "manager", "leave", "annual", "sick", "parental", "policy", "clause", "benefit",
+    "reimbursement", "travel", "expense", "approval", "compliance", "retention", "security",
+    "confidential", "contractor", "probation", "notice", "period", "overtime", "remote", "office",
+    "must", "shall", "may", "within", "days", "calendar", "working", "request", "submit", "form",
+]
+
+
+def policy_sentence(rng: random.Random) -> str:
+    words = [rng.choice(_TERMS) for _ in range(rng.randint(8, 28))]
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f"{rng.randint(1, 12)}.{rng.randint(1, 9)}.{rng.randint(1, 9)}")
+    if rng.random() < 0.1:
+        words.insert(rng.randrange(len(words)), f"HR-{rng.randint(100, 999)}")
+    return " ".join(words).capitalize() + "."
+
+
+def policy_document(size_chars: int, seed: int = 0) -> str:
+    """Builds roughly size_chars of section / paragraph structured policy text."""
+    rng = random.Random(seed)
+    sections = []
+    total = 0
+    section = 1
+    while total < size_chars:
+        paragraphs = [
+            " ".join(policy_sentence(rng) for _ in range(rng.randint(2, 8)))
+            for _ in range(rng.randint(2, 6))
+        ]
+        body = f"Section {section}. {rng.choice(_TERMS).title()} policy\n" + "\n\n".join(paragraphs)
+        sections.append(body)
+        total += len(body) + 2
+        section += 1
+    return "\n\n".join(sections)[:size_chars]
+
+
+def policy_pages(num_pages: int, page_chars: int = 3000, seed: int = 0) -> list[str]:
+    text = policy_document(num_pages * page_chars, seed=seed)
+    return [text[i : i + page_chars] for i in range(0, len(text), page_chars)]
+
+
+def write_temp_file(data: bytes) -> str:
+    # Stands in for a document downloaded by ingestion, the caller removes the file
+    fd, path = tempfile.mkstemp(prefix="bench_")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
@@ -0,0 +1,131 @@
+# Local stand-in for the OpenAI API, for load tests that must not spend real tokens.
+# Embeddings are deterministic (seeded from the sha256 of the input) and unit length, so
+# identical texts get identical vectors and retrieval behaves consistently across runs.
+# Chat completions return a canned answer, streamed token by token when stream=true.
+#
+# Usage:
+#   python -m benchmarks.fake_openai [--port 8100] [--latency-ms 50] [--token-latency-ms 5]
+# then point the app at it with OPENAI_BASE_URL=http://localhost:8100/v1
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from typing import Optional, Union
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+ANSWER = (
+    "According to the policy context, employees must submit the request form within the "
+    "stated number of working days and obtain manager approval before the leave starts."
+)
+
+# Set from the command line
+LATENCY_SECONDS = 0.0
+TOKEN_LATENCY_SECONDS = 0.0
+
+
+class EmbeddingRequest(BaseModel):
+    input: Union[str, list[str]]
+    model: str
+    dimensions: Optional[int] = None
+    encoding_format: Optional[str] = None
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str
+    messages: list[dict]
+    stream: bool = False
+    temperature: Optional[float] = None
+
+
+def fake_embedding(text: str, dimensions: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _usage(prompt_tokens: int, completion_tokens: int = 0) -> dict:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+app = FastAPI(title="Fake OpenAI")
+
+
+@app.post("/v1/embeddings")
+async def create_embeddings(request: EmbeddingRequest):
+    texts = [request.input] if isinstance(request.input, str) else request.input
+    dimensions = request.dimensions or DEFAULT_EMBEDDING_DIMENSIONS
+    await asyncio.sleep(LATENCY_SECONDS)
+    return {
+        "object": "list",
+        "model": request.model,
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimensions)}
+            for i, text in enumerate(texts)
+        ],
+        "usage": _usage(sum(len(text) // 4 + 1 for text in texts)),
+    }
+
+
+@app.post("/v1/chat/completions")
+async def create_chat_completion(request: ChatCompletionRequest):
+    completion_id = f"chatcmpl-{hashlib.sha1(str(time.time_ns()).encode()).hexdigest()[:24]}"
+    created = int(time.time())
+    prompt_tokens = sum(len(str(message.get("content", ""))) // 4 + 1 for message in request.messages)
+    tokens = [f"{word} " for word in ANSWER.split(" ")]
+    await asyncio.sleep(LATENCY_SECONDS)
+
+    if not request.stream:
+        await asyncio.sleep(TOKEN_LATENCY_SECONDS * len(tokens))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": request.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+            "usage": _usage(prompt_tokens, len(tokens)),
+        }
+
+    async def _events():
+        def _chunk(delta: dict, finish_reason: Optional[str] = None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        yield _chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            await asyncio.sleep(TOKEN_LATENCY_SECONDS)
+            yield _chunk({"content": token})
+        yield _chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(_events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    arg_parser = argparse.ArgumentParser(description="Fake OpenAI API for benchmarks")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8100)
+    arg_parser.add_argument("--latency-ms", type=float, default=50.0, help="Added to every request")
+    arg_parser.add_argument("--token-latency-ms", type=float, default=5.0, help="Per generated token")
+    args = arg_parser.parse_args()
+
+    LATENCY_SECONDS = args.latency_ms / 1000
+    TOKEN_LATENCY_SECONDS = args.token_latency_ms / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
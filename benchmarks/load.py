@@ -0,0 +1,134 @@
+# HTTP load driver for a running API (see benchmarks/run_stack.py for the local stack).
+# Sends a fixed number of requests at a fixed concurrency and reports latency percentiles
+# and throughput as JSON.
+#
+# Usage:
+#   python -m benchmarks.load --scenario ask --concurrency 32 --requests 2000 [--output ask.json]
+#   python -m benchmarks.load --scenario ask_stream --concurrency 32 --requests 500
+#   python -m benchmarks.load --scenario upload --concurrency 8 --requests 200 --doc-kb 64
+import argparse
+import asyncio
+import random
+import time
+from itertools import count
+
+import httpx
+
+from benchmarks.corpus import policy_document, policy_sentence
+from benchmarks.stats import summarize, write_report
+
+SCENARIOS = ("ask", "ask_stream", "upload")
+
+
+def make_questions(num_questions: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [f"What does the policy say about this: {policy_sentence(rng)}" for _ in range(num_questions)]
+
+
+async def _ask(client: httpx.AsyncClient, args, questions: list[str], i: int) -> dict:
+    response = await client.post("/chat/ask", json={
+        "tenant_id": args.tenant_id,
+        "user_id": args.user_id,
+        "question": questions[i % len(questions)],
+    })
+    response.raise_for_status()
+    return {}
+
+
+async def _ask_stream(client: httpx.AsyncClient, args, questions: list[str], i: int) -> dict:
+    # Also measures time to the first streamed token
+    started = time.perf_counter()
+    first_token = None
+    async with client.stream("POST", "/chat/ask/stream", json={
+        "tenant_id": args.tenant_id,
+        "user_id": args.user_id,
+        "question": questions[i % len(questions)],
+    }) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_token is None and line.startswith("event: token"):
+                first_token = time.perf_counter() - started
+            if line.startswith("event: error"):
+                raise RuntimeError("stream returned an error event")
+    return {"first_token": first_token}
+
+
+async def _upload(client: httpx.AsyncClient, args, documents: list[bytes], i: int) -> dict:
+    response = await client.post(
+        "/uploads/files",
+        params={"tenant_id": args.tenant_id, "user_id": args.user_id},
+        files={"file": (f"policy_{i}.txt", documents[i % len(documents)], "text/plain")},
+    )
+    response.raise_for_status()
+    return {}
+
+
+async def run(args) -> dict:
+    if args.scenario == "upload":
+        # Distinct seeds so every upload is new content (no hash dedup)
+        payload = [policy_document(args.doc_kb * 1024, seed=seed).encode("utf-8") for seed in range(args.requests + args.warmup)]
+        send = _upload
+    else:
+        payload = make_questions(args.unique_questions, args.seed)
+        send = _ask_stream if args.scenario == "ask_stream" else _ask
+
+    latencies = []
+    first_tokens = []
+    errors = 0
+    error_samples = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        for i in range(args.warmup):
+            await send(client, args, payload, args.requests + i)
+
+        counter = count()
+
+        async def _worker():
+            nonlocal errors
+            while (i := next(counter)) < args.requests:
+                started = time.perf_counter()
+                try:
+                    extra = await send(client, args, payload, i)
+                except Exception as e:
+                    errors += 1
+                    if len(error_samples) < 5:
+                        error_samples.append(repr(e))
+                    continue
+                latencies.append(time.perf_counter() - started)
+                if extra.get("first_token") is not None:
+                    first_tokens.append(extra["first_token"])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(_worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    report = {
+        "benchmark": f"load_{args.scenario}",
+        "concurrency": args.concurrency,
+        **summarize(latencies, elapsed=elapsed, errors=errors),
+    }
+    if first_tokens:
+        first_token_summary = summarize(first_tokens, elapsed=elapsed)
+        report["first_token"] = {key: first_token_summary[key] for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")}
+    if error_samples:
+        report["error_samples"] = error_samples
+    return report
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Load test the PolicyChatbot API")
+    arg_parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    arg_parser.add_argument("--scenario", choices=SCENARIOS, default="ask")
+    arg_parser.add_argument("--concurrency", type=int, default=16)
+    arg_parser.add_argument("--requests", type=int, default=500)
+    arg_parser.add_argument("--warmup", type=int, default=10)
+    arg_parser.add_argument("--tenant-id", default="bench-tenant")
+    arg_parser.add_argument("--user-id", default="bench-user")
+    arg_parser.add_argument("--unique-questions", type=int, default=200, help="Lower values raise the cache hit rate")
+    arg_parser.add_argument("--doc-kb", type=int, default=64, help="Size of each uploaded document")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--timeout", type=float, default=60.0)
+    arg_parser.add_argument("--output", help="Write results as JSON to this file")
+    args = arg_parser.parse_args()
+
+    write_report(asyncio.run(run(args)), args.output)
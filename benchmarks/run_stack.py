@@ -0,0 +1,176 @@
+# Boots the API and a Celery worker against local stand-ins and optionally runs load
+# scenarios against it, so throughput / latency can be measured without OpenAI, Chroma
+# Cloud or S3:
+#   OpenAI  -> benchmarks.fake_openai (deterministic embeddings, configurable latency)
+#   Chroma  -> local `chroma run` server (VECTOR_STORE_BACKEND=http)
+#   S3      -> moto server (pip install "moto[server]")
+#   Redis   -> REDIS_URL, or a local redis-server with --start-redis
+# The FlashRank re-ranking model is downloaded on first use, run once with network access.
+#
+# Usage:
+#   python -m benchmarks.run_stack --scenarios upload ask ask_stream --concurrency 16 --requests 500 --output stack.json
+#   python -m benchmarks.run_stack --keep-running   # then drive it with benchmarks.load
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+
+import boto3
+import httpx
+
+from benchmarks.stats import write_report
+
+BUCKET_NAME = "bench-policies"
+
+
+def _wait_for(url: str, *, timeout: float, name: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{name} did not come up at {url} within {timeout}s")
+
+
+def _start(stack: ExitStack, name: str, command: list[str], *, env: dict, log_dir: str) -> subprocess.Popen:
+    log = open(os.path.join(log_dir, f"{name}.log"), "w")
+    stack.callback(log.close)
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+    def _stop():
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+
+    stack.callback(_stop)
+    print(f"Started {name} (pid {process.pid}), logs in {log.name}", file=sys.stderr)
+    return process
+
+
+def stack_env(args, work_dir: str) -> dict:
+    return {
+        **os.environ,
+        "PORT_NO": str(args.api_port),
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_MODEL_NAME": "gpt-4o-mini",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_REGION": "us-east-1",
+        "POLICY_BUCKET_NAME": BUCKET_NAME,
+        "S3_ENDPOINT_URL": f"http://127.0.0.1:{args.s3_port}",
+        "VECTOR_STORE_BACKEND": "http",
+        "CHROMA_HOST": "127.0.0.1",
+        "CHROMA_PORT": str(args.chroma_port),
+        "REDIS_URL": args.redis_url,
+        "LEXICAL_INDEX_DIR": os.path.join(work_dir, "lexical_index"),
+    }
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="policy_bench_")
+    log_dir = os.path.join(work_dir, "logs")
+    os.makedirs(log_dir)
+    env = stack_env(args, work_dir)
+    python = sys.executable
+
+    with ExitStack() as stack:
+        if not args.keep_work_dir:
+            stack.callback(shutil.rmtree, work_dir, True)
+        if args.start_redis:
+            port = args.redis_url.rsplit(":", 1)[-1].split("/")[0]
+            _start(stack, "redis", ["redis-server", "--port", port, "--save", "", "--appendonly", "no"], env=env, log_dir=log_dir)
+
+        _start(stack, "fake_openai", [
+            python, "-m", "benchmarks.fake_openai",
+            "--port", str(args.openai_port),
+            "--latency-ms", str(args.openai_latency_ms),
+            "--token-latency-ms", str(args.openai_token_latency_ms),
+        ], env=env, log_dir=log_dir)
+        _start(stack, "s3", [python, "-m", "moto.server", "-H", "127.0.0.1", "-p", str(args.s3_port)], env=env, log_dir=log_dir)
+        _start(stack, "chroma", [
+            "chroma", "run", "--path", os.path.join(work_dir, "chroma"), "--host", "127.0.0.1", "--port", str(args.chroma_port)
+        ], env=env, log_dir=log_dir)
+
+        _wait_for(f"http://127.0.0.1:{args.openai_port}/docs", timeout=30, name="fake OpenAI")
+        _wait_for(f"http://127.0.0.1:{args.s3_port}/", timeout=30, name="moto S3")
+        _wait_for(f"http://127.0.0.1:{args.chroma_port}/api/v2/heartbeat", timeout=60, name="Chroma")
+        boto3.client(
+            "s3",
+            region_name="us-east-1",
+            endpoint_url=env["S3_ENDPOINT_URL"],
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",
+        ).create_bucket(Bucket=BUCKET_NAME)
+
+        _start(stack, "api", [
+            python, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(args.api_port),
+            "--workers", str(args.api_workers), "--log-level", "warning",
+        ], env=env, log_dir=log_dir)
+        _start(stack, "worker", [
+            "celery", "-A", "app.worker.celery_app", "worker",
+            "--concurrency", str(args.worker_concurrency), "--loglevel", "warning",
+        ], env=env, log_dir=log_dir)
+        _wait_for(f"http://127.0.0.1:{args.api_port}/", timeout=60, name="API")
+
+        if args.keep_running:
+            print(f"Stack is up at http://127.0.0.1:{args.api_port} (work dir {work_dir}), Ctrl+C to stop", file=sys.stderr)
+            try:
+                signal.pause()
+            except KeyboardInterrupt:
+                return
+
+        results = []
+        for scenario in args.scenarios:
+            command = [
+                python, "-m", "benchmarks.load",
+                "--base-url", f"http://127.0.0.1:{args.api_port}",
+                "--scenario", scenario,
+                "--concurrency", str(args.concurrency),
+                "--requests", str(args.requests),
+            ]
+            output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output))
+            if scenario == "upload" and args.ingest_wait_seconds:
+                # Let the worker drain the ingestion queue so the chat scenarios hit a populated index
+                time.sleep(args.ingest_wait_seconds)
+
+        write_report(
+            {"benchmark": "stack", "config": {k: v for k, v in vars(args).items() if k != "output"}, "results": results},
+            args.output
+        )
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run the API + worker against local stand-ins and load test it")
+    arg_parser.add_argument("--scenarios", nargs="*", default=["upload", "ask", "ask_stream"])
+    arg_parser.add_argument("--concurrency", type=int, default=16)
+    arg_parser.add_argument("--requests", type=int, default=500)
+    arg_parser.add_argument("--api-port", type=int, default=8000)
+    arg_parser.add_argument("--api-workers", type=int, default=1)
+    arg_parser.add_argument("--worker-concurrency", type=int, default=2)
+    arg_parser.add_argument("--openai-port", type=int, default=8100)
+    arg_parser.add_argument("--openai-latency-ms", type=float, default=50.0)
+    arg_parser.add_argument("--openai-token-latency-ms", type=float, default=5.0)
+    arg_parser.add_argument("--s3-port", type=int, default=8200)
+    arg_parser.add_argument("--chroma-port", type=int, default=8300)
+    arg_parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/0")
+    arg_parser.add_argument("--start-redis", action="store_true", help="Start a local redis-server on the REDIS_URL port")
+    arg_parser.add_argument("--ingest-wait-seconds", type=float, default=30.0)
+    arg_parser.add_argument("--keep-running", action="store_true")
+    arg_parser.add_argument("--keep-work-dir", action="store_true")
+    arg_parser.add_argument("--output", help="Write results as JSON to this file")
+    main(arg_parser.parse_args())
@@ -0,0 +1,39 @@
+# Latency summaries shared by the benchmark scripts
+import json
+import math
+from typing import Optional
+
+
+def percentile(sorted_values: list[float], q: float) -> Optional[float]:
+    # Nearest-rank percentile on already sorted values
+    if not sorted_values:
+        return None
+    rank = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies: list[float], *, elapsed: float, errors: int = 0) -> dict:
+    """Latencies in seconds -> count, throughput and p50/p95/p99/max in milliseconds."""
+    values = sorted(latencies)
+
+    def _ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 3) if elapsed else None,
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(values[-1] if values else None),
+    }
+
+
+def write_report(report: dict, output: Optional[str]):
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+    print(text)
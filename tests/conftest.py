@@ -0,0 +1,13 @@
+import os
+
+# app/__init__ builds the FastAPI app, which reads the settings on import
+for name, value in {
+    "PORT_NO": "8000",
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "AWS_REGION": "us-east-1",
+    "POLICY_BUCKET_NAME": "test",
+    "OPENAI_API_KEY": "test",
+    "OPENAI_MODEL_NAME": "gpt-4o-mini",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,14 @@
+from app.core.config import Settings
+from app.services import lexical_index
+
+
+def test_superseded_records_do_not_make_scores_negative(tmp_path):
+    settings = Settings(lexical_index_dir=str(tmp_path), lexical_max_segments=100)
+    # A re-ingested / retried document leaves superseded postings in older segments
+    for _ in range(4):
+        lexical_index.add_documents(tenant_id="t", records=[("a", "clause 7.3 travel allowance")], settings=settings)
+    lexical_index.add_documents(tenant_id="t", records=[("b", "annual leave policy")], settings=settings)
+
+    results = lexical_index.search(tenant_id="t", query="travel allowance", top_k=5, settings=settings)
+    assert [record_id for record_id, _ in results] == ["a"]
+    assert results[0][1] > 0
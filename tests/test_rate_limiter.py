@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from app.core import globals
+from app.core.config import Settings
+from app.services import rate_limiter
+
+
+def _settings(**overrides) -> Settings:
+    return Settings(**overrides)
+
+
+def _client() -> AsyncOpenAI:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={"x-ratelimit-limit-requests": "500", "x-ratelimit-limit-tokens": "200000"},
+            json={
+                "object": "list",
+                "data": [{"object": "embedding", "index": 0, "embedding": [0.1, 0.2, 0.3]}],
+                "model": "text-embedding-3-small",
+                "usage": {"prompt_tokens": 2, "total_tokens": 2},
+            },
+        )
+
+    return AsyncOpenAI(api_key="test", base_url="http://openai.test/v1", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_call_openai_returns_parsed_response(enabled):
+    # Without a Redis client the limiter lets the call through uncounted
+    globals._sync_redis_client = None
+    rate_limiter._rate_limiter_instances.clear()
+    client = _client()
+
+    async def run():
+        try:
+            return await rate_limiter.call_openai(
+                client.embeddings.with_raw_response.create,
+                settings=_settings(rate_limit_enabled=enabled),
+                priority=rate_limiter.INTERACTIVE,
+                tokens=2,
+                model="text-embedding-3-small",
+                input=["hello"],
+            )
+        finally:
+            await client.close()
+
+    response = asyncio.run(run())
+    assert response.data[0].embedding == [0.1, 0.2, 0.3]
+    assert response.usage.total_tokens == 2